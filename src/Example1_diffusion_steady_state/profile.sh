@@ -9,5 +9,7 @@ for b0 in "${batch_list[@]}"
 do
   cp octagon-32x32-cnn.ini tmp.ini
   sed -i "s/256/$b0/g" tmp.ini
+  # reuse the loaded and shuffled data of the first run
+  sed -i "s|^\[NN\]|[NN]\nPreprocessCacheDir = restart/data-cache|" tmp.ini
   python3 main.py tmp.ini 
 done
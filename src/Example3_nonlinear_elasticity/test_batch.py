@@ -1,6 +1,6 @@
 import sys
 sys.path.append('../')
-from pde_utility import plot_PDE_solutions, plot_fields, split_data, expand_dataset, exe_cmd, BatchData, plot_one_field_hist, plot_one_field_stat, plot_one_field,plot_PDE_solutions_new
+from pde_utility import plot_PDE_solutions, plot_fields, split_data, expand_dataset, exe_cmd, plot_one_field_hist, plot_one_field_stat, plot_one_field,plot_PDE_solutions_new
 import tensorflow as tf
 import numpy as np
 
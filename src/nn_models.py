@@ -26,6 +26,7 @@ def _build_one_layer(layer_dict, kl_divergence_function=None):
 
         - BatchNormalization
         - Conv2D
+        - Conv3D
         - Convolution2DFlipout
         - Convolution2DReparameterization
         - Dense
@@ -34,9 +35,11 @@ def _build_one_layer(layer_dict, kl_divergence_function=None):
         - Flatten
         - GaussianNoise
         - MaxPooling2D
+        - MaxPooling3D
         - PDERandom
         - Reshape
         - UpSampling2D
+        - UpSampling3D
         - PDEZero
 
     """
@@ -95,6 +98,22 @@ def _build_one_layer(layer_dict, kl_divergence_function=None):
                 padding=layer_dict['padding'],
                 strides=layer_dict['strides'],
                 )
+    elif layer_dict['type'] == 'Conv3D' :
+        return tfkl.Conv3D(
+                filters=layer_dict['filters'], 
+                kernel_size=layer_dict['kernel_size'], 
+                activation=layer_dict['activation'], 
+                padding=layer_dict['padding'],
+                )
+    elif layer_dict['type'] == 'MaxPooling3D' :
+        if 'padding' not in layer_dict: layer_dict['padding'] = 'valid'
+        if 'strides' not in layer_dict: layer_dict['strides'] = None
+
+        return tfkl.MaxPooling3D(
+                pool_size=layer_dict['pool_size'], 
+                padding=layer_dict['padding'],
+                strides=layer_dict['strides'],
+                )
     elif layer_dict['type'] == 'BatchNormalization' :
         return tfkl.BatchNormalization()
     elif layer_dict['type'] == 'GaussianNoise' :
@@ -146,6 +165,8 @@ def _build_one_layer(layer_dict, kl_divergence_function=None):
             return tfkl.Reshape(target_shape=layer_dict['target_shape'])
     elif layer_dict['type'] == 'UpSampling2D' :
         return tfkl.UpSampling2D(size=layer_dict['size'])
+    elif layer_dict['type'] == 'UpSampling3D' :
+        return tfkl.UpSampling3D(size=layer_dict['size'])
     elif layer_dict['type'] == 'PDERandom' :
         return pde_layers.LayerFillRandomNumber(name='input')
     elif layer_dict['type'] == 'PDEZero' :
@@ -290,7 +311,8 @@ class BNN_user_weak_pde_general(tf.keras.Model):
         x = self.all_layers[0](inputs)
         for hl in self.all_layers[1:]:
             x = hl(x)
-        return tf.concat([x, inputs], 3)
+        # channels last, for 2D and 3D images
+        return tf.concat([x, inputs], -1)
 
 class BNN_user_weak_pde_general_heter(tf.keras.Model):
     """ 
@@ -0,0 +1,682 @@
+"""
+Micro-benchmarks of the pde_layers kernels, checked against the previous implementations or against the dense float64 
+references of this file (IntTranBxGraduReference, NeumannResidualReference, NodalAssemblyReference).
+
+usage:
+    python pde_benchmark.py element_gather --sizes 32 64 256 --batch 32
+    python pde_benchmark.py gauss_points
+    python pde_benchmark.py neumann
+    python pde_benchmark.py assembly
+    python pde_benchmark.py stencil
+    python pde_benchmark.py gauss_rules
+    python pde_benchmark.py hex --sizes 16 32 --batch 4
+    python pde_benchmark.py small_matrix
+    python pde_benchmark.py identity --sizes 64 --batch 512
+    python pde_benchmark.py models
+    python pde_benchmark.py strain_energy
+    python pde_benchmark.py material_fields
+"""
+import sys
+import time
+import resource
+import argparse
+import multiprocessing
+
+import numpy as np
+import tensorflow as tf
+
+import pde_layers as pde_layers
+
+
+def time_function(fun, *args, repeat=20, warmup=3):
+    """
+    run a tf.function several times and return the mean wall time per call in ms
+    """
+    for _ in range(warmup):
+        out = fun(*args)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        out = fun(*args)
+    tf.nest.map_structure(lambda x: x.numpy(), out)
+    return (time.perf_counter() - t0) / repeat * 1.0e3
+
+
+def GetElementInfoConv2DPerDof(input, dof):
+    """
+    previous LayerBulkResidual.GetElementInfo(): one conv2d per node and dof with the one-hot 2x2 kernels n1, n2, n3, n4
+    """
+    kernels = [np.array(k).reshape(2, 2, 1, 1) for k in ([[1, 0], [0, 0]], [[0, 1], [0, 0]], [[0, 0], [1, 0]], [[0, 0], [0, 1]])]
+    data = []
+    for n_kernel in kernels:
+        for i in range(0, dof):
+            data.append(tf.nn.conv2d(input[:,:,:,i:i+1], n_kernel, [1,1,1,1], 'SAME'))
+    return tf.concat(data, 3)
+
+
+def benchmark_element_gather(sizes=[32, 64, 256], batch=32, dofs=[1, 2], repeat=20):
+    """
+    nodal to element reorganization: per dof conv2d (previous) vs. one conv2d with the stacked selector (GetElementInfo)
+    """
+    print('{:>6} {:>4} {:>6} {:>14} {:>14} {:>8}'.format('size', 'dof', 'batch', 'per-dof [ms]', 'fused [ms]', 'speedup'))
+    for dof in dofs:
+        layer = pde_layers.LayerBulkResidual()
+        layer.dh, layer.dof = 1.0, dof
+        layer.initialize_arrays()
+        previous = tf.function(lambda x: GetElementInfoConv2DPerDof(x, dof))
+        fused = tf.function(layer.GetElementInfo)
+        for size in sizes:
+            input = tf.random.uniform([batch, size, size, dof])
+            if not np.array_equal(previous(input).numpy(), fused(input).numpy()):
+                raise ValueError('GetElementInfo() is different from the previous implementation for size = ', size, ' dof = ', dof)
+            t_previous = time_function(previous, input, repeat=repeat)
+            t_fused = time_function(fused, input, repeat=repeat)
+            print('{:>6} {:>4} {:>6} {:>14.3f} {:>14.3f} {:>8.2f}'.format(size, dof, batch, t_previous, t_fused, t_previous / t_fused))
+
+
+def IntTranBxGraduReference(data, dh, dof, GPs=4):
+    """
+    dense reference of int (B^T P) dV with P = gradu (float64): the element matrix K = sum_q jxw_q B_q B_q^T of 
+    Build2DGaussPointInfo() times the nodal values of the elements
+
+    args:
+        data (numpy array): [batch, elem_height, elem_width, 4*dof], see LayerBulkResidual.GetElementInfo()
+    """
+    _, B, jxw = pde_layers.Build2DGaussPointInfo(dh=dh, GPs=GPs, dof=dof)
+    K = np.einsum('q,qnx,qmx->nm', np.float64(jxw), np.float64(B), np.float64(B))
+    return np.einsum('...n,nm->...m', np.float64(data), K)
+
+
+def NeumannResidualReference(features, dh, dof, two_channels=False):
+    """
+    dense reference of ComputeNeumannBoundaryResidualNodalData() (two_channels=False) and 
+    ComputeNeumannBoundaryResidualNodalDataNew() (two_channels=True) in float64: each vertical (horizontal) edge with both 
+    nodes on the Neumann BCs adds the edge mass matrix L/6 [[2, 1], [1, 2]] times the unscaled h = 2 t - 1 of its nodes, 
+    with the edge length L = dy (dx)
+
+    args:
+        features (numpy array): [batch, node_height, node_width, 2*dof] or [..., 3*dof] with two_channels
+    """
+    features = np.float64(features)
+    dx, dy = pde_layers.GetElementSize(dh)
+    t_x = features[..., dof:2*dof]
+    t_y = features[..., 2*dof:3*dof] if two_channels else t_x
+    R = np.zeros(t_x.shape)
+    for t, L, first, second in [(t_x, dy, np.s_[:, :-1, :], np.s_[:, 1:, :]), (t_y, dx, np.s_[:, :, :-1], np.s_[:, :, 1:])]:
+        on_bc = (t[first] > 0.0) & (t[second] > 0.0)
+        h1, h2 = np.where(on_bc, 2.0 * t[first] - 1.0, 0.0), np.where(on_bc, 2.0 * t[second] - 1.0, 0.0)
+        R[first] += L / 6.0 * (2.0 * h1 + h2)
+        R[second] += L / 6.0 * (h1 + 2.0 * h2)
+    return R
+
+
+def NodalAssemblyReference(data, residual_mask, dof):
+    """
+    dense reference of GetNodalInfoFromElementInfo() in float64: node n of the element (i, j) adds its masked value to 
+    the node (i, j), (i, j+1), (i+1, j) or (i+1, j+1), values outside of the node grid are dropped
+    """
+    data = np.float64(data) * np.float64(residual_mask)
+    batch, height, width, _ = data.shape
+    R = np.zeros([batch, height + 1, width + 1, dof])
+    for n, (r, c) in enumerate([(0, 0), (0, 1), (1, 0), (1, 1)]):
+        R[:, r:r+height, c:c+width] += data[..., n*dof:(n+1)*dof]
+    return R[:, 0:height, 0:width]
+
+
+def benchmark_gauss_points(sizes=[32, 64, 256], batch=32, dofs=[1, 2], repeat=20):
+    """
+    gradu at the GPs and int (B^T P) dV with P = gradu by one einsum over all GPs (ComputeGraduAtAllGPs, 
+    ComputeIntTranBxPAtAllGPs), checked against the dense element matrix of IntTranBxGraduReference()
+    """
+    print('{:>6} {:>4} {:>6} {:>12} {:>14}'.format('size', 'dof', 'batch', 'rel. error', 'all-GP [ms]'))
+    for dof in dofs:
+        for size in sizes:
+            layer = pde_layers.LayerBulkResidual()
+            layer.dh, layer.dof = 1.0 / (size - 1), dof
+            layer.initialize_arrays()
+            domain_shape = [size, size]
+
+            def all_gp(data):
+                gradu = layer.ComputeGraduAtAllGPs(data)
+                return layer.ComputeIntTranBxPAtAllGPs(gradu, domain_shape)
+
+            all_gp = tf.function(all_gp)
+            data = tf.random.uniform([batch, size, size, 4*dof])
+            R, R_ref = all_gp(data).numpy(), IntTranBxGraduReference(data.numpy(), layer.dh, dof)
+            rel_error = np.abs(R - R_ref).max() / np.abs(R_ref).max()
+            if rel_error > 1.0e-5:
+                raise ValueError('all-GP residual is different from the dense reference for size = ', size, ' dof = ', dof, ' rel. error = ', rel_error)
+            t_all_gp = time_function(all_gp, data, repeat=repeat)
+            print('{:>6} {:>4} {:>6} {:>12.2e} {:>14.3f}'.format(size, dof, batch, rel_error, t_all_gp))
+
+
+def count_ops(fun, *args):
+    """ number of ops in the graph of a tf.function """
+    return len(fun.get_concrete_function(*args).graph.get_operations())
+
+
+def random_bc_features(batch, size, dof, neumann_channels, seed=0):
+    """
+    random features [Dirichlet (dof), Neumann (neumann_channels)] with the conventions of the data: Dirichlet BCs >= 0 
+    or -2 (domain), Neumann BCs in (0, 1], 0 (no BC) or -1 (margin), and long Neumann edges along the left and top boundary
+    """
+    rng = np.random.default_rng(seed)
+    dirichlet = np.where(rng.random((batch, size, size, dof)) < 0.2, rng.random((batch, size, size, dof)), -2.0)
+    neumann = np.where(rng.random((batch, size, size, neumann_channels)) < 0.5, 0.0, -1.0)
+    neumann = np.where(rng.random((batch, size, size, neumann_channels)) < 0.3, rng.random((batch, size, size, neumann_channels)), neumann)
+    neumann[:, :, 0] = np.where(rng.random((batch, size, neumann_channels)) < 0.8, rng.random((batch, size, neumann_channels)), 0.0)
+    neumann[:, 0, :] = np.where(rng.random((batch, size, neumann_channels)) < 0.8, rng.random((batch, size, neumann_channels)), 0.0)
+    return tf.constant(np.concatenate([dirichlet, neumann], axis=3), tf.float32)
+
+
+def benchmark_neumann(sizes=[32, 64, 256], batch=32, repeat=20):
+    """
+    Neumann residual: vectorized kernels (all dofs at once) checked against the dense edge assembly of 
+    NeumannResidualReference(). The error is relative to the max. residual.
+    """
+    cases = [('one channel', 1, 1), ('one channel', 2, 2), ('one channel', 3, 3), ('one channel', 4, 4), ('two channels', 1, 2)]
+    print('{:>13} {:>6} {:>4} {:>6} {:>6} {:>12} {:>10}'.format('kernel', 'size', 'dof', 'batch', 'ops', 'rel. error', 'time [ms]'))
+    for size in sizes:
+        dh = 1.0 / (size - 1)
+        for kernel, dof, neumann_channels in cases:
+            if kernel == 'one channel':
+                new = tf.function(lambda x: pde_layers.ComputeNeumannBoundaryResidualNodalData(x, dh=dh, dof=dof))
+            else:
+                new = tf.function(lambda x: pde_layers.ComputeNeumannBoundaryResidualNodalDataNew(x, dh=dh, dof=dof))
+            features = random_bc_features(batch, size, dof, neumann_channels)
+            R, R_ref = new(features).numpy(), NeumannResidualReference(features.numpy(), dh, dof, two_channels=(kernel == 'two channels'))
+            rel_error = np.abs(R - R_ref).max() / np.abs(R_ref).max()
+            if rel_error > 1.0e-5:
+                raise ValueError(kernel + ' Neumann residual is different from the dense reference for size = ', size, ' dof = ', dof, 
+                                 ' rel. error = ', rel_error)
+            t_new = time_function(new, features, repeat=repeat)
+            print('{:>13} {:>6} {:>4} {:>6} {:>6} {:>12.2e} {:>10.3f}'.format(
+                kernel, size, dof, batch, count_ops(new, features), rel_error, t_new))
+
+
+def benchmark_assembly(sizes=[32, 64, 256], batch=32, dofs=[1, 2, 3], repeat=20):
+    """
+    element to nodal assembly: one conv2d_transpose with the selector kernel (GetNodalInfoFromElementInfo) checked 
+    against the dense scatter-add of NodalAssemblyReference()
+    """
+    print('{:>6} {:>4} {:>6} {:>6} {:>12} {:>10}'.format('size', 'dof', 'batch', 'ops', 'max. error', 'time [ms]'))
+    for size in sizes:
+        for dof in dofs:
+            new = tf.function(lambda x, m: pde_layers.GetNodalInfoFromElementInfo(x, m, dof=dof))
+            features = random_bc_features(batch, size, dof, dof)
+            mask = pde_layers.GetElementResidualMask(pde_layers.LayerFillRandomNumber()(features[:,:,:,0:dof]))
+            data = tf.random.uniform([batch, size, size, 4*dof], minval=-1.0, maxval=1.0)
+            R, R_ref = new(data, mask).numpy(), NodalAssemblyReference(data.numpy(), mask.numpy(), dof)
+            max_error = np.abs(R - R_ref).max()
+            if max_error > 1.0e-6:
+                raise ValueError('nodal assembly is different from the dense reference for size = ', size, ' dof = ', dof, 
+                                 ' max. error = ', max_error)
+            t_new = time_function(new, data, mask, repeat=repeat)
+            print('{:>6} {:>4} {:>6} {:>6} {:>12.2e} {:>10.3f}'.format(size, dof, batch, count_ops(new, data, mask), max_error, t_new))
+
+
+def benchmark_stencil(sizes=[32, 64, 256], batch=32, repeat=20):
+    """
+    nodal residual of the linear problems: element path (gather, GPs, constitutive relation, B^T integration) vs. the 
+    matrix-free element operator of the stencil mode, both assembled with the element residual mask. Without masked 
+    elements, the 3x3 nodal stencil (GetNodalStencilKernel) has to give the same residual as well.
+    """
+    from pde_system_diffusion_steady_state import LayerDiffusionSteadyStateBulkResidual
+    from pde_system_elasticity_linear import LayerLinearElasticityBulkResidual
+
+    print('{:>18} {:>6} {:>6} {:>14} {:>14} {:>8} {:>12}'.format('problem', 'size', 'batch', 'element [ms]', 'stencil [ms]', 'speedup', 'rel. diff'))
+    for size in sizes:
+        dh = 1.0 / (size - 1)
+        cases = [('diffusion', 1, lambda stencil: LayerDiffusionSteadyStateBulkResidual(dh=dh, D0=1.0, stencil=stencil)),
+                 ('linear elasticity', 2, lambda stencil: LayerLinearElasticityBulkResidual(dh=dh, E0=25, nu0=0.3, stencil=stencil))]
+        for problem, dof, layer in cases:
+            element_layer, stencil_layer = layer(False), layer(True)
+            element = tf.function(lambda u, m: pde_layers.GetNodalInfoFromElementInfo(element_layer(u), m, dof=dof))
+            stencil = tf.function(lambda u, m: pde_layers.GetNodalInfoFromElementInfo(stencil_layer(u), m, dof=dof))
+            features = random_bc_features(batch, size, dof, dof)
+            mask = pde_layers.GetElementResidualMask(pde_layers.LayerFillRandomNumber()(features[:,:,:,0:dof]))
+            u = tf.random.uniform([batch, size, size, dof])
+            R_element, R_stencil = element(u, mask).numpy(), stencil(u, mask).numpy()
+            rel_diff = np.abs(R_element - R_stencil).max() / np.abs(R_element).max()
+            if rel_diff > 1.0e-5:
+                raise ValueError(problem + ' stencil residual is different from the element residual for size = ', size, ' rel. diff = ', rel_diff)
+
+            # interior nodes without masked elements: 3x3 stencil
+            R_nodal = tf.nn.conv2d(u, stencil_layer.GetNodalStencilKernel(), [1,1,1,1], 'SAME').numpy()
+            R_full = stencil(u, tf.ones_like(mask)).numpy()
+            if not np.allclose(R_nodal[:, 1:-1, 1:-1], R_full[:, 1:-1, 1:-1], rtol=1.0e-4, atol=1.0e-5 * np.abs(R_full).max()):
+                raise ValueError(problem + ' 3x3 stencil is different from the assembled element operator for size = ', size)
+
+            t_element = time_function(element, u, mask, repeat=repeat)
+            t_stencil = time_function(stencil, u, mask, repeat=repeat)
+            print('{:>18} {:>6} {:>6} {:>14.3f} {:>14.3f} {:>8.2f} {:>12.2e}'.format(
+                problem, size, batch, t_element, t_stencil, t_element / t_stencil, rel_diff))
+
+
+def benchmark_gauss_rules(sizes=[32, 64, 256], batch=32, repeat=20):
+    """
+    cost of the bulk residual (element path and assembly) per GP rule: 1 (reduced integration), 4 (2x2), 9 (3x3). 
+    The difference to the 3x3 rule is relative to the max. residual of the 3x3 rule.
+    """
+    from pde_system_diffusion_steady_state import LayerDiffusionSteadyStateBulkResidual
+    from pde_system_elasticity_linear import LayerLinearElasticityBulkResidual
+    from pde_system_elasticity_nonlinear import LayerNonLinearElasticityBulkResidual
+
+    print('{:>20} {:>6} {:>6} {:>4} {:>14} {:>16}'.format('problem', 'size', 'batch', 'GPs', 'residual [ms]', 'diff. to 3x3'))
+    for size in sizes:
+        dh = 1.0 / (size - 1)
+        cases = [('diffusion', 1, lambda GPs: LayerDiffusionSteadyStateBulkResidual(dh=dh, D0=1.0, GPs=GPs)),
+                 ('linear elasticity', 2, lambda GPs: LayerLinearElasticityBulkResidual(dh=dh, E0=25, nu0=0.3, GPs=GPs)),
+                 ('nonlinear elasticity', 2, lambda GPs: LayerNonLinearElasticityBulkResidual(dh=dh, E0=25, nu0=0.3, GPs=GPs))]
+        for problem, dof, layer in cases:
+            features = random_bc_features(batch, size, dof, dof)
+            mask = pde_layers.GetElementResidualMask(pde_layers.LayerFillRandomNumber()(features[:,:,:,0:dof]))
+            # small smooth deformation around the scaled zero (0.5), so that detF stays in the valid range
+            x = np.linspace(0.0, 1.0, size)
+            u = 0.5 + 0.02 * np.sin(np.pi * x)[None, :, None, None] * np.cos(np.pi * x)[None, None, :, None] * np.ones([batch, 1, 1, dof])
+            u = tf.constant(u + 0.001 * np.random.default_rng(0).random([batch, size, size, dof]), tf.float32)
+
+            R_ref = None
+            for GPs in [9, 4, 1]:
+                residual_layer = layer(GPs)
+                residual = tf.function(lambda u, m: pde_layers.GetNodalInfoFromElementInfo(residual_layer(u), m, dof=dof))
+                R = residual(u, mask).numpy()
+                if R_ref is None:
+                    R_ref = R
+                t = time_function(residual, u, mask, repeat=repeat)
+                print('{:>20} {:>6} {:>6} {:>4} {:>14.3f} {:>16.2e}'.format(
+                    problem, size, batch, GPs, t, np.abs(R - R_ref).max() / np.abs(R_ref).max()))
+
+
+def benchmark_hex(sizes=[16, 32, 48], batch=4, repeat=20):
+    """
+    3D hexahedral elements: cost of the bulk residual (element path and assembly) with the 2x2x2 GP rule, the stencil mode 
+    and the Neumann face residual per image size (nodes per direction), see LayerBulkResidual3D. The stencil difference 
+    is relative to the max. residual of the element path.
+    """
+    from pde_system_diffusion_steady_state import LayerDiffusionSteadyStateBulkResidual3D
+    from pde_system_elasticity_linear import LayerLinearElasticityBulkResidual3D
+
+    print('{:>18} {:>6} {:>6} {:>14} {:>14} {:>14} {:>12}'.format('problem', 'size', 'batch', 'element [ms]', 'stencil [ms]', 'neumann [ms]', 'rel. diff'))
+    for size in sizes:
+        dh = 1.0 / (size - 1)
+        cases = [('diffusion', 1, lambda stencil: LayerDiffusionSteadyStateBulkResidual3D(dh=dh, D0=1.0, stencil=stencil)),
+                 ('linear elasticity', 3, lambda stencil: LayerLinearElasticityBulkResidual3D(dh=dh, E0=25, nu0=0.3, stencil=stencil))]
+        for problem, dof, layer in cases:
+            rng = np.random.default_rng(0)
+            features = np.full([batch, size, size, size, 4*dof], -2.0, dtype=np.float32)
+            features[..., dof:] = 0.0
+            features[:, :, :, 0, 0:dof] = 0.5
+            features[:, 0, :, :, 3*dof:4*dof] = rng.uniform(0.1, 1.0, [batch, size, size, dof])
+            features = tf.constant(features)
+            mask = pde_layers.GetElementResidualMask3D(pde_layers.LayerFillRandomNumber()(features[..., 0:dof]))
+            u = tf.constant(rng.random([batch, size, size, size, dof]), tf.float32)
+
+            element_layer, stencil_layer = layer(False), layer(True)
+            element = tf.function(lambda u, m: pde_layers.GetNodalInfoFromElementInfo3D(element_layer(u), m, dof=dof))
+            stencil = tf.function(lambda u, m: pde_layers.GetNodalInfoFromElementInfo3D(stencil_layer(u), m, dof=dof))
+            neumann = tf.function(lambda f: pde_layers.ComputeNeumannBoundaryResidualNodalDataNew3D(f, dh=dh, dof=dof))
+            R_element = element(u, mask).numpy()
+            rel_diff = np.abs(stencil(u, mask).numpy() - R_element).max() / np.abs(R_element).max()
+
+            t_element = time_function(element, u, mask, repeat=repeat)
+            t_stencil = time_function(stencil, u, mask, repeat=repeat)
+            t_neumann = time_function(neumann, features, repeat=repeat)
+            print('{:>18} {:>6} {:>6} {:>14.3f} {:>14.3f} {:>14.3f} {:>12.2e}'.format(
+                problem, size, batch, t_element, t_stencil, t_neumann, rel_diff))
+
+
+def NonLinearConstitutiveRelationLinalg(self, F2x2, I2x2, fields=None):
+    """
+    previous LayerNonLinearElasticityBulkResidual.ConstitutiveRelation(): detF with tf.linalg.det() and F^-T with 
+    tf.linalg.inv() and tf.transpose(). The material fields (E0, nu0) replace the Lame parameters of the layer.
+    """
+    from pde_constitutive_models import E_nu_to_lambda_mu
+    lambda0, mu0 = self.lambda0, self.mu0
+    if fields:
+        p = self.model.Parameters(fields, rank=2)
+        lambda0, mu0 = E_nu_to_lambda_mu(E=p['E0'], nu=p['nu0'])
+    detF = tf.expand_dims(tf.expand_dims(tf.linalg.det(F2x2), 4), 5)
+    detF_mask_finite = tf.where(tf.math.is_finite(detF), tf.fill(tf.shape(detF), 1.0), tf.fill(tf.shape(detF), 0.0))
+    detF_mask_negative = tf.where(detF < 0.1, tf.fill(tf.shape(detF), 0.0), tf.fill(tf.shape(detF), 1.0))
+    detF_mask_large = tf.where(detF > 5.0, tf.fill(tf.shape(detF), 0.0), tf.fill(tf.shape(detF), 1.0))
+    detF_mask = detF_mask_negative * detF_mask_large * detF_mask_finite
+    detF_mask_reverse = tf.where( detF_mask == 0, tf.fill(tf.shape(detF_mask), 1.0), tf.fill(tf.shape(detF_mask), 0.0))
+    F2x2_modified = tf.multiply(F2x2, detF_mask) + tf.multiply(I2x2, detF_mask_reverse)
+    detF = tf.expand_dims(tf.expand_dims(tf.linalg.det(F2x2_modified), 4), 5)
+    TransInvF = tf.transpose(tf.linalg.inv(F2x2_modified), perm=[0,1,2,3,5,4])
+    P = lambda0 * (tf.math.multiply(detF,detF) - detF) * TransInvF + mu0 * ( F2x2_modified - TransInvF)
+    return tf.multiply(P, detF_mask)
+
+
+def benchmark_small_matrix(sizes=[32, 64, 256], batch=32, repeat=20):
+    """
+    closed-form 2x2 and 3x3 kernels of LayerBulkResidual (SmallMatrixDet, SmallMatrixInvTranspose) vs. tf.linalg.det() 
+    and tf.linalg.inv(): gradient check of the kernels (float64, tf.test.compute_gradient), then values, gradients 
+    d(sum R^2)/du and cost of the non-linear elasticity residual with both constitutive relations. The accuracy of P is 
+    checked against float64.
+    """
+    from pde_system_elasticity_nonlinear import LayerNonLinearElasticityBulkResidual
+
+    class LayerNonLinearElasticityBulkResidualLinalg(LayerNonLinearElasticityBulkResidual):
+        ConstitutiveRelation = NonLinearConstitutiveRelationLinalg
+
+    kernels = pde_layers.LayerBulkResidual()
+    rng = np.random.default_rng(0)
+    print('{:>10} {:>4} {:>20} {:>20}'.format('kernel', 'n', 'rel. grad. error', 'diff. to tf.linalg'))
+    for n in [2, 3]:
+        A = tf.constant(np.eye(n) + 0.3 * rng.uniform(-1.0, 1.0, [2, 3, 3, n, n]), tf.float64)
+        for name, fun, fun_linalg in [('det', kernels.SmallMatrixDet, tf.linalg.det),
+                                      ('inv', kernels.SmallMatrixInv, tf.linalg.inv),
+                                      ('inv^T', kernels.SmallMatrixInvTranspose, lambda A: tf.linalg.matrix_transpose(tf.linalg.inv(A)))]:
+            # finite difference check of the closed-form gradient, and the gradient of tf.linalg as the reference
+            theoretical, numerical = tf.test.compute_gradient(fun, [A])
+            theoretical_linalg, _ = tf.test.compute_gradient(fun_linalg, [A])
+            grad_error = np.abs(theoretical[0] - numerical[0]).max() / np.abs(theoretical[0]).max()
+            value_diff = max(np.abs(fun(A).numpy() - fun_linalg(A).numpy()).max(), np.abs(theoretical[0] - theoretical_linalg[0]).max())
+            if grad_error > 1.0e-5 or value_diff > 1.0e-10:
+                raise ValueError('closed-form ' + name + ' is wrong for n = ', n, ' grad. error = ', grad_error, ' diff. = ', value_diff)
+            print('{:>10} {:>4} {:>20.2e} {:>20.2e}'.format(name, n, grad_error, value_diff))
+
+    print('{:>20} {:>6} {:>6} {:>14} {:>14} {:>8} {:>12} {:>12}'.format('kernel', 'size', 'batch', 'tf.linalg [ms]', 'closed [ms]', 'speedup', 'rel. diff', 'grad. diff'))
+    for size in sizes:
+        dh = 1.0 / (size - 1)
+        F = tf.constant(np.eye(2) + 0.1 * rng.uniform(-1.0, 1.0, [batch, size - 1, size - 1, 4, 2, 2]), tf.float32)
+        det_linalg = tf.function(lambda A: (tf.linalg.det(A), tf.linalg.matrix_transpose(tf.linalg.inv(A))))
+        det_closed = tf.function(lambda A: (kernels.SmallMatrixDet(A), kernels.SmallMatrixInvTranspose(A)))
+        rel_diff = max(np.abs(a.numpy() - b.numpy()).max() / np.abs(a.numpy()).max() for a, b in zip(det_linalg(F), det_closed(F)))
+        t_linalg = time_function(det_linalg, F, repeat=repeat)
+        t_closed = time_function(det_closed, F, repeat=repeat)
+        print('{:>20} {:>6} {:>6} {:>14.3f} {:>14.3f} {:>8.2f} {:>12.2e} {:>12}'.format(
+            'det, inv^T', size, batch, t_linalg, t_closed, t_linalg / t_closed, rel_diff, '-'))
+
+        # small smooth deformation around the scaled zero (0.5), so that detF stays in the valid range
+        x = np.linspace(0.0, 1.0, size)
+        u = 0.5 + 0.02 * np.sin(np.pi * x)[None, :, None, None] * np.cos(np.pi * x)[None, None, :, None] * np.ones([batch, 1, 1, 2])
+        u = tf.constant(u + 0.001 * rng.random([batch, size, size, 2]), tf.float32)
+        results = []
+        for layer in [LayerNonLinearElasticityBulkResidualLinalg(dh=dh, E0=25, nu0=0.3), LayerNonLinearElasticityBulkResidual(dh=dh, E0=25, nu0=0.3)]:
+            def residual_and_gradient(u, layer=layer):
+                with tf.GradientTape() as tape:
+                    tape.watch(u)
+                    R = layer(u)
+                    loss = tf.reduce_sum(R * R)
+                return R, tape.gradient(loss, u)
+            residual_and_gradient = tf.function(residual_and_gradient)
+            R, dloss = residual_and_gradient(u)
+            results.append((R.numpy(), dloss.numpy(), time_function(residual_and_gradient, u, repeat=repeat)))
+        (R_linalg, g_linalg, t_linalg), (R_closed, g_closed, t_closed) = results
+        rel_diff = np.abs(R_linalg - R_closed).max() / np.abs(R_linalg).max()
+        grad_diff = np.abs(g_linalg - g_closed).max() / np.abs(g_linalg).max()
+        # the residual is a sum of large terms that cancel, i.e. its float32 round-off is larger than the one of P. Both
+        # constitutive relations are checked against P in float64 instead.
+        layer = LayerNonLinearElasticityBulkResidual(dh=dh, E0=25, nu0=0.3)
+        F64 = F.numpy().astype(np.float64)
+        J, InvF = np.linalg.det(F64)[..., None, None], np.linalg.inv(F64)
+        P_ref = layer.lambda0 * (J * J - J) * np.swapaxes(InvF, -1, -2) + layer.mu0 * (F64 - np.swapaxes(InvF, -1, -2))
+        I2x2 = tf.eye(2, batch_shape=F.shape[0:4])
+        error_linalg = np.abs(NonLinearConstitutiveRelationLinalg(layer, F, I2x2).numpy() - P_ref).max() / np.abs(P_ref).max()
+        error_closed = np.abs(layer.ConstitutiveRelation(F, I2x2).numpy() - P_ref).max() / np.abs(P_ref).max()
+        if error_closed > 2.0 * error_linalg + 1.0e-6:
+            raise ValueError('closed-form P is less accurate than the tf.linalg one for size = ', size, error_closed, error_linalg)
+        print('{:>20} {:>6} {:>6} {:>14.3f} {:>14.3f} {:>8.2f} {:>12.2e} {:>12.2e}'.format(
+            'R_bulk + gradient', size, batch, t_linalg, t_closed, t_linalg / t_closed, rel_diff, grad_diff))
+
+
+def Get2ndOrderIdentityTensorMaterialized(self, gradu1, domain_shape):
+    """
+    previous LayerBulkResidual.Get2ndOrderIdentityTensor(): I_4[-1, 4] and I_2x2[-1, :, :, GPs, 2, 2] allocated per element and GP
+    """
+    I = np.array([1.0000001,0.0,0.0,0.99999999])
+    I = tf.constant(I, tf.float32)
+    I = tf.expand_dims(I,0)
+    ones = tf.ones_like(gradu1)
+    I4 = tf.multiply(ones, I)
+
+    I2x2_1 = tf.reshape(I4, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
+    I2x2 = tf.concat([I2x2_1] * self.GPs, 3) # all GPs are the same.
+
+    return I4, I2x2
+
+
+class MaterializedIdentityMixin:
+    """
+    bulk residual layers with the identity tensors of Get2ndOrderIdentityTensorMaterialized() from the gradient field
+    """
+    def GetFAtAllGPs(self, gradu, I4, domain_shape):
+        I4, self.I2x2_materialized = Get2ndOrderIdentityTensorMaterialized(self, gradu[:,0,:], domain_shape)
+        return super().GetFAtAllGPs(gradu, I4, domain_shape)
+
+    def GetEpsilonAtAllGPs(self, gradu, domain_shape):
+        _, self.I2x2_materialized = Get2ndOrderIdentityTensorMaterialized(self, gradu[:,0,:], domain_shape)
+        return super().GetEpsilonAtAllGPs(gradu, domain_shape)
+
+    def ConstitutiveRelation(self, A, I2x2, fields=None):
+        return super().ConstitutiveRelation(A, self.I2x2_materialized, fields)
+
+
+def identity_step_memory(problem, materialized, size, batch, repeat, queue):
+    """
+    peak memory [MB] and time [ms] of the residual part of a training step (R_bulk, sum R^2 and its gradient w.r.t. the 
+    NN output) in a new process. Peak is the allocator peak on a GPU, the increase of the max. RSS of the process on a CPU.
+    """
+    from pde_system_elasticity_linear import LayerLinearElasticityBulkResidual
+    from pde_system_elasticity_nonlinear import LayerNonLinearElasticityBulkResidual
+
+    dh = 1.0 / (size - 1)
+    layer_class = {'linear elasticity': LayerLinearElasticityBulkResidual, 'nonlinear elasticity': LayerNonLinearElasticityBulkResidual}[problem]
+    if materialized:
+        layer_class = type(layer_class.__name__ + 'Materialized', (MaterializedIdentityMixin, layer_class), {})
+    layer = layer_class(dh=dh, E0=25, nu0=0.3)
+
+    @tf.function
+    def step(u):
+        with tf.GradientTape() as tape:
+            tape.watch(u)
+            R = layer(u)
+            loss = tf.reduce_sum(R * R)
+        return tape.gradient(loss, u)
+
+    # small deformation around the scaled zero (0.5), so that detF stays in the valid range
+    u = tf.constant(0.5 + 0.001 * np.random.default_rng(0).random([batch, size, size, 2]), tf.float32)
+    gpu = len(tf.config.list_physical_devices('GPU')) > 0
+    if gpu:
+        tf.config.experimental.reset_memory_stats('GPU:0')
+        baseline = tf.config.experimental.get_memory_info('GPU:0')['current']
+    else:
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    t = time_function(step, u, repeat=repeat, warmup=1)
+    if gpu:
+        peak = tf.config.experimental.get_memory_info('GPU:0')['peak'] - baseline
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - baseline
+    queue.put((peak / 1024.0**2, t))
+
+
+def benchmark_identity(sizes=[64], batch=512, repeat=5):
+    """
+    peak memory of the residual part of a training step with the identity tensors allocated per element and GP 
+    (Get2ndOrderIdentityTensorMaterialized) vs. the broadcast constants of Get2ndOrderIdentityTensor(). Every case runs in 
+    its own process, so that the peaks do not include each other. 'identity' is the size of the previous I_4 and I_2x2 
+    in the forward pass.
+    """
+    context = multiprocessing.get_context('spawn')
+    print('{:>20} {:>6} {:>6} {:>14} {:>18} {:>18} {:>14} {:>14}'.format(
+        'problem', 'size', 'batch', 'identity [MB]', 'peak (old) [MB]', 'peak (new) [MB]', 'old [ms]', 'new [ms]'))
+    for size in sizes:
+        for problem in ['linear elasticity', 'nonlinear elasticity']:
+            results = []
+            for materialized in [True, False]:
+                queue = context.Queue()
+                process = context.Process(target=identity_step_memory, args=(problem, materialized, size, batch, repeat, queue))
+                process.start()
+                process.join()
+                if process.exitcode != 0:
+                    raise ValueError('identity benchmark process failed (out of memory?) for ' + problem + ', size = ', size, ' batch = ', batch)
+                results.append(queue.get())
+            identity = batch * size * size * 4 * (2 + 4) * 4 / 1024.0**2
+            (peak_old, t_old), (peak_new, t_new) = results
+            print('{:>20} {:>6} {:>6} {:>14.1f} {:>18.1f} {:>18.1f} {:>14.3f} {:>14.3f}'.format(
+                problem, size, batch, identity, peak_old, peak_new, t_old, t_new))
+
+
+def benchmark_models(sizes=[32, 64, 256], batch=32, repeat=20):
+    """
+    cost of the bulk residual (element path and assembly) and its gradient d(sum R^2)/du per registered constitutive 
+    model of pde_constitutive_models.py, with the default material parameters
+    """
+    from pde_constitutive_models import CONSTITUTIVE_MODELS, get_constitutive_model
+    from pde_system_diffusion_steady_state import LayerDiffusionSteadyStateBulkResidual
+    from pde_system_elasticity_linear import LayerLinearElasticityBulkResidual
+    from pde_system_elasticity_nonlinear import LayerNonLinearElasticityBulkResidual
+
+    layers = {'diffusion': (1, LayerDiffusionSteadyStateBulkResidual), 
+              'linear-elasticity': (2, LayerLinearElasticityBulkResidual), 
+              'nonlinear-elasticity': (2, LayerNonLinearElasticityBulkResidual)}
+    print('{:>22} {:>28} {:>6} {:>6} {:>22}'.format('problem', 'model', 'size', 'batch', 'R_bulk + gradient [ms]'))
+    for size in sizes:
+        dh = 1.0 / (size - 1)
+        for (problem, name) in sorted(CONSTITUTIVE_MODELS.keys()):
+            dof, layer_class = layers[problem]
+            residual_layer = layer_class(dh=dh, GPs=4, model=get_constitutive_model(problem, name))
+            features = random_bc_features(batch, size, dof, dof)
+            mask = pde_layers.GetElementResidualMask(pde_layers.LayerFillRandomNumber()(features[:,:,:,0:dof]))
+            # small smooth deformation around the scaled zero (0.5), so that detF stays in the valid range
+            x = np.linspace(0.0, 1.0, size)
+            u = 0.5 + 0.02 * np.sin(np.pi * x)[None, :, None, None] * np.cos(np.pi * x)[None, None, :, None] * np.ones([batch, 1, 1, dof])
+            u = tf.constant(u, tf.float32)
+
+            def residual_and_gradient(u, m, residual_layer=residual_layer, dof=dof):
+                with tf.GradientTape() as tape:
+                    tape.watch(u)
+                    R = pde_layers.GetNodalInfoFromElementInfo(residual_layer(u), m, dof=dof)
+                    loss = tf.reduce_sum(R * R)
+                return R, tape.gradient(loss, u)
+            residual_and_gradient = tf.function(residual_and_gradient)
+            t = time_function(residual_and_gradient, u, mask, repeat=repeat)
+            print('{:>22} {:>28} {:>6} {:>6} {:>22.3f}'.format(problem, name, size, batch, t))
+
+
+def benchmark_strain_energy(sizes=[32, 64, 256], batch=32, repeat=20):
+    """
+    hyperelastic models of pde_constitutive_models.py: hand-written P (AnalyticStress) vs. P = dW/dF by automatic 
+    differentiation of the strain energy density (StrainEnergyAD = 2) and the same in one XLA-compiled kernel 
+    (StrainEnergyAD = 1). The errors of P in float32 are relative to the hand-written P in float64, the cost is the one of the 
+    non-linear elasticity residual and its gradient d(sum R^2)/du.
+    """
+    from pde_constitutive_models import CONSTITUTIVE_MODELS, HyperelasticModel, get_constitutive_model
+    from pde_system_elasticity_nonlinear import LayerNonLinearElasticityBulkResidual
+
+    names = sorted([n for (p, n), c in CONSTITUTIVE_MODELS.items() if p == 'nonlinear-elasticity' and 'AnalyticStress' in c.__dict__])
+    rng = np.random.default_rng(0)
+    print('{:>24} {:>6} {:>6} {:>10} {:>10} {:>10} {:>14} {:>14} {:>14}'.format(
+        'model', 'size', 'batch', 'P error', 'AD', 'AD XLA', 'analytic [ms]', 'AD [ms]', 'AD XLA [ms]'))
+    for size in sizes:
+        dh = 1.0 / (size - 1)
+        F64 = np.eye(2) + 0.1 * rng.uniform(-1.0, 1.0, [batch, size - 1, size - 1, 4, 2, 2])
+        # small smooth deformation around the scaled zero (0.5), so that detF stays in the valid range
+        x = np.linspace(0.0, 1.0, size)
+        u = 0.5 + 0.02 * np.sin(np.pi * x)[None, :, None, None] * np.cos(np.pi * x)[None, None, :, None] * np.ones([batch, 1, 1, 2])
+        u = tf.constant(u + 0.001 * rng.random([batch, size, size, 2]), tf.float32)
+        for name in names:
+            errors, times = [], []
+            for autodiff, jit_compile in [(False, False), (True, False), (True, True)]:
+                model = get_constitutive_model('nonlinear-elasticity', name, autodiff=autodiff, jit_compile=jit_compile)
+                layer = LayerNonLinearElasticityBulkResidual(dh=dh, GPs=4, model=model)
+                F = tf.constant(F64, tf.float32)
+                P = model.Stress(layer, F, layer.SmallMatrixDet(F)).numpy()
+                P_ref = get_constitutive_model('nonlinear-elasticity', name, autodiff=False).Stress(layer, tf.constant(F64), layer.SmallMatrixDet(tf.constant(F64))).numpy()
+                errors.append(np.abs(P - P_ref).max() / np.abs(P_ref).max())
+
+                def residual_and_gradient(u, layer=layer):
+                    with tf.GradientTape() as tape:
+                        tape.watch(u)
+                        R = layer(u)
+                        loss = tf.reduce_sum(R * R)
+                    return R, tape.gradient(loss, u)
+                times.append(time_function(tf.function(residual_and_gradient), u, repeat=repeat))
+            if max(errors[1:]) > 10.0 * errors[0] + 1.0e-5:
+                raise ValueError('P = dW/dF of ' + name + ' is different from the hand-written P, rel. errors = ', errors)
+            print('{:>24} {:>6} {:>6} {:>10.2e} {:>10.2e} {:>10.2e} {:>14.3f} {:>14.3f} {:>14.3f}'.format(name, size, batch, *errors, *times))
+
+
+def benchmark_material_fields(sizes=[32, 64, 256], batch=32, repeat=20):
+    """
+    bulk residual with heterogeneous materials (MaterialFields): the parameters of the default model of each problem are 
+    nodal fields interpolated to the GPs. A constant field has to give the residual of the scalar parameters (away from the 
+    ghost elements of the SAME padding), the cost of the residual and its gradient d(sum R^2)/du is compared to the 
+    homogeneous one.
+    """
+    from pde_constitutive_models import get_constitutive_model
+    from pde_system_diffusion_steady_state import LayerDiffusionSteadyStateBulkResidual
+    from pde_system_elasticity_linear import LayerLinearElasticityBulkResidual
+    from pde_system_elasticity_nonlinear import LayerNonLinearElasticityBulkResidual
+
+    cases = [('diffusion', 'linear', 1, LayerDiffusionSteadyStateBulkResidual), 
+             ('linear-elasticity', 'isotropic', 2, LayerLinearElasticityBulkResidual), 
+             ('nonlinear-elasticity', 'neo-hookean', 2, LayerNonLinearElasticityBulkResidual)]
+    rng = np.random.default_rng(0)
+    print('{:>22} {:>10} {:>6} {:>6} {:>12} {:>18} {:>18}'.format('problem', 'fields', 'size', 'batch', 'rel. diff', 'homogeneous [ms]', 'fields [ms]'))
+    for size in sizes:
+        dh = 1.0 / (size - 1)
+        x = np.linspace(0.0, 1.0, size)
+        for problem, name, dof, layer_class in cases:
+            model = get_constitutive_model(problem, name)
+            names = list(model.parameters.keys())
+            homogeneous = layer_class(dh=dh, GPs=4, model=model)
+            heterogeneous = layer_class(dh=dh, GPs=4, model=model, material_fields=names)
+            # small smooth deformation around the scaled zero (0.5), so that detF stays in the valid range
+            u = 0.5 + 0.02 * np.sin(np.pi * x)[None, :, None, None] * np.cos(np.pi * x)[None, None, :, None] * np.ones([batch, 1, 1, dof])
+            u = tf.constant(u, tf.float32)
+            constant = tf.constant(np.stack([np.full([batch, size, size], model.p[k]) for k in names], -1), tf.float32)
+            # +-20 % around the scalar parameters
+            fields = tf.constant(np.stack([model.p[k] * (0.8 + 0.4 * rng.random([batch, size, size])) for k in names], -1), tf.float32)
+
+            R0 = homogeneous(u).numpy()[:, 0:-1, 0:-1]
+            R1 = heterogeneous(u, fields=constant).numpy()[:, 0:-1, 0:-1]
+            rel_diff = np.abs(R1 - R0).max() / np.abs(R0).max()
+            if rel_diff > 1.0e-5:
+                raise ValueError('residual of constant material fields is different from the scalar parameters for ' + problem + ', rel. diff = ', rel_diff)
+
+            def residual_and_gradient(u, fields=None, layer=homogeneous):
+                with tf.GradientTape() as tape:
+                    tape.watch(u)
+                    R = layer(u, fields=fields)
+                    loss = tf.reduce_sum(R * R)
+                return R, tape.gradient(loss, u)
+            t0 = time_function(tf.function(residual_and_gradient), u, repeat=repeat)
+            t1 = time_function(tf.function(lambda u, fields: residual_and_gradient(u, fields, layer=heterogeneous)), u, fields, repeat=repeat)
+            print('{:>22} {:>10} {:>6} {:>6} {:>12.2e} {:>18.3f} {:>18.3f}'.format(problem, ' '.join(names), size, batch, rel_diff, t0, t1))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='pde_layers micro-benchmarks', prog="'" + (sys.argv[0]) + "'")
+    parser.add_argument('benchmark', type=str, choices=['element_gather', 'gauss_points', 'neumann', 'assembly', 'stencil', 'gauss_rules', 'hex', 'small_matrix', 'identity', 'models', 'strain_energy', 'material_fields'], help='benchmark to run')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[32, 64, 256], help='number of nodes per direction')
+    parser.add_argument('--batch', type=int, default=32, help='batch size')
+    parser.add_argument('--repeat', type=int, default=20, help='timed calls per case')
+    args = parser.parse_args()
+
+    if args.benchmark == 'element_gather':
+        benchmark_element_gather(sizes=args.sizes, batch=args.batch, repeat=args.repeat)
+    elif args.benchmark == 'gauss_points':
+        benchmark_gauss_points(sizes=args.sizes, batch=args.batch, repeat=args.repeat)
+    elif args.benchmark == 'neumann':
+        benchmark_neumann(sizes=args.sizes, batch=args.batch, repeat=args.repeat)
+    elif args.benchmark == 'assembly':
+        benchmark_assembly(sizes=args.sizes, batch=args.batch, repeat=args.repeat)
+    elif args.benchmark == 'stencil':
+        benchmark_stencil(sizes=args.sizes, batch=args.batch, repeat=args.repeat)
+    elif args.benchmark == 'gauss_rules':
+        benchmark_gauss_rules(sizes=args.sizes, batch=args.batch, repeat=args.repeat)
+    elif args.benchmark == 'hex':
+        benchmark_hex(sizes=args.sizes, batch=args.batch, repeat=args.repeat)
+    elif args.benchmark == 'small_matrix':
+        benchmark_small_matrix(sizes=args.sizes, batch=args.batch, repeat=args.repeat)
+    elif args.benchmark == 'identity':
+        benchmark_identity(sizes=args.sizes, batch=args.batch, repeat=args.repeat)
+    elif args.benchmark == 'models':
+        benchmark_models(sizes=args.sizes, batch=args.batch, repeat=args.repeat)
+    elif args.benchmark == 'strain_energy':
+        benchmark_strain_energy(sizes=args.sizes, batch=args.batch, repeat=args.repeat)
+    elif args.benchmark == 'material_fields':
+        benchmark_material_fields(sizes=args.sizes, batch=args.batch, repeat=args.repeat)
@@ -0,0 +1,463 @@
+"""
+Constitutive models of the bulk residual layers, selected in the [NN] section of the .ini file:
+
+    ConstitutiveModel = mooney-rivlin
+    MaterialParameters = E0 25 nu0 0.3 ratio 0.3
+
+Each model is a GP-batched kernel on the quantities of all GPs (gradu [-1, GPs, dim] for diffusion, epsilon and F
+[-1, elem_height, elem_width, GPs, dim, dim] for elasticity) and uses the closed-form small-matrix kernels of
+LayerBulkResidual (SmallMatrixDet, SmallMatrixInvTranspose, ...), so a new material is a new registered class here,
+not a new layer or workflow. The models work for the 2D (plane strain) and the 3D elements.
+
+    problem                 models
+    diffusion               linear (default), concentration-linear, concentration-exponential, gradient-power
+    linear-elasticity       isotropic (default), plane-stress
+    nonlinear-elasticity    neo-hookean (default), neo-hookean-log, saint-venant-kirchhoff, mooney-rivlin
+
+The hyperelastic models can compute P = dW/dF from their strain energy density by automatic differentiation 
+(StrainEnergyAD), and new ones only need W(F), see HyperelasticModel and register_strain_energy().
+
+Heterogeneous materials (MaterialFields) replace scalar parameters by nodal fields, which the layers interpolate to the 
+GPs and pass to the models as 'fields', see ConstitutiveModel.Parameters().
+"""
+import weakref
+
+import numpy as np
+
+import tensorflow as tf
+
+CONSTITUTIVE_MODELS = {}
+
+
+def register_constitutive_model(model_class):
+    """
+    class decorator: add a model to CONSTITUTIVE_MODELS with the key (problem, name)
+    """
+    CONSTITUTIVE_MODELS[(model_class.problem, model_class.name)] = model_class
+    return model_class
+
+
+def get_constitutive_model(problem, name, **parameters):
+    """
+    create a registered constitutive model
+
+    args:
+        problem (str): diffusion, linear-elasticity or nonlinear-elasticity
+        name (str): name of the model, see CONSTITUTIVE_MODELS
+        parameters: material parameters, the ones not given keep the default of the model
+    return:
+        ConstitutiveModel
+    """
+    if (problem, name) not in CONSTITUTIVE_MODELS:
+        choices = sorted([n for (p, n) in CONSTITUTIVE_MODELS.keys() if p == problem])
+        raise ValueError('ConstitutiveModel = ' + name + ' is not supported for ' + problem + '! Choose from: ' + ', '.join(choices))
+    return CONSTITUTIVE_MODELS[(problem, name)](**parameters)
+
+
+def parse_material_parameters(text):
+    """
+    parse the MaterialParameters option of the .ini file
+
+    args:
+        text (str): pairs of name and value, e.g. 'E0 25 nu0 0.3'
+    return:
+        dict: e.g. {'E0': 25.0, 'nu0': 0.3}
+    """
+    items = text.split()
+    if len(items) % 2 != 0:
+        raise ValueError('MaterialParameters = ' + text + ' should be pairs of name and value, e.g. E0 25 nu0 0.3')
+    return {items[i]: float(items[i+1]) for i in range(0, len(items), 2)}
+
+
+def E_nu_to_lambda_mu(E, nu):
+    """
+    Lame parameters of the Young's modulus and the Poisson's ratio, same as LayerBulkResidual.E_nu_to_lambda_mu()
+    """
+    lambda0 = (E*nu)/(1.0+nu)/(1.0-2.0*nu)
+    mu0 = E/2.0/(1.0+nu)
+    return lambda0, mu0
+
+
+class ConstitutiveModel(object):
+    """
+    Base class of the constitutive models. 'parameters' holds the names and the default values of the material
+    parameters, self.p the values of this model.
+    """
+    problem = ''
+    name = ''
+    parameters = {}
+    # the diffusion models need the value of the unknown at the GPs
+    uses_value = False
+
+    def __init__(self, **parameters):
+        self.CheckParameterNames(parameters.keys())
+        self.p = dict(self.parameters)
+        self.p.update(parameters)
+
+    def CheckParameterNames(self, names):
+        """
+        raise ValueError if one of the names is not a material parameter of this model
+        """
+        unknown = [k for k in names if k not in self.parameters]
+        if unknown:
+            raise ValueError('unknown material parameters ', unknown, ' of ConstitutiveModel = ' + self.name + '! Choose from: ', list(self.parameters.keys()))
+
+    def Parameters(self, fields=None, rank=0):
+        """
+        material parameters self.p, with the heterogeneous material fields at the GPs in place of the scalar values
+
+        args:
+            fields (dict): name -> values at all GPs [...], see LayerBulkResidual.ComputeMaterialFieldsAtAllGPs(). 
+                           Default (None): the scalar parameters
+            rank (int): number of axes added to the fields, e.g. 1 for gradu [..., dim], 2 for F [..., dim, dim]
+        return:
+            dict: name -> float or tensor [..., 1 (rank times)]
+        """
+        if not fields:
+            return self.p
+        p = dict(self.p)
+        for name, value in fields.items():
+            p[name] = value[(Ellipsis,) + (tf.newaxis,) * rank]
+        return p
+
+    def Tangent(self, dim):
+        """
+        constant tangent [dim*dof, dim*dof] for the stencil mode, see LayerBulkResidual.LinearConstitutiveTangent()
+        """
+        raise ValueError("stencil mode (LinearStencil) is only available for linear constitutive relations, ConstitutiveModel = " + self.name + " is nonlinear!")
+
+
+# ---------------------------------------------------------------------------------
+# diffusion: Flux(layer, gradu, valu, fields) -> H [-1, GPs, dim] with gradu [-1, GPs, dim],
+# valu [-1, GPs] (None if uses_value is False) and the material fields [-1, GPs] (or None)
+# ---------------------------------------------------------------------------------
+
+@register_constitutive_model
+class LinearDiffusion(ConstitutiveModel):
+    """
+    H = D0 grad c
+    """
+    problem = 'diffusion'
+    name = 'linear'
+    parameters = {'D0': 1.0}
+
+    def Flux(self, layer, gradu, valu=None, fields=None):
+        p = self.Parameters(fields, rank=1)
+        return p['D0'] * gradu
+
+    def Tangent(self, dim):
+        return self.p['D0'] * np.eye(dim)
+
+
+@register_constitutive_model
+class ConcentrationLinearDiffusion(ConstitutiveModel):
+    """
+    H = D0 (1 + beta c) grad c
+    """
+    problem = 'diffusion'
+    name = 'concentration-linear'
+    parameters = {'D0': 1.0, 'beta': 1.0}
+    uses_value = True
+
+    def Flux(self, layer, gradu, valu, fields=None):
+        p = self.Parameters(fields, rank=1)
+        return p['D0'] * (1.0 + p['beta'] * tf.expand_dims(valu, -1)) * gradu
+
+
+@register_constitutive_model
+class ConcentrationExponentialDiffusion(ConstitutiveModel):
+    """
+    H = D0 exp(beta c) grad c
+    """
+    problem = 'diffusion'
+    name = 'concentration-exponential'
+    parameters = {'D0': 1.0, 'beta': 1.0}
+    uses_value = True
+
+    def Flux(self, layer, gradu, valu, fields=None):
+        p = self.Parameters(fields, rank=1)
+        return p['D0'] * tf.exp(p['beta'] * tf.expand_dims(valu, -1)) * gradu
+
+
+@register_constitutive_model
+class GradientPowerDiffusion(ConstitutiveModel):
+    """
+    H = D0 (1 + |grad c|^2)^((p-2)/2) grad c, a regularized p-Laplacian
+    """
+    problem = 'diffusion'
+    name = 'gradient-power'
+    parameters = {'D0': 1.0, 'p': 3.0}
+
+    def Flux(self, layer, gradu, valu=None, fields=None):
+        p = self.Parameters(fields, rank=1)
+        gradu_norm2 = tf.reduce_sum(gradu * gradu, axis=-1, keepdims=True)
+        return p['D0'] * tf.pow(1.0 + gradu_norm2, 0.5 * (p['p'] - 2.0)) * gradu
+
+
+# ---------------------------------------------------------------------------------
+# linear elasticity: Stress(layer, epsilon, I, fields) -> sigma with epsilon [..., dim, dim], the broadcast
+# identity I of LayerBulkResidual.Get2ndOrderIdentityTensor() and the material fields [...] (or None)
+# ---------------------------------------------------------------------------------
+
+@register_constitutive_model
+class IsotropicLinearElasticity(ConstitutiveModel):
+    """
+    sigma = lambda tr(epsilon) I + 2 mu epsilon (plane strain in 2D)
+    """
+    problem = 'linear-elasticity'
+    name = 'isotropic'
+    parameters = {'E0': 25.0, 'nu0': 0.3}
+
+    def LameParameters(self, dim, p=None):
+        p = self.p if p is None else p
+        return E_nu_to_lambda_mu(E=p['E0'], nu=p['nu0'])
+
+    def Stress(self, layer, epsilon, I, fields=None):
+        lambda0, mu0 = self.LameParameters(layer.dim, self.Parameters(fields, rank=2))
+        epsilon_trace = layer.SmallMatrixTrace(epsilon)
+        epsilon_trace = tf.expand_dims(epsilon_trace, -1)
+        epsilon_trace = tf.expand_dims(epsilon_trace, -1)
+        return lambda0 * tf.math.multiply(epsilon_trace, I) + 2.0 * mu0 * epsilon
+
+    def Tangent(self, dim):
+        """
+        C_ijkl = lambda d_ij d_kl + mu (d_ik d_jl + d_il d_jk), gradu = [dx/dx, dx/dy, dy/dx, dy/dy] (row major in 3D)
+        """
+        lambda0, mu0 = self.LameParameters(dim)
+        d = np.eye(dim)
+        C = lambda0 * np.einsum('ij,kl->ijkl', d, d) + mu0 * (np.einsum('ik,jl->ijkl', d, d) + np.einsum('il,jk->ijkl', d, d))
+        return C.reshape(dim*dim, dim*dim)
+
+
+@register_constitutive_model
+class PlaneStressLinearElasticity(IsotropicLinearElasticity):
+    """
+    isotropic linear elasticity in plane stress (sigma_zz = 0): lambda* = 2 lambda mu / (lambda + 2 mu). 2D only.
+    """
+    name = 'plane-stress'
+
+    def LameParameters(self, dim, p=None):
+        if dim != 2:
+            raise ValueError('ConstitutiveModel = plane-stress is only available for the 2D elements!')
+        p = self.p if p is None else p
+        lambda0, mu0 = E_nu_to_lambda_mu(E=p['E0'], nu=p['nu0'])
+        return 2.0 * lambda0 * mu0 / (lambda0 + 2.0 * mu0), mu0
+
+
+# ---------------------------------------------------------------------------------
+# hyperelasticity: Stress(layer, F, J, fields) -> P (1st Piola-Kirchhoff) with F [..., dim, dim],
+# J = det(F) [...] and the material fields [...] (or None). F is invertible, see 
+# LayerNonLinearElasticityBulkResidual.ConstitutiveRelation().
+# In 2D, the models are plane strain (F_zz = 1).
+# ---------------------------------------------------------------------------------
+
+class HyperelasticModel(ConstitutiveModel):
+    """
+    Base class of the hyperelastic models given by the strain energy density W(F) of StrainEnergy(). P = dW/dF is the 
+    hand-written AnalyticStress() or, with autodiff, the gradient of W at all GPs (one GradientTape on sum(W), as W of 
+    a GP only depends on F of this GP). With jit_compile, W and its gradient are one tf.function per layer, compiled 
+    (fused) by XLA. The gradient of the training loss differentiates through this tape. A new material only needs 
+    StrainEnergy(), see register_strain_energy().
+    """
+    problem = 'nonlinear-elasticity'
+    # True: P = dW/dF by automatic differentiation, False: AnalyticStress(). True for the models of register_strain_energy()
+    autodiff = False
+    # True: compile W and dW/dF with XLA (autodiff only)
+    jit_compile = False
+
+    def __init__(self, autodiff=None, jit_compile=None, **parameters):
+        super(HyperelasticModel, self).__init__(**parameters)
+        if autodiff is not None:
+            self.autodiff = autodiff
+        if jit_compile is not None:
+            self.jit_compile = jit_compile
+        # layer -> compiled StrainEnergyStress(), see CompiledStrainEnergyStress()
+        self.compiled_strain_energy_stress = weakref.WeakKeyDictionary()
+
+    def StrainEnergy(self, layer, F, fields=None):
+        """
+        strain energy density W [...] of F [..., dim, dim]
+        """
+        raise ValueError('StrainEnergy() is not implemented for ConstitutiveModel = ' + self.name + '!')
+
+    def AnalyticStress(self, layer, F, J, fields=None):
+        """
+        hand-written P = dW/dF [..., dim, dim]
+        """
+        raise ValueError('AnalyticStress() is not implemented for ConstitutiveModel = ' + self.name + ', use autodiff!')
+
+    def StrainEnergyStress(self, layer, F, fields=None):
+        """
+        P = dW/dF [..., dim, dim] by automatic differentiation of StrainEnergy()
+        """
+        with tf.GradientTape() as tape:
+            tape.watch(F)
+            W = self.StrainEnergy(layer, F, fields)
+        return tape.gradient(W, F)
+
+    def CompiledStrainEnergyStress(self, layer):
+        """
+        StrainEnergyStress() of layer as one XLA-compiled tf.function of (F, fields), created at the first call for each 
+        layer. The layer is not a traced argument, and the shapes of F are relaxed, i.e. there is no retracing per layer 
+        or batch size.
+        """
+        function = self.compiled_strain_energy_stress.get(layer)
+        if function is None:
+            layer_ref = weakref.ref(layer)
+            function = tf.function(lambda F, fields: self.StrainEnergyStress(layer_ref(), F, fields), jit_compile=True, reduce_retracing=True)
+            self.compiled_strain_energy_stress[layer] = function
+        return function
+
+    def Stress(self, layer, F, J, fields=None):
+        if not self.autodiff:
+            return self.AnalyticStress(layer, F, J, fields)
+        if self.jit_compile:
+            return self.CompiledStrainEnergyStress(layer)(F, fields)
+        return self.StrainEnergyStress(layer, F, fields)
+
+    def Invariants(self, layer, F):
+        """
+        J = det(F), I1 = tr(C) and I2 = (I1^2 - tr(C^2)) / 2 of C = F^T F [...], with C_zz = 1 in 2D (plane strain)
+        """
+        J = layer.SmallMatrixDet(F)
+        C = layer.SmallMatrixMatmul(F, F, transpose_a=True)
+        I1 = layer.SmallMatrixTrace(C) + (3.0 - layer.dim)
+        I2 = 0.5 * (I1 * I1 - tf.reduce_sum(C * C, axis=[-2, -1]) - (3.0 - layer.dim))
+        return J, I1, I2
+
+
+def register_strain_energy(name, W, parameters):
+    """
+    register a hyperelastic model that is only given by its strain energy density, P = dW/dF by automatic 
+    differentiation, e.g.
+
+        def W(layer, F, p):
+            lambda0, mu0 = E_nu_to_lambda_mu(E=p['E0'], nu=p['nu0'])
+            J = layer.SmallMatrixDet(F)
+            I1 = layer.SmallMatrixTrace(layer.SmallMatrixMatmul(F, F, transpose_a=True)) + 3.0 - layer.dim
+            return 0.5 * mu0 * (I1 - 3.0) + p['C20'] * (I1 - 3.0)**2 - mu0 * tf.math.log(J) + 0.5 * lambda0 * (J - 1.0)**2
+        register_strain_energy('yeoh', W, {'E0': 25.0, 'nu0': 0.3, 'C20': 1.0})
+
+    before the workflow is created, and ConstitutiveModel = yeoh in the .ini file. E0 and nu0 get the values of the 
+    workflow (MaterialParameters).
+
+    args:
+        name (str): name of the model
+        W (function): (layer, F [..., dim, dim], parameters (dict) of floats or tensors [...] (MaterialFields)) -> W [...]
+        parameters (dict): names and default values of the material parameters
+    return:
+        class of the model
+    """
+    def StrainEnergy(self, layer, F, fields=None):
+        return W(layer, F, self.Parameters(fields))
+
+    # there is no AnalyticStress(), P is always computed by automatic differentiation
+    model_class = type('StrainEnergy_' + name, (HyperelasticModel,), {'name': name, 'parameters': dict(parameters), 'StrainEnergy': StrainEnergy, 
+                                                                     'autodiff': True, 'jit_compile': True})
+    return register_constitutive_model(model_class)
+
+
+@register_constitutive_model
+class NeoHookean(HyperelasticModel):
+    """
+    compressible neo-Hookean: W = mu/2 (I1 - 3) - mu ln(J) + lambda/2 (J - 1)^2,
+    P = lambda (J^2 - J) F^-T + mu (F - F^-T)
+    """
+    name = 'neo-hookean'
+    parameters = {'E0': 25.0, 'nu0': 0.3}
+
+    def StrainEnergy(self, layer, F, fields=None):
+        p = self.Parameters(fields)
+        lambda0, mu0 = E_nu_to_lambda_mu(E=p['E0'], nu=p['nu0'])
+        J, I1, _ = self.Invariants(layer, F)
+        return 0.5 * mu0 * (I1 - 3.0) - mu0 * tf.math.log(J) + 0.5 * lambda0 * (J - 1.0) * (J - 1.0)
+
+    def AnalyticStress(self, layer, F, J, fields=None):
+        p = self.Parameters(fields, rank=2)
+        lambda0, mu0 = E_nu_to_lambda_mu(E=p['E0'], nu=p['nu0'])
+        TransInvF = layer.SmallMatrixInvTranspose(F, J)
+        detF = tf.expand_dims(tf.expand_dims(J, -1), -1)
+        return lambda0 * (tf.math.multiply(detF,detF) - detF) * TransInvF + mu0 * ( F - TransInvF)
+
+
+@register_constitutive_model
+class NeoHookeanLog(HyperelasticModel):
+    """
+    compressible neo-Hookean with the logarithmic volumetric term: W = mu/2 (I1 - 3) - mu ln(J) + lambda/2 ln(J)^2,
+    P = mu (F - F^-T) + lambda ln(J) F^-T
+    """
+    name = 'neo-hookean-log'
+    parameters = {'E0': 25.0, 'nu0': 0.3}
+
+    def StrainEnergy(self, layer, F, fields=None):
+        p = self.Parameters(fields)
+        lambda0, mu0 = E_nu_to_lambda_mu(E=p['E0'], nu=p['nu0'])
+        J, I1, _ = self.Invariants(layer, F)
+        lnJ = tf.math.log(J)
+        return 0.5 * mu0 * (I1 - 3.0) - mu0 * lnJ + 0.5 * lambda0 * lnJ * lnJ
+
+    def AnalyticStress(self, layer, F, J, fields=None):
+        p = self.Parameters(fields, rank=2)
+        lambda0, mu0 = E_nu_to_lambda_mu(E=p['E0'], nu=p['nu0'])
+        TransInvF = layer.SmallMatrixInvTranspose(F, J)
+        lnJ = tf.expand_dims(tf.expand_dims(tf.math.log(J), -1), -1)
+        return mu0 * (F - TransInvF) + lambda0 * lnJ * TransInvF
+
+
+@register_constitutive_model
+class SaintVenantKirchhoff(HyperelasticModel):
+    """
+    Saint Venant-Kirchhoff: E = (F^T F - I) / 2, W = lambda/2 tr(E)^2 + mu tr(E^2), S = lambda tr(E) I + 2 mu E, P = F S
+    """
+    name = 'saint-venant-kirchhoff'
+    parameters = {'E0': 25.0, 'nu0': 0.3}
+
+    def GreenLagrangeStrain(self, layer, F):
+        return 0.5 * (layer.SmallMatrixMatmul(F, F, transpose_a=True) - tf.eye(layer.dim, dtype=F.dtype))
+
+    def StrainEnergy(self, layer, F, fields=None):
+        p = self.Parameters(fields)
+        lambda0, mu0 = E_nu_to_lambda_mu(E=p['E0'], nu=p['nu0'])
+        E = self.GreenLagrangeStrain(layer, F)
+        E_trace = layer.SmallMatrixTrace(E)
+        return 0.5 * lambda0 * E_trace * E_trace + mu0 * tf.reduce_sum(E * E, axis=[-2, -1])
+
+    def AnalyticStress(self, layer, F, J, fields=None):
+        p = self.Parameters(fields, rank=2)
+        lambda0, mu0 = E_nu_to_lambda_mu(E=p['E0'], nu=p['nu0'])
+        E = self.GreenLagrangeStrain(layer, F)
+        E_trace = tf.expand_dims(tf.expand_dims(layer.SmallMatrixTrace(E), -1), -1)
+        S = lambda0 * E_trace * tf.eye(layer.dim, dtype=F.dtype) + 2.0 * mu0 * E
+        return layer.SmallMatrixMatmul(F, S)
+
+
+@register_constitutive_model
+class MooneyRivlin(HyperelasticModel):
+    """
+    compressible Mooney-Rivlin: W = C10 (I1 - 3) + C01 (I2 - 3) - 2 (C10 + 2 C01) ln(J) + kappa/2 (J - 1)^2,
+    P = 2 C10 F + 2 C01 (I1 F - F C) - 2 (C10 + 2 C01) F^-T + kappa (J^2 - J) F^-T with C = F^T F.
+    mu = 2 (C10 + C01) and kappa = lambda - 4 C01 with the Lame parameters of E0, nu0, so that the small strain limit is 
+    the linear elasticity of E0, nu0. ratio = C01 / (C10 + C01).
+    """
+    name = 'mooney-rivlin'
+    parameters = {'E0': 25.0, 'nu0': 0.3, 'ratio': 0.5}
+
+    def MooneyRivlinParameters(self, p):
+        lambda0, mu0 = E_nu_to_lambda_mu(E=p['E0'], nu=p['nu0'])
+        C10, C01 = 0.5 * mu0 * (1.0 - p['ratio']), 0.5 * mu0 * p['ratio']
+        return C10, C01, lambda0 - 4.0 * C01
+
+    def StrainEnergy(self, layer, F, fields=None):
+        C10, C01, kappa = self.MooneyRivlinParameters(self.Parameters(fields))
+        J, I1, I2 = self.Invariants(layer, F)
+        return C10 * (I1 - 3.0) + C01 * (I2 - 3.0) - 2.0 * (C10 + 2.0 * C01) * tf.math.log(J) + 0.5 * kappa * (J - 1.0) * (J - 1.0)
+
+    def AnalyticStress(self, layer, F, J, fields=None):
+        C10, C01, kappa = self.MooneyRivlinParameters(self.Parameters(fields, rank=2))
+        TransInvF = layer.SmallMatrixInvTranspose(F, J)
+        detF = tf.expand_dims(tf.expand_dims(J, -1), -1)
+        C = layer.SmallMatrixMatmul(F, F, transpose_a=True)
+        # plane strain: C_zz = 1
+        I1 = tf.expand_dims(tf.expand_dims(layer.SmallMatrixTrace(C) + (3.0 - layer.dim), -1), -1)
+        return 2.0 * C10 * F + 2.0 * C01 * (I1 * F - layer.SmallMatrixMatmul(F, C)) \
+            + (kappa * (detF * detF - detF) - 2.0 * (C10 + 2.0 * C01)) * TransInvF
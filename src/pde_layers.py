@@ -27,16 +27,35 @@ def GetElementResidualMask(data):
     return mask
 
 
+def GetElementResidualMask3D(data):
+    """ 
+    3D version of GetElementResidualMask(): the element (k,i,j)-(k+1,i+1,j+1) is part of the residual if both diagonal 
+    nodes are not in the margin.
+
+    args: 
+        data (numpy array): [batch, node_depth, node_height, node_width, m] (scalar/vector)
+    
+    return:
+        numpy array: mask [batch, elem_depth, elem_height, elem_width, 1] (same padding is used.)
+    """
+    mask_original = tf.where( data < 0, tf.fill(tf.shape(data), 0.0), tf.fill(tf.shape(data), 1.0))
+    n8 = np.zeros([2, 2, 2, 1, 1], dtype=np.float32)
+    n8[1, 1, 1, 0, 0] = 1.0
+    mask_shift = tf.nn.conv3d(mask_original[..., 0:1], n8, [1,1,1,1,1], 'SAME')
+    mask = tf.multiply(mask_original[..., 0:1], mask_shift)
+    return mask
+
+
 def ComputeBoundaryMaskNodalData(data_input, dof, opt=1):
     """ 
     Create Dirichlet mask or Neumann mask based on the inputs, where only the boundary part is 0.0, margin and the body part is 1.0.
 
     args:
-        data_input (numpy array): size of [batch, node_height, node_width, dof*2]
+        data_input (numpy array): size of [batch, node_height, node_width, dof*2] (or [batch, node_depth, node_height, node_width, dof*2] in 3D)
         dof (int): dof per node
         opt (int): Dirichlet Mask (opt=1), Neumann mask (opt=2)
     return:
-        numpy array: boundary mask with size of [batch, node_height, node_width, dof]
+        numpy array: boundary mask with size of [batch, node_height, node_width, dof] (or [batch, node_depth, node_height, node_width, dof])
 
     todo:
         make this function to work with (1S, 1V), 2S, 1V1S, 3S, 2V, etc.
@@ -46,13 +65,13 @@ def ComputeBoundaryMaskNodalData(data_input, dof, opt=1):
         # data_input = tf.convert_to_tensor(data_input, dtype=tf.float32)
         if pflag: print('data_input', np.shape(data_input))
         #---------------- Dirichlet BCs-----------------
-        dirichlet_data = data_input[:,:,:,0:1]
+        dirichlet_data = data_input[...,0:1]
         if pflag: print('dirichlet_data', dirichlet_data[0,:,:,0])
         dirichlet_reverse_mask = tf.where( dirichlet_data < 0, tf.fill(tf.shape(dirichlet_data), 1.0), tf.fill(tf.shape(dirichlet_data), 0.0))
         if pflag: print('dirichlet_reverse_mask', dirichlet_reverse_mask[0,:,:,0])
 
         #---------------- Neumann BCs-----------------
-        neumann_data = data_input[:,:,:,1:2]
+        neumann_data = data_input[...,1:2]
         if pflag:  print('neumann_data', neumann_data[0,:,:,0])
         if pflag:  print('attention, NM should not be scaled ')
         neumann_reverse_mask = tf.where( neumann_data > 0.0, tf.fill(tf.shape(neumann_data), 0.0), tf.fill(tf.shape(neumann_data), 1.0))
@@ -75,8 +94,8 @@ def ComputeBoundaryMaskNodalData(data_input, dof, opt=1):
         # data_input = tf.convert_to_tensor(data_input, dtype=tf.float32)
         if pflag: print('data_input', np.shape(data_input))
         #---------------- Dirichlet BCs-----------------
-        dirichlet_x_data = data_input[:,:,:,0:1]
-        dirichlet_y_data = data_input[:,:,:,1:2]
+        dirichlet_x_data = data_input[...,0:1]
+        dirichlet_y_data = data_input[...,1:2]
         if pflag: print('dirichlet_x_data', dirichlet_x_data[0,:,:,0])
         if pflag: print('dirichlet_y_data', dirichlet_y_data[0,:,:,0])
         dirichlet_x_reverse_mask = tf.where( dirichlet_x_data < 0, tf.fill(tf.shape(dirichlet_x_data), 1.0), tf.fill(tf.shape(dirichlet_x_data), 0.0))
@@ -85,8 +104,8 @@ def ComputeBoundaryMaskNodalData(data_input, dof, opt=1):
         if pflag: print('dirichlet_y_reverse_mask', dirichlet_y_reverse_mask[0,:,:,0])
 
         #---------------- Neumann BCs-----------------
-        neumann_x_data = data_input[:,:,:,2:3]
-        neumann_y_data = data_input[:,:,:,3:4]
+        neumann_x_data = data_input[...,2:3]
+        neumann_y_data = data_input[...,3:4]
         if pflag: print('neumann_x_data', neumann_x_data[0,:,:,0])
         if pflag: print('neumann_y_data', neumann_y_data[0,:,:,0])
         if pflag: print('attention, NM should not be scaled ')
@@ -94,8 +113,8 @@ def ComputeBoundaryMaskNodalData(data_input, dof, opt=1):
         neumann_y_reverse_mask = tf.where( neumann_y_data > 0.0, tf.fill(tf.shape(neumann_y_data), 0.0), tf.fill(tf.shape(neumann_y_data), 1.0))
         if pflag: print('neumann_x_reverse_mask', neumann_x_reverse_mask[0,:,:,0])
         if pflag: print('neumann_y_reverse_mask', neumann_y_reverse_mask[0,:,:,0])
-        dirichlet_reverse_mask = tf.concat([dirichlet_x_reverse_mask, dirichlet_y_reverse_mask], axis=3)
-        neumann_reverse_mask = tf.concat([neumann_x_reverse_mask, neumann_y_reverse_mask], axis=3)
+        dirichlet_reverse_mask = tf.concat([dirichlet_x_reverse_mask, dirichlet_y_reverse_mask], axis=-1)
+        neumann_reverse_mask = tf.concat([neumann_x_reverse_mask, neumann_y_reverse_mask], axis=-1)
         # bc_mask = tf.multiply(dirichlet_reverse_mask, neumann_reverse_mask)
         bc_mask = dirichlet_reverse_mask
         # bc_mask = tf.reverse(bc_mask, [1])
@@ -116,14 +135,14 @@ def ComputeBoundaryMaskNodalData(data_input, dof, opt=1):
         # data_input = tf.convert_to_tensor(data_input, dtype=tf.float32)
         if pflag: print('data_input', np.shape(data_input))
         #---------------- Dirichlet BCs-----------------
-        dirichlet_data = data_input[:,:,:,0:dof]
+        dirichlet_data = data_input[...,0:dof]
         dirichlet_reverse_mask = tf.where( dirichlet_data < 0, tf.fill(tf.shape(dirichlet_data), 1.0), tf.fill(tf.shape(dirichlet_data), 0.0))
         if pflag: 
             for d0 in range(0, dof):
                 print(' dirichlet_reverse_mask ' + str(d0) + ':', dirichlet_reverse_mask[0,:,:,d0])
 
         #---------------- Neumann BCs-----------------
-        neumann_data = data_input[:,:,:,dof:2*dof]
+        neumann_data = data_input[...,dof:2*dof]
         neumann_reverse_mask = tf.where( neumann_data > 0.0, tf.fill(tf.shape(neumann_data), 0.0), tf.fill(tf.shape(neumann_data), 1.0))
         if pflag: 
             for d0 in range(0, dof):
@@ -136,2279 +155,483 @@ def ComputeBoundaryMaskNodalData(data_input, dof, opt=1):
 
         raise ValueError("Please check dof = ", dof, " if it is implemented correct or not in pde_layers.ComputeBoundaryMaskNodalData()!")
 
-def ComputeNeumannBoundaryResidualNodalData(data_input, dh, dof, padding='SAME'):
+def UnpackBoundaryMaskNodalData(mask_channel, dof):
     """ 
-    Compute the residual on the Neumann BCs.  The implementation is based on Neumann BCs is scaled between (-1, 1), and Neumann condition should be always > 0 in the domain region. Raise value error if negative value is detected
+    Unpack the BC masks precomputed by pde_utility.compute_bc_mask_channel() in the data loader.
 
     args:
-        data_input (numpy array): size of [batch, node_height, node_width, dof*2]
+        mask_channel (tensor): size of [batch, node_height, node_width, 1] (or [batch, node_depth, node_height, node_width, 1]), packed bits stored as float32
         dof (int): dof per node
-        dh (float): element size
     return:
-        numpy array: nodal Neumann residual value with size of [batch, node_height, node_width, dof]
+        Dirichlet mask (same as ComputeBoundaryMaskNodalData(opt=1)) with size of [batch, node_height, node_width, dof],
+        Neumann mask (same as ComputeBoundaryMaskNodalData(opt=2)) with size of [batch, node_height, node_width, dof],
+        element residual mask (same as GetElementResidualMask(LayerFillRandomNumber()(Dirichlet))) with size of [batch, node_height, node_width, 1]
+    """
+    bits = tf.cast(mask_channel, tf.int32)
+    shift = tf.constant(np.arange(0, 2*dof+1), dtype=tf.int32)
+    masks = tf.cast(tf.bitwise.bitwise_and(tf.bitwise.right_shift(bits, shift), 1), tf.float32)
+    return masks[...,0:dof], masks[...,dof:2*dof], masks[...,2*dof:2*dof+1]
 
-    todo:
-        make this function to work with (1S, 1V), 2S, 1V1S, 3S, 2V, etc.
+def GetElementSize(dh, dim=2):
+    """ 
+    element size (dx, dy) along x (image width) and y (image height), and dz along z (image depth) for dim=3
 
-        loop over each dof, instead of implementing different dof opt.
+    args:
+        dh (float or tuple): dh for a square (cubic) grid or (dx, dy) ((dx, dy, dz)) for a rectangular grid
+        dim (int): 2 or 3
+    return:
+        tuple of dim floats
     """
-    # pflag = True
-    pflag = False
-    if (dof > 4):
-        raise ValueError(" dof = ", dof, " is not implemented! Only dof = 1 or 2 or 3 or 4 is coded!")
+    if np.ndim(dh) == 0:
+        return (float(dh),) * dim
+    if len(dh) != dim:
+        raise ValueError("dh should be a float or a tuple of " + str(dim) + " element sizes, not: ", dh)
+    return tuple(float(x) for x in dh)
 
-    data_input = tf.convert_to_tensor(data_input, dtype=tf.float32)
-    if pflag: print('data_input', np.shape(data_input))
-
-    # --------------- Dirichlet data------------
-    dirichlet_data = data_input[:,:,:,0:dof]
-    if pflag: print('dirichlet_data', dirichlet_data[0,:,:,0])
+def ComputeNeumannEdgeResidualNodalData(neumann_x, neumann_y, dh, padding='SAME'):
+    """ 
+    Compute the nodal residual int (N^T h) dA of the Neumann BCs on the vertical edges (neumann_x) and the horizontal 
+    edges (neumann_y). All channels (dofs) are processed at once.
 
-    #--------------- Domain mask ------------------
-    # change actual dirichlet BCs to -2, the all -2 will be the domain
-    domain_mask = tf.where( dirichlet_data >= 0.0, tf.fill(tf.shape(dirichlet_data), -2.0), dirichlet_data)
-    # print('domain_mask', domain_mask[0,:,:,0])
-    domain_mask = tf.where( domain_mask < -1.0, tf.fill(tf.shape(domain_mask), 1.0), tf.fill(tf.shape(domain_mask), 0.0))
-    if pflag: print('domain_mask', domain_mask[0,:,:,0])
+    args:
+        neumann_x (tensor): scaled Neumann BCs [batch, node_height, node_width, c], assembled over vertical edges (node (i,j), (i+1,j))
+        neumann_y (tensor): scaled Neumann BCs [batch, node_height, node_width, c], assembled over horizontal edges (node (i,j), (i,j+1))
+        dh (float or tuple): element size, or (dx, dy). The vertical edges have the length dy, the horizontal edges dx.
+    return:
+        - nodal residual of the vertical edges [batch, node_height, node_width, c]
+        - nodal residual of the horizontal edges [batch, node_height, node_width, c]
+        - Neumann mask of neumann_x (1: BC, 0: no BC)
+        - Neumann mask of neumann_y (1: BC, 0: no BC)
+    """
+    if padding != 'SAME':
+        raise ValueError("Only padding = 'SAME' is implemented for the Neumann residual, not: ", padding)
 
-    #--------------- Neumann BCs ------------------
+    # scaled Neumann BCs in (0, 1] are BCs, <= 0 means no BC (Neumann BCs should not be smaller than 0, see check_bc_data())
     Neumann_max = 1.0
     Neumann_min = -1.0
-    neumann_data = data_input[:,:,:,dof:dof+dof]
-    if pflag: print('neumann_data', neumann_data[0,:,:,0])
-    if pflag: print('neumann_data(dof-1)', neumann_data[0,:,:,dof-1])
-
-    # #--------------- check Neumann BCs------------ !!!! should be checked at the very beginning of data.
-    # # is not allowed during tensor running/training 
-    # check_neumann = tf.multiply(neumann_data, domain_mask)
-    # if pflag: print('---check_neumann', check_neumann[0,:,:,0])
-    # if (tf.reduce_sum(check_neumann) == 0) :
-        # print("WARNING: no Neumann BCs is detected!")
-    # check_neumann = tf.where( check_neumann < 0.0, tf.fill(tf.shape(check_neumann), 1.0), tf.fill(tf.shape(check_neumann), 0.0))
-    # if pflag: print('check_neumann', check_neumann[0,:,:,0])
-    # if (tf.reduce_sum(check_neumann) < 0) :
-        # raise ValueError("Neumann BCs should NOT be smaller than zero (< 0). Consider use diffusivity or elastic constant to scale the data!")
-
-    #---------------- Neumann BCs-----------------
-    # Should consider the scaling as well.  Any mask will not work, as Neumann BCs can be smaller than 0.0
-    # Solution: Neumann BCs is not allowed to be smaller than 0 in the input data.
-
-    neumann_mask = tf.where( neumann_data <= 0.0, tf.fill(tf.shape(neumann_data), 0.0), tf.fill(tf.shape(neumann_data), 1.0))
-    if pflag: print('neumann_mask', neumann_mask[0,:,:,0])
-    if pflag: print('neumann_mask(dof-1)', neumann_mask[0,:,:,dof-1])
-    neumann_data = tf.multiply( neumann_data, neumann_mask)
-    if pflag: print('neumann_data', neumann_data[0,:,:,0])
-    if pflag: print('neumann_data(dof-1)', neumann_data[0,:,:,dof-1])
-
-    # The main idea is to form a element connection as for the bulk residual case.
-    # However, if the neumman BCs is location dependent, has both positive and negative 
-    # values, then, it is very challenging to make the following to work stably. 
-    # On the other hand, if we only consider the bulk region, then the neumman BCs is
-    # literally enforced through the residual form, but not explicitly. 
-    # Still, the following might still work.
-
-    # form dof-1 level horizontal element
-    # the padding zeros will helps to keep the location of surface node unchanged for the bottom edges
-    n1 = np.array([[1, 0], [0, 0]])
-    n1 = np.expand_dims(n1, axis=2)
-    n1 = np.expand_dims(n1, axis=3)
-    n2 = np.array([[0, 1], [0, 0]])
-    n2 = np.expand_dims(n2, axis=2)
-    n2 = np.expand_dims(n2, axis=3)
-
-    # form dof-1 level vertical element:
-    n3 = np.array([[1, 0], [0, 0]])
-    n3 = np.expand_dims(n3, axis=2)
-    n3 = np.expand_dims(n3, axis=3)
-    n4 = np.array([[0, 0], [1, 0]])
-    n4 = np.expand_dims(n4, axis=2)
-    n4 = np.expand_dims(n4, axis=3)
-
-
-    # create surface elements
-    if dof == 1:
-        # horizontal element
-        c_n1 = tf.nn.conv2d(neumann_data, n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data, n2, [1,1,1,1], padding)
-        elem_y = tf.concat([c_n1, c_n2], 3)
-
-        # vertical element
-        c_n3 = tf.nn.conv2d(neumann_data, n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data, n4, [1,1,1,1], padding)
-        elem_x = tf.concat([c_n3, c_n4], 3)
-
-        if pflag: print('elem_x', np.shape(elem_x))
-        if pflag: print('elem_x 1: ', elem_x[0,:,:,0])
-        if pflag: print('elem_x 2: ', elem_x[0,:,:,1])
-
-        if pflag: print('elem_y', np.shape(elem_y))
-        if pflag: print('elem_y 1: ', elem_y[0,:,:,0])
-        if pflag: print('elem_y 2: ', elem_y[0,:,:,1])
-    elif dof == 2:
-        neumann_data_1 = neumann_data[:,:,:,0:1]
-        neumann_data_2 = neumann_data[:,:,:,1:2]
-
-        c_n1 = tf.nn.conv2d(neumann_data_1, n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_1, n2, [1,1,1,1], padding)
-        elem_y_1 = tf.concat([c_n1, c_n2], 3)
-
-        c_n1 = tf.nn.conv2d(neumann_data_2, n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_2, n2, [1,1,1,1], padding)
-        elem_y_2 = tf.concat([c_n1, c_n2], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_1, n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_1, n4, [1,1,1,1], padding)
-        elem_x_1 = tf.concat([c_n3, c_n4], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_2, n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_2, n4, [1,1,1,1], padding)
-        elem_x_2 = tf.concat([c_n3, c_n4], 3)
-
-        if pflag: print('elem_y_1 ', np.shape(elem_y_1))
-        if pflag: print('elem_y_1 1: ', elem_y_1[0,:,:,0])
-        if pflag: print('elem_y_1 2: ', elem_y_1[0,:,:,1])
-        if pflag: print('elem_y_2 ', np.shape(elem_y_2))
-        if pflag: print('elem_y_2 1: ', elem_y_2[0,:,:,0])
-        if pflag: print('elem_y_2 2: ', elem_y_2[0,:,:,1])
-
-        if pflag: print('elem_x_1 ', np.shape(elem_x_1))
-        if pflag: print('elem_x_1 1: ', elem_x_1[0,:,:,0])
-        if pflag: print('elem_x_1 2: ', elem_x_1[0,:,:,1])
-        if pflag: print('elem_x_2 ', np.shape(elem_x_2))
-        if pflag: print('elem_x_2 1: ', elem_x_2[0,:,:,0])
-        if pflag: print('elem_x_2 2: ', elem_x_2[0,:,:,1])
-    elif dof == 3:
-        neumann_data_1 = neumann_data[:,:,:,0:1]
-        neumann_data_2 = neumann_data[:,:,:,1:2]
-        neumann_data_3 = neumann_data[:,:,:,2:3]
-
-        c_n1 = tf.nn.conv2d(neumann_data_1, n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_1, n2, [1,1,1,1], padding)
-        elem_y_1 = tf.concat([c_n1, c_n2], 3)
-
-        c_n1 = tf.nn.conv2d(neumann_data_2, n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_2, n2, [1,1,1,1], padding)
-        elem_y_2 = tf.concat([c_n1, c_n2], 3)
-
-        c_n1 = tf.nn.conv2d(neumann_data_3, n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_3, n2, [1,1,1,1], padding)
-        elem_y_3 = tf.concat([c_n1, c_n2], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_1, n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_1, n4, [1,1,1,1], padding)
-        elem_x_1 = tf.concat([c_n3, c_n4], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_2, n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_2, n4, [1,1,1,1], padding)
-        elem_x_2 = tf.concat([c_n3, c_n4], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_3, n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_3, n4, [1,1,1,1], padding)
-        elem_x_3 = tf.concat([c_n3, c_n4], 3)
-
-        if pflag: print('elem_y_1 ', np.shape(elem_y_1))
-        if pflag: print('elem_y_1 1: ', elem_y_1[0,:,:,0])
-        if pflag: print('elem_y_1 2: ', elem_y_1[0,:,:,1])
-        if pflag: print('elem_y_2 ', np.shape(elem_y_2))
-        if pflag: print('elem_y_2 1: ', elem_y_2[0,:,:,0])
-        if pflag: print('elem_y_2 2: ', elem_y_2[0,:,:,1])
-        if pflag: print('elem_y_3 ', np.shape(elem_y_3))
-        if pflag: print('elem_y_3 1: ', elem_y_3[0,:,:,0])
-        if pflag: print('elem_y_3 2: ', elem_y_3[0,:,:,1])
-
-        if pflag: print('elem_x_1 ', np.shape(elem_x_1))
-        if pflag: print('elem_x_1 1: ', elem_x_1[0,:,:,0])
-        if pflag: print('elem_x_1 2: ', elem_x_1[0,:,:,1])
-        if pflag: print('elem_x_2 ', np.shape(elem_x_2))
-        if pflag: print('elem_x_2 1: ', elem_x_2[0,:,:,0])
-        if pflag: print('elem_x_2 2: ', elem_x_2[0,:,:,1])
-        if pflag: print('elem_x_3 ', np.shape(elem_x_3))
-        if pflag: print('elem_x_3 1: ', elem_x_3[0,:,:,0])
-        if pflag: print('elem_x_3 2: ', elem_x_3[0,:,:,1])
-
-    elif dof == 4:
-        neumann_data_1 = neumann_data[:,:,:,0:1]
-        neumann_data_2 = neumann_data[:,:,:,1:2]
-        neumann_data_3 = neumann_data[:,:,:,2:3]
-        neumann_data_4 = neumann_data[:,:,:,2:3]
-
-        c_n1 = tf.nn.conv2d(neumann_data_1, n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_1, n2, [1,1,1,1], padding)
-        elem_y_1 = tf.concat([c_n1, c_n2], 3)
-
-        c_n1 = tf.nn.conv2d(neumann_data_2, n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_2, n2, [1,1,1,1], padding)
-        elem_y_2 = tf.concat([c_n1, c_n2], 3)
-
-        c_n1 = tf.nn.conv2d(neumann_data_3, n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_3, n2, [1,1,1,1], padding)
-        elem_y_3 = tf.concat([c_n1, c_n2], 3)
-
-        c_n1 = tf.nn.conv2d(neumann_data_4, n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_4, n2, [1,1,1,1], padding)
-        elem_y_4 = tf.concat([c_n1, c_n2], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_1, n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_1, n4, [1,1,1,1], padding)
-        elem_x_1 = tf.concat([c_n3, c_n4], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_2, n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_2, n4, [1,1,1,1], padding)
-        elem_x_2 = tf.concat([c_n3, c_n4], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_3, n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_3, n4, [1,1,1,1], padding)
-        elem_x_3 = tf.concat([c_n3, c_n4], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_4, n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_4, n4, [1,1,1,1], padding)
-        elem_x_4 = tf.concat([c_n3, c_n4], 3)
-
-
-
-    if dof == 1:
-        # create a mask to delete data that are not properly aligned
-        c_n1_mask = tf.nn.conv2d(neumann_mask, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask, n2, [1,1,1,1], padding)
-        elem_y_mask = tf.multiply(c_n1_mask, c_n2_mask)
-        if pflag: print('c_n1_mask: ', c_n1_mask[0,:,:,0])
-        if pflag: print('c_n2_mask: ', c_n2_mask[0,:,:,0])
-        if pflag: print('elem_y_mask: ', elem_y_mask[0,:,:,0])
-    
-        # create a mask to delete data that are not properly aligned
-        c_n3_mask = tf.nn.conv2d(neumann_mask, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask, n4, [1,1,1,1], padding)
-        elem_x_mask = tf.multiply(c_n3_mask, c_n4_mask)
-        if pflag: print('c_n3_mask: ', c_n3_mask[0,:,:,0])
-        if pflag: print('c_n4_mask: ', c_n4_mask[0,:,:,0])
-        if pflag: print('elem_x_mask: ', elem_x_mask[0,:,:,0])
-        # exit(0)
-    elif dof == 2:
-        # For the 3D case, it would be impossible to perform task like this.
-        # Thus, how to come up with a 3D implementation, or sparse pattern 
-        # would be extremely useful.
-
-        # create a mask to delete data that are not properly aligned
-        neumann_mask_1 = neumann_mask[:,:,:,0:1]
-        neumann_mask_2 = neumann_mask[:,:,:,1:2]
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_1, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_1, n2, [1,1,1,1], padding)
-        elem_y_mask_1 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        if pflag: print('c_n1_mask: ', c_n1_mask[0,:,:,0])
-        if pflag: print('c_n2_mask: ', c_n2_mask[0,:,:,0])
-        if pflag: print('elem_y_mask_1: ', elem_y_mask_1[0,:,:,0])
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_2, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_2, n2, [1,1,1,1], padding)
-        elem_y_mask_2 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        if pflag: print('c_n1_mask: ', c_n1_mask[0,:,:,0])
-        if pflag: print('c_n2_mask: ', c_n2_mask[0,:,:,0])
-        if pflag: print('elem_y_mask_2: ', elem_y_mask_2[0,:,:,0])
-
-    
-        # create a mask to delete data that are not properly aligned
-        c_n3_mask = tf.nn.conv2d(neumann_mask_1, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_1, n4, [1,1,1,1], padding)
-        elem_x_mask_1 = tf.multiply(c_n3_mask, c_n4_mask)
-        if pflag: print('c_n3_mask: ', c_n3_mask[0,:,:,0])
-        if pflag: print('c_n4_mask: ', c_n4_mask[0,:,:,0])
-        if pflag: print('elem_x_mask_1: ', elem_x_mask_1[0,:,:,0])
-
-        c_n3_mask = tf.nn.conv2d(neumann_mask_2, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_2, n4, [1,1,1,1], padding)
-        elem_x_mask_2 = tf.multiply(c_n3_mask, c_n4_mask)
-        if pflag: print('c_n3_mask: ', c_n3_mask[0,:,:,0])
-        if pflag: print('c_n4_mask: ', c_n4_mask[0,:,:,0])
-        if pflag: print('elem_x_mask_2: ', elem_x_mask_2[0,:,:,0])
-
-    elif dof == 3:
-
-        # create a mask to delete data that are not properly aligned
-        neumann_mask_1 = neumann_mask[:,:,:,0:1]
-        neumann_mask_2 = neumann_mask[:,:,:,1:2]
-        neumann_mask_3 = neumann_mask[:,:,:,2:3]
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_1, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_1, n2, [1,1,1,1], padding)
-        elem_y_mask_1 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        if pflag: print('c_n1_mask: ', c_n1_mask[0,:,:,0])
-        if pflag: print('c_n2_mask: ', c_n2_mask[0,:,:,0])
-        if pflag: print('elem_y_mask_1: ', elem_y_mask_1[0,:,:,0])
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_2, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_2, n2, [1,1,1,1], padding)
-        elem_y_mask_2 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        if pflag: print('c_n1_mask: ', c_n1_mask[0,:,:,0])
-        if pflag: print('c_n2_mask: ', c_n2_mask[0,:,:,0])
-        if pflag: print('elem_y_mask_2: ', elem_y_mask_2[0,:,:,0])
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_3, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_3, n2, [1,1,1,1], padding)
-        elem_y_mask_3 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        if pflag: print('c_n1_mask: ', c_n1_mask[0,:,:,0])
-        if pflag: print('c_n2_mask: ', c_n2_mask[0,:,:,0])
-        if pflag: print('elem_y_mask_3: ', elem_y_mask_3[0,:,:,0])
+    mask_x = tf.cast(neumann_x > 0.0, tf.float32)
+    mask_y = tf.cast(neumann_y > 0.0, tf.float32)
+    neumann_x = tf.multiply(neumann_x, mask_x)
+    neumann_y = tf.multiply(neumann_y, mask_y)
+
+    # surface elements: the 2nd node of a horizontal element is (i, j+1), of a vertical element (i+1, j). 
+    # The zero padding keeps the location of the surface nodes unchanged (same as conv2d with n1, n2, n3, n4 and 'SAME').
+    def next_node(data, axis):
+        if axis == 1:
+            return tf.pad(data[:,1:,:,:], [[0,0], [0,1], [0,0], [0,0]])
+        return tf.pad(data[:,:,1:,:], [[0,0], [0,0], [0,1], [0,0]])
+
+    # elem_x: (node 1, node 2) of the vertical elements, elem_y: of the horizontal elements
+    elem_x = [neumann_x, next_node(neumann_x, 1)]
+    elem_y = [neumann_y, next_node(neumann_y, 2)]
+    # delete data that are not properly aligned, i.e. only edges with both nodes on the Neumann BCs
+    elem_x_mask = tf.multiply(mask_x, next_node(mask_x, 1))
+    elem_y_mask = tf.multiply(mask_y, next_node(mask_y, 2))
+
+    # Scale the Neumann BC value back to the original one
+    # original scale in VtuDataGenerateFixedc.py: 
+    #   - data = (data + (self.upperlimit - self.lowerlimit) * 0.5 ) * 0.5
+    elem_x = [tf.multiply(2.0 * e - (Neumann_max - Neumann_min) * 0.5, elem_x_mask) for e in elem_x]
+    elem_y = [tf.multiply(2.0 * e - (Neumann_max - Neumann_min) * 0.5, elem_y_mask) for e in elem_y]
+
+    # int(N^T h) dA with 2 GPs: hbar at each GP from the nodal values, R_n = jxw * (hbar_1 N_1n + hbar_2 N_2n)
+    dx, dy = GetElementSize(dh)
+    def edge_residual(elem, edge_length):
+        N, B, jxw = Get1DGaussPointInfo(dh=edge_length, GPs=2, dof=1)
+        N = tf.get_static_value(N) # constant shape function values, also in graph mode
+        jxw = tf.get_static_value(jxw)[0] # both GPs have the same weight
+        hbar_gp1 = elem[0] * N[0,0] + elem[1] * N[0,1]
+        hbar_gp2 = elem[0] * N[1,0] + elem[1] * N[1,1]
+        return [jxw * (hbar_gp1 * N[0,n] + hbar_gp2 * N[1,n]) for n in range(0, 2)]
+
+    Rx = edge_residual(elem_x, dy)
+    Ry = edge_residual(elem_y, dx)
+
+    # element to nodal value: node 2 of the element (i, j) is the node (i+1, j) or (i, j+1)
+    Rx = Rx[0] + tf.roll(Rx[1], [1], [1])
+    Ry = Ry[0] + tf.roll(Ry[1], [1], [2])
+    return Rx, Ry, mask_x, mask_y
 
-    
-        # create a mask to delete data that are not properly aligned
-        c_n3_mask = tf.nn.conv2d(neumann_mask_1, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_1, n4, [1,1,1,1], padding)
-        elem_x_mask_1 = tf.multiply(c_n3_mask, c_n4_mask)
-        if pflag: print('c_n3_mask: ', c_n3_mask[0,:,:,0])
-        if pflag: print('c_n4_mask: ', c_n4_mask[0,:,:,0])
-        if pflag: print('elem_x_mask_1: ', elem_x_mask_1[0,:,:,0])
-
-        c_n3_mask = tf.nn.conv2d(neumann_mask_2, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_2, n4, [1,1,1,1], padding)
-        elem_x_mask_2 = tf.multiply(c_n3_mask, c_n4_mask)
-        if pflag: print('c_n3_mask: ', c_n3_mask[0,:,:,0])
-        if pflag: print('c_n4_mask: ', c_n4_mask[0,:,:,0])
-        if pflag: print('elem_x_mask_2: ', elem_x_mask_2[0,:,:,0])
-
-        c_n3_mask = tf.nn.conv2d(neumann_mask_3, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_3, n4, [1,1,1,1], padding)
-        elem_x_mask_3 = tf.multiply(c_n3_mask, c_n4_mask)
-        if pflag: print('c_n3_mask: ', c_n3_mask[0,:,:,0])
-        if pflag: print('c_n4_mask: ', c_n4_mask[0,:,:,0])
-        if pflag: print('elem_x_mask_3: ', elem_x_mask_3[0,:,:,0])
-
-    elif dof == 4:
-
-        # create a mask to delete data that are not properly aligned
-        neumann_mask_1 = neumann_mask[:,:,:,0:1]
-        neumann_mask_2 = neumann_mask[:,:,:,1:2]
-        neumann_mask_3 = neumann_mask[:,:,:,2:3]
-        neumann_mask_4 = neumann_mask[:,:,:,2:3]
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_1, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_1, n2, [1,1,1,1], padding)
-        elem_y_mask_1 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_2, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_2, n2, [1,1,1,1], padding)
-        elem_y_mask_2 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_3, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_3, n2, [1,1,1,1], padding)
-        elem_y_mask_3 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_4, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_4, n2, [1,1,1,1], padding)
-        elem_y_mask_4 = tf.multiply(c_n1_mask, c_n2_mask)
 
-    
-        # create a mask to delete data that are not properly aligned
-        c_n3_mask = tf.nn.conv2d(neumann_mask_1, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_1, n4, [1,1,1,1], padding)
-        elem_x_mask_1 = tf.multiply(c_n3_mask, c_n4_mask)
-
-        c_n3_mask = tf.nn.conv2d(neumann_mask_2, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_2, n4, [1,1,1,1], padding)
-        elem_x_mask_2 = tf.multiply(c_n3_mask, c_n4_mask)
-
-        c_n3_mask = tf.nn.conv2d(neumann_mask_3, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_3, n4, [1,1,1,1], padding)
-        elem_x_mask_3 = tf.multiply(c_n3_mask, c_n4_mask)
-
-        c_n3_mask = tf.nn.conv2d(neumann_mask_4, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_4, n4, [1,1,1,1], padding)
-        elem_x_mask_4 = tf.multiply(c_n3_mask, c_n4_mask)
-    
-    
-
-
-    if dof == 1:
-        # Scale the Neumann BC value back to the original one
-        # original scale in VtuDataGenerateFixedc.py: 
-        #   - data = (data + (self.upperlimit - self.lowerlimit) * 0.5 ) * 0.5
-        elem_x = 2.0 * elem_x - (Neumann_max - Neumann_min) * 0.5
-        elem_y = 2.0 * elem_y - (Neumann_max - Neumann_min) * 0.5
-
-        clean_elem_y = tf.multiply(elem_y, elem_y_mask)
-        clean_elem_x = tf.multiply(elem_x, elem_x_mask)
-        if pflag: print('clean_elem_y (node1, 2)', np.shape(clean_elem_y), clean_elem_y[0,:,:,0], clean_elem_y[0,:,:,1])
-        if pflag: print('clean_elem_x (node1, 2)', np.shape(clean_elem_x), clean_elem_x[0,:,:,0], clean_elem_x[0,:,:,1])
-    elif dof == 2:
-        elem_x_1 = 2.0 * elem_x_1 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_1 = 2.0 * elem_y_1 - (Neumann_max - Neumann_min) * 0.5
-        elem_x_2 = 2.0 * elem_x_2 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_2 = 2.0 * elem_y_2 - (Neumann_max - Neumann_min) * 0.5
-
-        clean_elem_y_1 = tf.multiply(elem_y_1, elem_y_mask_1)
-        clean_elem_x_1 = tf.multiply(elem_x_1, elem_x_mask_1)
-        clean_elem_y_2 = tf.multiply(elem_y_2, elem_y_mask_2)
-        clean_elem_x_2 = tf.multiply(elem_x_2, elem_x_mask_2)
-
-        if pflag: print('clean_elem_y_1 (node1, 2)', np.shape(clean_elem_y_1), clean_elem_y_1[0,:,:,0], clean_elem_y_1[0,:,:,1])
-        if pflag: print('clean_elem_x_1 (node1, 2)', np.shape(clean_elem_x_1), clean_elem_x_1[0,:,:,0], clean_elem_x_1[0,:,:,1])
-        if pflag: print('clean_elem_y_2 (node1, 2)', np.shape(clean_elem_y_2), clean_elem_y_2[0,:,:,0], clean_elem_y_2[0,:,:,1])
-        if pflag: print('clean_elem_x_2 (node1, 2)', np.shape(clean_elem_x_2), clean_elem_x_2[0,:,:,0], clean_elem_x_2[0,:,:,1])
-    elif dof == 3:
-        elem_x_1 = 2.0 * elem_x_1 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_1 = 2.0 * elem_y_1 - (Neumann_max - Neumann_min) * 0.5
-        elem_x_2 = 2.0 * elem_x_2 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_2 = 2.0 * elem_y_2 - (Neumann_max - Neumann_min) * 0.5
-        elem_x_3 = 2.0 * elem_x_3 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_3 = 2.0 * elem_y_3 - (Neumann_max - Neumann_min) * 0.5
-
-        clean_elem_y_1 = tf.multiply(elem_y_1, elem_y_mask_1)
-        clean_elem_x_1 = tf.multiply(elem_x_1, elem_x_mask_1)
-        clean_elem_y_2 = tf.multiply(elem_y_2, elem_y_mask_2)
-        clean_elem_x_2 = tf.multiply(elem_x_2, elem_x_mask_2)
-        clean_elem_y_3 = tf.multiply(elem_y_3, elem_y_mask_3)
-        clean_elem_x_3 = tf.multiply(elem_x_3, elem_x_mask_3)
-
-        if pflag: print('clean_elem_y_1 (node1, 2)', np.shape(clean_elem_y_1), clean_elem_y_1[0,:,:,0], clean_elem_y_1[0,:,:,1])
-        if pflag: print('clean_elem_x_1 (node1, 2)', np.shape(clean_elem_x_1), clean_elem_x_1[0,:,:,0], clean_elem_x_1[0,:,:,1])
-        if pflag: print('clean_elem_y_2 (node1, 2)', np.shape(clean_elem_y_2), clean_elem_y_2[0,:,:,0], clean_elem_y_2[0,:,:,1])
-        if pflag: print('clean_elem_x_2 (node1, 2)', np.shape(clean_elem_x_2), clean_elem_x_2[0,:,:,0], clean_elem_x_2[0,:,:,1])
-        if pflag: print('clean_elem_y_3 (node1, 2)', np.shape(clean_elem_y_3), clean_elem_y_3[0,:,:,0], clean_elem_y_3[0,:,:,1])
-        if pflag: print('clean_elem_x_3 (node1, 2)', np.shape(clean_elem_x_3), clean_elem_x_3[0,:,:,0], clean_elem_x_3[0,:,:,1])
-
-    elif dof == 4:
-        elem_x_1 = 2.0 * elem_x_1 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_1 = 2.0 * elem_y_1 - (Neumann_max - Neumann_min) * 0.5
-        elem_x_2 = 2.0 * elem_x_2 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_2 = 2.0 * elem_y_2 - (Neumann_max - Neumann_min) * 0.5
-        elem_x_3 = 2.0 * elem_x_3 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_3 = 2.0 * elem_y_3 - (Neumann_max - Neumann_min) * 0.5
-        elem_x_4 = 2.0 * elem_x_4 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_4 = 2.0 * elem_y_4 - (Neumann_max - Neumann_min) * 0.5
-
-        clean_elem_y_1 = tf.multiply(elem_y_1, elem_y_mask_1)
-        clean_elem_x_1 = tf.multiply(elem_x_1, elem_x_mask_1)
-        clean_elem_y_2 = tf.multiply(elem_y_2, elem_y_mask_2)
-        clean_elem_x_2 = tf.multiply(elem_x_2, elem_x_mask_2)
-        clean_elem_y_3 = tf.multiply(elem_y_3, elem_y_mask_3)
-        clean_elem_x_3 = tf.multiply(elem_x_3, elem_x_mask_3)
-        clean_elem_y_4 = tf.multiply(elem_y_4, elem_y_mask_4)
-        clean_elem_x_4 = tf.multiply(elem_x_4, elem_x_mask_4)
-
-
-
-    if dof == 1 :
-        shape=elem_x.get_shape()[0:].as_list()    
-        new_shape = shape[1:3]
-        if pflag: print('new_shape:', new_shape)
-    elif dof == 2 :
-        shape=elem_x_1.get_shape()[0:].as_list()    
-        new_shape = shape[1:3]
-        if pflag: print('new_shape:', new_shape)
-    elif dof == 3 :
-        shape=elem_x_1.get_shape()[0:].as_list()    
-        new_shape = shape[1:3]
-        if pflag: print('new_shape:', new_shape)
-    elif dof == 4 :
-        shape=elem_x_1.get_shape()[0:].as_list()    
-        new_shape = shape[1:3]
-
-
-    # get the 1D info, and then perform a N h calculation
-    # and then unfold everything to the nodal value
-    # 
-    N, B, jxw = Get1DGaussPointInfo(dh=dh, GPs=2, dof=1)
-    if pflag: print("N", np.shape(N))
-    if pflag: print("B", np.shape(B))
-    if pflag: print("jxw", jxw)
-
-    if dof == 1:
-        elem_x2 = tf.reshape(clean_elem_x,[-1, 2])
-        elem_y2 = tf.reshape(clean_elem_y,[-1, 2])
-
-        if pflag: print('elem_x2', np.shape(elem_x2), elem_x2)
-        if pflag: print('elem_y2', np.shape(elem_y2), elem_y2)
-        # exit(0)
-
-    elif dof == 2:
-        elem_x2_1 = tf.reshape(clean_elem_x_1,[-1, 2])
-        elem_y2_1 = tf.reshape(clean_elem_y_1,[-1, 2])
-        elem_x2_2 = tf.reshape(clean_elem_x_2,[-1, 2])
-        elem_y2_2 = tf.reshape(clean_elem_y_2,[-1, 2])
-
-        if pflag: print('elem_x2_1', np.shape(elem_x2_1), elem_x2_1)
-        if pflag: print('elem_y2_1', np.shape(elem_y2_1), elem_y2_1)
-        if pflag: print('elem_x2_2', np.shape(elem_x2_2), elem_x2_2)
-        if pflag: print('elem_y2_2', np.shape(elem_y2_2), elem_y2_2)
-    elif dof == 3:
-        elem_x2_1 = tf.reshape(clean_elem_x_1,[-1, 2])
-        elem_y2_1 = tf.reshape(clean_elem_y_1,[-1, 2])
-        elem_x2_2 = tf.reshape(clean_elem_x_2,[-1, 2])
-        elem_y2_2 = tf.reshape(clean_elem_y_2,[-1, 2])
-        elem_x2_3 = tf.reshape(clean_elem_x_3,[-1, 2])
-        elem_y2_3 = tf.reshape(clean_elem_y_3,[-1, 2])
-
-        if pflag: print('elem_x2_1', np.shape(elem_x2_1), elem_x2_1)
-        if pflag: print('elem_y2_1', np.shape(elem_y2_1), elem_y2_1)
-        if pflag: print('elem_x2_2', np.shape(elem_x2_2), elem_x2_2)
-        if pflag: print('elem_y2_2', np.shape(elem_y2_2), elem_y2_2)
-        if pflag: print('elem_x2_3', np.shape(elem_x2_3), elem_x2_3)
-        if pflag: print('elem_y2_3', np.shape(elem_y2_3), elem_y2_3)
-    elif dof == 4:
-        elem_x2_1 = tf.reshape(clean_elem_x_1,[-1, 2])
-        elem_y2_1 = tf.reshape(clean_elem_y_1,[-1, 2])
-        elem_x2_2 = tf.reshape(clean_elem_x_2,[-1, 2])
-        elem_y2_2 = tf.reshape(clean_elem_y_2,[-1, 2])
-        elem_x2_3 = tf.reshape(clean_elem_x_3,[-1, 2])
-        elem_y2_3 = tf.reshape(clean_elem_y_3,[-1, 2])
-        elem_x2_4 = tf.reshape(clean_elem_x_4,[-1, 2])
-        elem_y2_4 = tf.reshape(clean_elem_y_4,[-1, 2])
-
-
-    if dof == 1:
-        # int(N^T h) dA: h是nodal value，必须通过shape fcn来分析正确的值, 但是它也是scale了的值， 
-        # Calculate the hbar at the GPs based on nodal info.
-        # GP1
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2, N[0,:]) 
-        # GP2
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2, N[1,:]) 
-        # GP1
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2, N[0,:]) 
-        # GP2
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        # if pflag: print('elem_x2_hbar_gp1', np.shape(elem_x2_hbar_gp1),tf.reshape(elem_x2_hbar_gp1, new_shape)) # work for [1, 16, 16, 1], but not [8, 16, 16, 1]
-        # if pflag: print('elem_x2_hbar_gp2', np.shape(elem_x2_hbar_gp2),tf.reshape(elem_x2_hbar_gp2, new_shape))
-        # if pflag: print('elem_y2_hbar_gp1', np.shape(elem_y2_hbar_gp1),tf.reshape(elem_y2_hbar_gp1, new_shape))
-        # if pflag: print('elem_y2_hbar_gp2', np.shape(elem_y2_hbar_gp2),tf.reshape(elem_y2_hbar_gp2, new_shape))
-
-        if pflag: print("N1", N[0,:])
-        if pflag: print("N2", N[1,:])
-
-        #-------------------- WARNING --------------------------
-        # Since here we start to distinguish x-, y- traction/flux, if the residual contains
-        # the gradient term, then we can use different B function for either x-direction
-        # or reversed y-direction as the operator to calculate the residual on the edge.
-        # For now, we are good.
-        #
-        #---------------- END OF WARNING -----------------------
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        # print('Rx1', np.shape(Rx1), Rx1*jxw)
-        # print('Rx2', np.shape(Rx2), Rx2*jxw)
-        # print('Ry1', np.shape(Ry1), Ry1*jxw)
-        # print('Ry2', np.shape(Ry2), Ry2*jxw)
-        Rx = jxw * (Rx1 + Rx2)
-        Ry = jxw * (Ry1 + Ry2)
-
-        if pflag: print('jxw', jxw)
-        if pflag: print('elem_x2_hbar_gp1', elem_x2_hbar_gp1)
-        # if pflag: print(N[0:1, :])
-
-        # element level residual for traction in either x or y direction
-        Rx = tf.reshape(Rx, [-1, new_shape[0], new_shape[1], 2])
-        Ry = tf.reshape(Ry, [-1, new_shape[0], new_shape[1], 2])
-
-        if pflag: print('Rx1', np.shape(Rx), Rx[0,:,:,0])
-        if pflag: print('Rx2', np.shape(Rx), Rx[0,:,:,1])
-        if pflag: print('Ry1', np.shape(Ry), Ry[0,:,:,0])
-        if pflag: print('Ry2', np.shape(Ry), Ry[0,:,:,1])
-    elif dof == 2:
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_1, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_1, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_1, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_1, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-        if pflag: print('elem_x2_hbar_gp1', np.shape(elem_x2_hbar_gp1),tf.reshape(elem_x2_hbar_gp1, new_shape))
-        if pflag: print('elem_x2_hbar_gp2', np.shape(elem_x2_hbar_gp2),tf.reshape(elem_x2_hbar_gp2, new_shape))
-        if pflag: print('elem_y2_hbar_gp1', np.shape(elem_y2_hbar_gp1),tf.reshape(elem_y2_hbar_gp1, new_shape))
-        if pflag: print('elem_y2_hbar_gp2', np.shape(elem_y2_hbar_gp2),tf.reshape(elem_y2_hbar_gp2, new_shape))
-
-        if pflag: print("N1", N[0,:])
-        if pflag: print("N2", N[1,:])
-
-        #-------------------- WARNING --------------------------
-        # Since here we start to distinguish x-, y- traction/flux, if the residual contains
-        # the gradient term, then we can use different B function for either x-direction
-        # or reversed y-direction as the operator to calculate the residual on the edge.
-        # For now, we are good.
-        #
-        #---------------- END OF WARNING -----------------------
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_1 = jxw * (Rx1 + Rx2)
-        Ry_1 = jxw * (Ry1 + Ry2)
-
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_2, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_2, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_2, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_2, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_2 = jxw * (Rx1 + Rx2)
-        Ry_2 = jxw * (Ry1 + Ry2)
-
-        # element level residual for traction in either x or y direction
-        Rx_1 = tf.reshape(Rx_1, [-1, new_shape[0], new_shape[1], 2])
-        Ry_1 = tf.reshape(Ry_1, [-1, new_shape[0], new_shape[1], 2])
-        Rx_2 = tf.reshape(Rx_2, [-1, new_shape[0], new_shape[1], 2])
-        Ry_2 = tf.reshape(Ry_2, [-1, new_shape[0], new_shape[1], 2])
-
-        if pflag: print('Rx1_1', np.shape(Rx_1), Rx_1[0,:,:,0])
-        if pflag: print('Rx2_1', np.shape(Rx_1), Rx_1[0,:,:,1])
-        if pflag: print('Ry1_1', np.shape(Ry_1), Ry_1[0,:,:,0])
-        if pflag: print('Ry2_1', np.shape(Ry_1), Ry_1[0,:,:,1])
-        if pflag: print('Rx1_2', np.shape(Rx_2), Rx_2[0,:,:,0])
-        if pflag: print('Rx2_2', np.shape(Rx_2), Rx_2[0,:,:,1])
-        if pflag: print('Ry1_2', np.shape(Ry_2), Ry_2[0,:,:,0])
-        if pflag: print('Ry2_2', np.shape(Ry_2), Ry_2[0,:,:,1])
-    elif dof == 3:
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_1, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_1, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_1, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_1, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-        if pflag: print('elem_x2_hbar_gp1', np.shape(elem_x2_hbar_gp1),tf.reshape(elem_x2_hbar_gp1, new_shape))
-        if pflag: print('elem_x2_hbar_gp2', np.shape(elem_x2_hbar_gp2),tf.reshape(elem_x2_hbar_gp2, new_shape))
-        if pflag: print('elem_y2_hbar_gp1', np.shape(elem_y2_hbar_gp1),tf.reshape(elem_y2_hbar_gp1, new_shape))
-        if pflag: print('elem_y2_hbar_gp2', np.shape(elem_y2_hbar_gp2),tf.reshape(elem_y2_hbar_gp2, new_shape))
-
-        if pflag: print("N1", N[0,:])
-        if pflag: print("N2", N[1,:])
-
-        #-------------------- WARNING --------------------------
-        # Since here we start to distinguish x-, y- traction/flux, if the residual contains
-        # the gradient term, then we can use different B function for either x-direction
-        # or reversed y-direction as the operator to calculate the residual on the edge.
-        # For now, we are good.
-        #
-        #---------------- END OF WARNING -----------------------
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_1 = jxw * (Rx1 + Rx2)
-        Ry_1 = jxw * (Ry1 + Ry2)
-
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_2, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_2, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_2, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_2, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_2 = jxw * (Rx1 + Rx2)
-        Ry_2 = jxw * (Ry1 + Ry2)
-
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_3, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_3, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_3, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_3, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_3 = jxw * (Rx1 + Rx2)
-        Ry_3 = jxw * (Ry1 + Ry2)
-
-
-        # element level residual for traction in either x or y direction
-        Rx_1 = tf.reshape(Rx_1, [-1, new_shape[0], new_shape[1], 2])
-        Ry_1 = tf.reshape(Ry_1, [-1, new_shape[0], new_shape[1], 2])
-        Rx_2 = tf.reshape(Rx_2, [-1, new_shape[0], new_shape[1], 2])
-        Ry_2 = tf.reshape(Ry_2, [-1, new_shape[0], new_shape[1], 2])
-        Rx_3 = tf.reshape(Rx_3, [-1, new_shape[0], new_shape[1], 2])
-        Ry_3 = tf.reshape(Ry_3, [-1, new_shape[0], new_shape[1], 2])
-
-        if pflag: print('Rx1_1', np.shape(Rx_1), Rx_1[0,:,:,0])
-        if pflag: print('Rx2_1', np.shape(Rx_1), Rx_1[0,:,:,1])
-        if pflag: print('Ry1_1', np.shape(Ry_1), Ry_1[0,:,:,0])
-        if pflag: print('Ry2_1', np.shape(Ry_1), Ry_1[0,:,:,1])
-        if pflag: print('Rx1_2', np.shape(Rx_2), Rx_2[0,:,:,0])
-        if pflag: print('Rx2_2', np.shape(Rx_2), Rx_2[0,:,:,1])
-        if pflag: print('Ry1_2', np.shape(Ry_2), Ry_2[0,:,:,0])
-        if pflag: print('Ry2_2', np.shape(Ry_2), Ry_2[0,:,:,1])
-        if pflag: print('Rx1_3', np.shape(Rx_3), Rx_3[0,:,:,0])
-        if pflag: print('Rx2_3', np.shape(Rx_3), Rx_3[0,:,:,1])
-        if pflag: print('Ry1_3', np.shape(Ry_3), Ry_3[0,:,:,0])
-        if pflag: print('Ry2_3', np.shape(Ry_3), Ry_3[0,:,:,1])
-    elif dof == 4:
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_1, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_1, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_1, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_1, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_1 = jxw * (Rx1 + Rx2)
-        Ry_1 = jxw * (Ry1 + Ry2)
-
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_2, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_2, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_2, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_2, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_2 = jxw * (Rx1 + Rx2)
-        Ry_2 = jxw * (Ry1 + Ry2)
-
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_3, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_3, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_3, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_3, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_3 = jxw * (Rx1 + Rx2)
-        Ry_3 = jxw * (Ry1 + Ry2)
-
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_4, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_4, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_4, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_4, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_4 = jxw * (Rx1 + Rx2)
-        Ry_4 = jxw * (Ry1 + Ry2)
-
-        # element level residual for traction in either x or y direction
-        Rx_1 = tf.reshape(Rx_1, [-1, new_shape[0], new_shape[1], 2])
-        Ry_1 = tf.reshape(Ry_1, [-1, new_shape[0], new_shape[1], 2])
-        Rx_2 = tf.reshape(Rx_2, [-1, new_shape[0], new_shape[1], 2])
-        Ry_2 = tf.reshape(Ry_2, [-1, new_shape[0], new_shape[1], 2])
-        Rx_3 = tf.reshape(Rx_3, [-1, new_shape[0], new_shape[1], 2])
-        Ry_3 = tf.reshape(Ry_3, [-1, new_shape[0], new_shape[1], 2])
-        Rx_4 = tf.reshape(Rx_4, [-1, new_shape[0], new_shape[1], 2])
-        Ry_4 = tf.reshape(Ry_4, [-1, new_shape[0], new_shape[1], 2])
-
-
-
-    if dof == 1:
-        c_x1 = Rx[:,:,:,0:1]
-        c_x2 = tf.roll(Rx[:,:,:,1:2], [1], [1])
-
-        # on 2020-07-16, was not sure, why this is not shift to the row axis to get nodal value. Right now, it's still nodal information 
-
-        c_y1 = Ry[:,:,:,0:1]
-        c_y2 = tf.roll(Ry[:,:,:,1:2], [1], [2])
-        if pflag: print('Rx 1 (before): ', Rx[0,:,:,0])
-        if pflag: print('Rx 1 (after ): ', c_x1[0,:,:,0])
-        if pflag: print('Rx 2 (before): ', Rx[0,:,:,1])
-        if pflag: print('Rx 2 (after ): ', c_x2[0,:,:,0])
-
-        if pflag: print('Ry 1 (before): ', Ry[0,:,:,0])
-        if pflag: print('Ry 1 (after ): ', c_y1[0,:,:,0])
-        if pflag: print('Ry 2 (before): ', Ry[0,:,:,1])
-        if pflag: print('Ry 2 (after ): ', c_y2[0,:,:,0])
-
-        Rx = c_x1 + c_x2
-        Ry = c_y1 + c_y2
-        # Add on 2020-07-16. Note on 2020-07-17, not working well
-        # Rx = tf.roll(Rx[:,:,:,0:1], [1], [2])
-        # Ry = tf.roll(Ry[:,:,:,0:1], [1], [1])
-        #---------------------
-        if pflag: print('Pay attention to potential errors here')
-        if pflag: print('Rx : ', Rx[0,:,:,0])
-        if pflag: print('Ry : ', Ry[0,:,:,0])
-    elif dof == 2:
-        c_x1 = Rx_1[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_1[:,:,:,1:2], [1], [1])
-
-        c_y1 = Ry_1[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_1[:,:,:,1:2], [1], [2])
-
-        Rx_1 = c_x1 + c_x2
-        Ry_1 = c_y1 + c_y2
-        if pflag: print('Rx_1 : ', Rx_1[0,:,:,0])
-        if pflag: print('Ry_1 : ', Ry_1[0,:,:,0])
-
-        c_x1 = Rx_2[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_2[:,:,:,1:2], [1], [1])
-
-        c_y1 = Ry_2[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_2[:,:,:,1:2], [1], [2])
-
-        Rx_2 = c_x1 + c_x2
-        Ry_2 = c_y1 + c_y2
-        if pflag: print('Rx_2 : ', Rx_2[0,:,:,0])
-        if pflag: print('Ry_2 : ', Ry_2[0,:,:,0])
-        if pflag: print('Pay attention to potential errors here')
-
-    elif dof == 3:
-        c_x1 = Rx_1[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_1[:,:,:,1:2], [1], [1])
-
-        c_y1 = Ry_1[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_1[:,:,:,1:2], [1], [2])
-
-        Rx_1 = c_x1 + c_x2
-        Ry_1 = c_y1 + c_y2
-        if pflag: print('Rx_1 : ', Rx_1[0,:,:,0])
-        if pflag: print('Ry_1 : ', Ry_1[0,:,:,0])
-
-        c_x1 = Rx_2[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_2[:,:,:,1:2], [1], [1])
-
-        c_y1 = Ry_2[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_2[:,:,:,1:2], [1], [2])
-
-        Rx_2 = c_x1 + c_x2
-        Ry_2 = c_y1 + c_y2
-        if pflag: print('Rx_2 : ', Rx_2[0,:,:,0])
-        if pflag: print('Ry_2 : ', Ry_2[0,:,:,0])
-        if pflag: print('Pay attention to potential errors here')
-
-        c_x1 = Rx_3[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_3[:,:,:,1:2], [1], [1])
-
-        c_y1 = Ry_3[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_3[:,:,:,1:2], [1], [2])
-
-        Rx_3 = c_x1 + c_x2
-        Ry_3 = c_y1 + c_y2
-        if pflag: print('Rx_3 : ', Rx_3[0,:,:,0])
-        if pflag: print('Ry_3 : ', Ry_3[0,:,:,0])
-        if pflag: print('Pay attention to potential errors here')
-    elif dof == 4:
-        c_x1 = Rx_1[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_1[:,:,:,1:2], [1], [1])
-
-        c_y1 = Ry_1[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_1[:,:,:,1:2], [1], [2])
-
-        Rx_1 = c_x1 + c_x2
-        Ry_1 = c_y1 + c_y2
-
-        c_x1 = Rx_2[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_2[:,:,:,1:2], [1], [1])
-
-        c_y1 = Ry_2[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_2[:,:,:,1:2], [1], [2])
-
-        Rx_2 = c_x1 + c_x2
-        Ry_2 = c_y1 + c_y2
-
-        c_x1 = Rx_3[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_3[:,:,:,1:2], [1], [1])
-
-        c_y1 = Ry_3[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_3[:,:,:,1:2], [1], [2])
-
-        Rx_3 = c_x1 + c_x2
-        Ry_3 = c_y1 + c_y2
-
-        c_x1 = Rx_4[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_4[:,:,:,1:2], [1], [1])
-
-        c_y1 = Ry_4[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_4[:,:,:,1:2], [1], [2])
-
-        Rx_4 = c_x1 + c_x2
-        Ry_4 = c_y1 + c_y2
+def ComputeNeumannBoundaryResidualNodalData(data_input, dh, dof, padding='SAME'):
+    """ 
+    Compute the residual on the Neumann BCs.  The implementation is based on Neumann BCs is scaled between (-1, 1), and Neumann condition should be always > 0 in the domain region. Raise value error if negative value is detected
 
+    Each Neumann channel is used for both the vertical and the horizontal edges. Works for any dof.
 
-    if dof == 1 :
-        R = Rx + Ry
-        R = tf.multiply(R, neumann_mask) # remove other edge left R due to conv operation: do test edge (1,3) and (2,4)
-        if pflag: print('R: ', np.shape(R), R[0,:,:,0])
-        # R = tf.reverse(R, [1]) # disabled on 2020-07-16
-        if pflag: print('R: ', np.shape(R), R[0,:,:,0])
-    elif dof == 2:
-        # R for dof=x
-        R_1 = Rx_1 + Ry_1
-        if pflag: print('R_1: ', np.shape(R_1), R_1[0,:,:,0])
-        # R for dof=y
-        R_2 = Rx_2 + Ry_2
-        if pflag: print('R_2: ', np.shape(R_2), R_2[0,:,:,0])
-
-        R = tf.concat([R_1, R_2], axis=3)
-        R = tf.multiply(R, neumann_mask) # remove other edge left R due to conv operation: do test edge (1,3) and (2,4)
-        # R = tf.reverse(R, [1]) # disabled on 2020-07-22
-        if pflag: print('R: ', np.shape(R), R[0,:,:,0], R[0,:,:,1])
-    elif dof == 3:
-        # R for dof=x
-        R_1 = Rx_1 + Ry_1
-        if pflag: print('R_1: ', np.shape(R_1), R_1[0,:,:,0])
-        # R for dof=y
-        R_2 = Rx_2 + Ry_2
-        if pflag: print('R_2: ', np.shape(R_2), R_2[0,:,:,0])
-
-        R_3 = Rx_3 + Ry_3
-        if pflag: print('R_3: ', np.shape(R_3), R_3[0,:,:,0])
-
-        R = tf.concat([R_1, R_2, R_3], axis=3)
-        R = tf.multiply(R, neumann_mask) # remove other edge left R due to conv operation: do test edge (1,3) and (2,4)
-        # R = tf.reverse(R, [1]) # disabled on 2020-07-22
-        if pflag: print('R: ', np.shape(R), R[0,:,:,0], R[0,:,:,1], R[0,:,:,2])
-    elif dof == 4:
-        # R for dof=x
-        R_1 = Rx_1 + Ry_1
-        # R for dof=y
-        R_2 = Rx_2 + Ry_2
-
-        R_3 = Rx_3 + Ry_3
-
-        R_4 = Rx_4 + Ry_4
-        R = tf.concat([R_1, R_2, R_3, R_4], axis=3)
-        R = tf.multiply(R, neumann_mask) # remove other edge left R due to conv operation: do test edge (1,3) and (2,4)
-        if pflag: print('R: ', np.shape(R), R[0,:,:,0], R[0,:,:,1], R[0,:,:,2], R[0,:,:,3])
-
-    # exit(0)
+    args:
+        data_input (numpy array): size of [batch, node_height, node_width, dof*2]
+        dof (int): dof per node
+        dh (float or tuple): element size, or (dx, dy) for a rectangular grid
+    return:
+        numpy array: nodal Neumann residual value with size of [batch, node_height, node_width, dof]
+    """
+    data_input = tf.convert_to_tensor(data_input, dtype=tf.float32)
+    neumann_data = data_input[:,:,:,dof:dof+dof]
 
+    Rx, Ry, neumann_mask, _ = ComputeNeumannEdgeResidualNodalData(neumann_data, neumann_data, dh=dh, padding=padding)
+    R = Rx + Ry
+    R = tf.multiply(R, neumann_mask) # remove other edge left R due to conv operation: do test edge (1,3) and (2,4)
     return R
 
+
 def ComputeNeumannBoundaryResidualNodalDataNew(data_input, dh, dof, padding='SAME'):
     """ 
     Compute the residual on the Neumann BCs.  The implementation is based on Neumann BCs is scaled between (-1, 1), and Neumann condition should be always > 0 in the domain region. Raise value error if negative value is detected
 
+    Two Neumann channels per dof: t_x on the vertical edges and t_y on the horizontal edges. Works for any dof.
+
     args:
-        data_input (numpy array): size of [batch, node_height, node_width, dof*3]
+        data_input (numpy array): size of [batch, node_height, node_width, dof*3], [Dirichlet (dof), t_x (dof), t_y (dof)]
         dof (int): dof per node
-        dh (float): element size
+        dh (float or tuple): element size, or (dx, dy) for a rectangular grid
     return:
         numpy array: nodal Neumann residual value with size of [batch, node_height, node_width, dof]
-
-    todo:
-        make this function to work with (1S, 1V), 2S, 1V1S, 3S, 2V, etc.
-
-        loop over each dof, instead of implementing different dof opt.
     """
-    # pflag = True
-    pflag = False
-    if (dof > 4):
-        raise ValueError(" dof = ", dof, " is not implemented! Only dof = 1 or 2 or 3 or 4 is coded!")
-
     data_input = tf.convert_to_tensor(data_input, dtype=tf.float32)
-    if pflag: print('data_input', np.shape(data_input))
-
-    # --------------- Dirichlet data------------
-    dirichlet_data = data_input[:,:,:,0:dof]
-    if pflag: print('dirichlet_data', dirichlet_data[0,:,:,0])
-
-    #--------------- Domain mask ------------------
-    # change actual dirichlet BCs to -2, the all -2 will be the domain
-    domain_mask = tf.where( dirichlet_data >= 0.0, tf.fill(tf.shape(dirichlet_data), -2.0), dirichlet_data)
-    # print('domain_mask', domain_mask[0,:,:,0])
-    domain_mask = tf.where( domain_mask < -1.0, tf.fill(tf.shape(domain_mask), 1.0), tf.fill(tf.shape(domain_mask), 0.0))
-    if pflag: print('domain_mask', domain_mask[0,:,:,0])
-
-    #--------------- Neumann BCs ------------------
-    Neumann_max = 1.0
-    Neumann_min = -1.0
-    neumann_data = data_input[:,:,:,dof:dof+dof+dof]
-    if pflag: print('neumann_data', neumann_data[0,:,:,0])
-    if pflag: print('neumann_data(dof-1)', neumann_data[0,:,:,1])
-
-    # #--------------- check Neumann BCs------------ !!!! should be checked at the very beginning of data.
-    # # is not allowed during tensor running/training 
-    # check_neumann = tf.multiply(neumann_data, domain_mask)
-    # if pflag: print('---check_neumann', check_neumann[0,:,:,0])
-    # if (tf.reduce_sum(check_neumann) == 0) :
-        # print("WARNING: no Neumann BCs is detected!")
-    # check_neumann = tf.where( check_neumann < 0.0, tf.fill(tf.shape(check_neumann), 1.0), tf.fill(tf.shape(check_neumann), 0.0))
-    # if pflag: print('check_neumann', check_neumann[0,:,:,0])
-    # if (tf.reduce_sum(check_neumann) < 0) :
-        # raise ValueError("Neumann BCs should NOT be smaller than zero (< 0). Consider use diffusivity or elastic constant to scale the data!")
-
-    #---------------- Neumann BCs-----------------
-    # Should consider the scaling as well.  Any mask will not work, as Neumann BCs can be smaller than 0.0
-    # Solution: Neumann BCs is not allowed to be smaller than 0 in the input data.
-
-    neumann_mask = tf.where( neumann_data <= 0.0, tf.fill(tf.shape(neumann_data), 0.0), tf.fill(tf.shape(neumann_data), 1.0))
-    if pflag: print('neumann_mask', neumann_mask[0,:,:,0])
-    if pflag: print('neumann_mask(dof-1)', neumann_mask[0,:,:,1])
-    neumann_data = tf.multiply( neumann_data, neumann_mask)
-    if pflag: print('neumann_data', neumann_data[0,:,:,0])
-    if pflag: print('neumann_data(dof-1)', neumann_data[0,:,:,1])
-
-    # The main idea is to form a element connection as for the bulk residual case.
-    # However, if the neumman BCs is location dependent, has both positive and negative 
-    # values, then, it is very challenging to make the following to work stably. 
-    # On the other hand, if we only consider the bulk region, then the neumman BCs is
-    # literally enforced through the residual form, but not explicitly. 
-    # Still, the following might still work.
-
-    # form dof-1 level horizontal element
-    # the padding zeros will helps to keep the location of surface node unchanged for the bottom edges
-    # n1    n2    -> t_y
-    # 1 0   0 1
-    # 0 0   0 0
-    n1 = np.array([[1, 0], [0, 0]])
-    n1 = np.expand_dims(n1, axis=2)
-    n1 = np.expand_dims(n1, axis=3)
-    n2 = np.array([[0, 1], [0, 0]])
-    n2 = np.expand_dims(n2, axis=2)
-    n2 = np.expand_dims(n2, axis=3)
-
-    # n3   n4     -> t_x
-    # 1 0  0 0
-    # 0 0  1 0
-    # form dof-1 level vertical element:
-    n3 = np.array([[1, 0], [0, 0]])
-    n3 = np.expand_dims(n3, axis=2)
-    n3 = np.expand_dims(n3, axis=3)
-    n4 = np.array([[0, 0], [1, 0]])
-    n4 = np.expand_dims(n4, axis=2)
-    n4 = np.expand_dims(n4, axis=3)
-
-
-    if (dof != 1):
-        raise ValueError(" t_x and t_y might need to be reversed for dof>1, was not tested in the following implementation!")
-
-    # create surface elements
-    if dof == 1:
-        # horizontal element
-        c_n1 = tf.nn.conv2d(neumann_data[:,:,:,1:2], n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data[:,:,:,1:2], n2, [1,1,1,1], padding)
-        elem_y = tf.concat([c_n1, c_n2], 3)
-
-        # vertical element
-        c_n3 = tf.nn.conv2d(neumann_data[:,:,:,0:1], n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data[:,:,:,0:1], n4, [1,1,1,1], padding)
-        elem_x = tf.concat([c_n3, c_n4], 3)
-
-        if pflag: print('elem_x', np.shape(elem_x))
-        if pflag: print('elem_x 1: ', elem_x[0,:,:,0])
-        if pflag: print('elem_x 2: ', elem_x[0,:,:,1])
-
-        if pflag: print('elem_y', np.shape(elem_y))
-        if pflag: print('elem_y 1: ', elem_y[0,:,:,0])
-        if pflag: print('elem_y 2: ', elem_y[0,:,:,1])
-    elif dof == 2:
-        neumann_data_1 = neumann_data[:,:,:,0:2]
-        neumann_data_2 = neumann_data[:,:,:,2:4]
-
-        c_n1 = tf.nn.conv2d(neumann_data_1[:,:,:,0:1], n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_1[:,:,:,0:1], n2, [1,1,1,1], padding)
-        elem_y_1 = tf.concat([c_n1, c_n2], 3)
-
-        c_n1 = tf.nn.conv2d(neumann_data_2[:,:,:,0:1], n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_2[:,:,:,0:1], n2, [1,1,1,1], padding)
-        elem_y_2 = tf.concat([c_n1, c_n2], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_1[:,:,:,1:2], n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_1[:,:,:,1:2], n4, [1,1,1,1], padding)
-        elem_x_1 = tf.concat([c_n3, c_n4], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_2[:,:,:,1:2], n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_2[:,:,:,1:2], n4, [1,1,1,1], padding)
-        elem_x_2 = tf.concat([c_n3, c_n4], 3)
-
-        if pflag: print('elem_y_1 ', np.shape(elem_y_1))
-        if pflag: print('elem_y_1 1: ', elem_y_1[0,:,:,0])
-        if pflag: print('elem_y_1 2: ', elem_y_1[0,:,:,1])
-        if pflag: print('elem_y_2 ', np.shape(elem_y_2))
-        if pflag: print('elem_y_2 1: ', elem_y_2[0,:,:,0])
-        if pflag: print('elem_y_2 2: ', elem_y_2[0,:,:,1])
-
-        if pflag: print('elem_x_1 ', np.shape(elem_x_1))
-        if pflag: print('elem_x_1 1: ', elem_x_1[0,:,:,0])
-        if pflag: print('elem_x_1 2: ', elem_x_1[0,:,:,1])
-        if pflag: print('elem_x_2 ', np.shape(elem_x_2))
-        if pflag: print('elem_x_2 1: ', elem_x_2[0,:,:,0])
-        if pflag: print('elem_x_2 2: ', elem_x_2[0,:,:,1])
-    elif dof == 3:
-        neumann_data_1 = neumann_data[:,:,:,0:2]
-        neumann_data_2 = neumann_data[:,:,:,2:4]
-        neumann_data_3 = neumann_data[:,:,:,4:6]
-
-        c_n1 = tf.nn.conv2d(neumann_data_1[:,:,:,0:1], n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_1[:,:,:,0:1], n2, [1,1,1,1], padding)
-        elem_y_1 = tf.concat([c_n1, c_n2], 3)
-
-        c_n1 = tf.nn.conv2d(neumann_data_2[:,:,:,0:1], n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_2[:,:,:,0:1], n2, [1,1,1,1], padding)
-        elem_y_2 = tf.concat([c_n1, c_n2], 3)
-
-        c_n1 = tf.nn.conv2d(neumann_data_3[:,:,:,0:1], n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_3[:,:,:,0:1], n2, [1,1,1,1], padding)
-        elem_y_3 = tf.concat([c_n1, c_n2], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_1[:,:,:,1:2], n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_1[:,:,:,1:2], n4, [1,1,1,1], padding)
-        elem_x_1 = tf.concat([c_n3, c_n4], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_2[:,:,:,1:2], n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_2[:,:,:,1:2], n4, [1,1,1,1], padding)
-        elem_x_2 = tf.concat([c_n3, c_n4], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_3[:,:,:,1:2], n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_3[:,:,:,1:2], n4, [1,1,1,1], padding)
-        elem_x_3 = tf.concat([c_n3, c_n4], 3)
-
-        if pflag: print('elem_y_1 ', np.shape(elem_y_1))
-        if pflag: print('elem_y_1 1: ', elem_y_1[0,:,:,0])
-        if pflag: print('elem_y_1 2: ', elem_y_1[0,:,:,1])
-        if pflag: print('elem_y_2 ', np.shape(elem_y_2))
-        if pflag: print('elem_y_2 1: ', elem_y_2[0,:,:,0])
-        if pflag: print('elem_y_2 2: ', elem_y_2[0,:,:,1])
-        if pflag: print('elem_y_3 ', np.shape(elem_y_3))
-        if pflag: print('elem_y_3 1: ', elem_y_3[0,:,:,0])
-        if pflag: print('elem_y_3 2: ', elem_y_3[0,:,:,1])
-
-        if pflag: print('elem_x_1 ', np.shape(elem_x_1))
-        if pflag: print('elem_x_1 1: ', elem_x_1[0,:,:,0])
-        if pflag: print('elem_x_1 2: ', elem_x_1[0,:,:,1])
-        if pflag: print('elem_x_2 ', np.shape(elem_x_2))
-        if pflag: print('elem_x_2 1: ', elem_x_2[0,:,:,0])
-        if pflag: print('elem_x_2 2: ', elem_x_2[0,:,:,1])
-        if pflag: print('elem_x_3 ', np.shape(elem_x_3))
-        if pflag: print('elem_x_3 1: ', elem_x_3[0,:,:,0])
-        if pflag: print('elem_x_3 2: ', elem_x_3[0,:,:,1])
-
-    elif dof == 4:
-        neumann_data_1 = neumann_data[:,:,:,0:2]
-        neumann_data_2 = neumann_data[:,:,:,2:4]
-        neumann_data_3 = neumann_data[:,:,:,4:6]
-        neumann_data_4 = neumann_data[:,:,:,6:8]
-
-        c_n1 = tf.nn.conv2d(neumann_data_1[:,:,:,0:1], n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_1[:,:,:,0:1], n2, [1,1,1,1], padding)
-        elem_y_1 = tf.concat([c_n1, c_n2], 3)
-
-        c_n1 = tf.nn.conv2d(neumann_data_2[:,:,:,0:1], n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_2[:,:,:,0:1], n2, [1,1,1,1], padding)
-        elem_y_2 = tf.concat([c_n1, c_n2], 3)
-
-        c_n1 = tf.nn.conv2d(neumann_data_3[:,:,:,0:1], n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_3[:,:,:,0:1], n2, [1,1,1,1], padding)
-        elem_y_3 = tf.concat([c_n1, c_n2], 3)
-
-        c_n1 = tf.nn.conv2d(neumann_data_4[:,:,:,0:1], n1, [1,1,1,1], padding )
-        c_n2 = tf.nn.conv2d(neumann_data_4[:,:,:,0:1], n2, [1,1,1,1], padding)
-        elem_y_4 = tf.concat([c_n1, c_n2], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_1[:,:,:,1:2], n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_1[:,:,:,1:2], n4, [1,1,1,1], padding)
-        elem_x_1 = tf.concat([c_n3, c_n4], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_2[:,:,:,1:2], n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_2[:,:,:,1:2], n4, [1,1,1,1], padding)
-        elem_x_2 = tf.concat([c_n3, c_n4], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_3[:,:,:,1:2], n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_3[:,:,:,1:2], n4, [1,1,1,1], padding)
-        elem_x_3 = tf.concat([c_n3, c_n4], 3)
-
-        c_n3 = tf.nn.conv2d(neumann_data_4[:,:,:,1:2], n3, [1,1,1,1], padding )
-        c_n4 = tf.nn.conv2d(neumann_data_4[:,:,:,1:2], n4, [1,1,1,1], padding)
-        elem_x_4 = tf.concat([c_n3, c_n4], 3)
-
-
-
-    if dof == 1:
-        # channel 0:1 == channel 1:2
-        # create a mask to delete data that are not properly aligned
-        c_n1_mask = tf.nn.conv2d(neumann_mask[:,:,:,1:2], n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask[:,:,:,1:2], n2, [1,1,1,1], padding)
-        elem_y_mask = tf.multiply(c_n1_mask, c_n2_mask)
-        if pflag: print('c_n1_mask: ', c_n1_mask[0,:,:,0])
-        if pflag: print('c_n2_mask: ', c_n2_mask[0,:,:,0])
-        if pflag: print('elem_y_mask: ', elem_y_mask[0,:,:,0])
-    
-        # create a mask to delete data that are not properly aligned
-        c_n3_mask = tf.nn.conv2d(neumann_mask[:,:,:,0:1], n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask[:,:,:,0:1], n4, [1,1,1,1], padding)
-        elem_x_mask = tf.multiply(c_n3_mask, c_n4_mask)
-        if pflag: print('c_n3_mask: ', c_n3_mask[0,:,:,0])
-        if pflag: print('c_n4_mask: ', c_n4_mask[0,:,:,0])
-        if pflag: print('elem_x_mask: ', elem_x_mask[0,:,:,0])
-    elif dof == 2:
-        # For the 3D case, it would be impossible to perform task like this.
-        # Thus, how to come up with a 3D implementation, or sparse pattern 
-        # would be extremely useful.
-
-        # create a mask to delete data that are not properly aligned
-        neumann_mask_1 = neumann_mask[:,:,:,0:1] # 0:1 = 1:2
-        neumann_mask_2 = neumann_mask[:,:,:,2:3]
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_1, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_1, n2, [1,1,1,1], padding)
-        elem_y_mask_1 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        if pflag: print('c_n1_mask: ', c_n1_mask[0,:,:,0])
-        if pflag: print('c_n2_mask: ', c_n2_mask[0,:,:,0])
-        if pflag: print('elem_y_mask_1: ', elem_y_mask_1[0,:,:,0])
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_2, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_2, n2, [1,1,1,1], padding)
-        elem_y_mask_2 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        if pflag: print('c_n1_mask: ', c_n1_mask[0,:,:,0])
-        if pflag: print('c_n2_mask: ', c_n2_mask[0,:,:,0])
-        if pflag: print('elem_y_mask_2: ', elem_y_mask_2[0,:,:,0])
-
-    
-        # create a mask to delete data that are not properly aligned
-        c_n3_mask = tf.nn.conv2d(neumann_mask_1, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_1, n4, [1,1,1,1], padding)
-        elem_x_mask_1 = tf.multiply(c_n3_mask, c_n4_mask)
-        if pflag: print('c_n3_mask: ', c_n3_mask[0,:,:,0])
-        if pflag: print('c_n4_mask: ', c_n4_mask[0,:,:,0])
-        if pflag: print('elem_x_mask_1: ', elem_x_mask_1[0,:,:,0])
-
-        c_n3_mask = tf.nn.conv2d(neumann_mask_2, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_2, n4, [1,1,1,1], padding)
-        elem_x_mask_2 = tf.multiply(c_n3_mask, c_n4_mask)
-        if pflag: print('c_n3_mask: ', c_n3_mask[0,:,:,0])
-        if pflag: print('c_n4_mask: ', c_n4_mask[0,:,:,0])
-        if pflag: print('elem_x_mask_2: ', elem_x_mask_2[0,:,:,0])
-
-    elif dof == 3:
-
-        # create a mask to delete data that are not properly aligned
-        neumann_mask_1 = neumann_mask[:,:,:,0:1]
-        neumann_mask_2 = neumann_mask[:,:,:,2:3]
-        neumann_mask_3 = neumann_mask[:,:,:,4:5]
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_1, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_1, n2, [1,1,1,1], padding)
-        elem_y_mask_1 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        if pflag: print('c_n1_mask: ', c_n1_mask[0,:,:,0])
-        if pflag: print('c_n2_mask: ', c_n2_mask[0,:,:,0])
-        if pflag: print('elem_y_mask_1: ', elem_y_mask_1[0,:,:,0])
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_2, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_2, n2, [1,1,1,1], padding)
-        elem_y_mask_2 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        if pflag: print('c_n1_mask: ', c_n1_mask[0,:,:,0])
-        if pflag: print('c_n2_mask: ', c_n2_mask[0,:,:,0])
-        if pflag: print('elem_y_mask_2: ', elem_y_mask_2[0,:,:,0])
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_3, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_3, n2, [1,1,1,1], padding)
-        elem_y_mask_3 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        if pflag: print('c_n1_mask: ', c_n1_mask[0,:,:,0])
-        if pflag: print('c_n2_mask: ', c_n2_mask[0,:,:,0])
-        if pflag: print('elem_y_mask_3: ', elem_y_mask_3[0,:,:,0])
-
-    
-        # create a mask to delete data that are not properly aligned
-        c_n3_mask = tf.nn.conv2d(neumann_mask_1, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_1, n4, [1,1,1,1], padding)
-        elem_x_mask_1 = tf.multiply(c_n3_mask, c_n4_mask)
-        if pflag: print('c_n3_mask: ', c_n3_mask[0,:,:,0])
-        if pflag: print('c_n4_mask: ', c_n4_mask[0,:,:,0])
-        if pflag: print('elem_x_mask_1: ', elem_x_mask_1[0,:,:,0])
-
-        c_n3_mask = tf.nn.conv2d(neumann_mask_2, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_2, n4, [1,1,1,1], padding)
-        elem_x_mask_2 = tf.multiply(c_n3_mask, c_n4_mask)
-        if pflag: print('c_n3_mask: ', c_n3_mask[0,:,:,0])
-        if pflag: print('c_n4_mask: ', c_n4_mask[0,:,:,0])
-        if pflag: print('elem_x_mask_2: ', elem_x_mask_2[0,:,:,0])
-
-        c_n3_mask = tf.nn.conv2d(neumann_mask_3, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_3, n4, [1,1,1,1], padding)
-        elem_x_mask_3 = tf.multiply(c_n3_mask, c_n4_mask)
-        if pflag: print('c_n3_mask: ', c_n3_mask[0,:,:,0])
-        if pflag: print('c_n4_mask: ', c_n4_mask[0,:,:,0])
-        if pflag: print('elem_x_mask_3: ', elem_x_mask_3[0,:,:,0])
-
-    elif dof == 4:
-
-        # create a mask to delete data that are not properly aligned
-        neumann_mask_1 = neumann_mask[:,:,:,0:1]
-        neumann_mask_2 = neumann_mask[:,:,:,2:3]
-        neumann_mask_3 = neumann_mask[:,:,:,4:5]
-        neumann_mask_4 = neumann_mask[:,:,:,6:7]
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_1, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_1, n2, [1,1,1,1], padding)
-        elem_y_mask_1 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_2, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_2, n2, [1,1,1,1], padding)
-        elem_y_mask_2 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_3, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_3, n2, [1,1,1,1], padding)
-        elem_y_mask_3 = tf.multiply(c_n1_mask, c_n2_mask)
-
-        c_n1_mask = tf.nn.conv2d(neumann_mask_4, n1, [1,1,1,1], padding )
-        c_n2_mask = tf.nn.conv2d(neumann_mask_4, n2, [1,1,1,1], padding)
-        elem_y_mask_4 = tf.multiply(c_n1_mask, c_n2_mask)
-
-    
-        # create a mask to delete data that are not properly aligned
-        c_n3_mask = tf.nn.conv2d(neumann_mask_1, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_1, n4, [1,1,1,1], padding)
-        elem_x_mask_1 = tf.multiply(c_n3_mask, c_n4_mask)
-
-        c_n3_mask = tf.nn.conv2d(neumann_mask_2, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_2, n4, [1,1,1,1], padding)
-        elem_x_mask_2 = tf.multiply(c_n3_mask, c_n4_mask)
-
-        c_n3_mask = tf.nn.conv2d(neumann_mask_3, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_3, n4, [1,1,1,1], padding)
-        elem_x_mask_3 = tf.multiply(c_n3_mask, c_n4_mask)
-
-        c_n3_mask = tf.nn.conv2d(neumann_mask_4, n3, [1,1,1,1], padding )
-        c_n4_mask = tf.nn.conv2d(neumann_mask_4, n4, [1,1,1,1], padding)
-        elem_x_mask_4 = tf.multiply(c_n3_mask, c_n4_mask)
-    
-    
+    neumann_x = data_input[:,:,:,dof:2*dof]
+    neumann_y = data_input[:,:,:,2*dof:3*dof]
 
+    Rx, Ry, neumann_mask_x, neumann_mask_y = ComputeNeumannEdgeResidualNodalData(neumann_x, neumann_y, dh=dh, padding=padding)
+    # the mask of each channel is applied separately, in case only one of t_x and t_y has values
+    R = tf.multiply(Rx, neumann_mask_x) + tf.multiply(Ry, neumann_mask_y)
+    return R
 
-    if dof == 1:
-        # Scale the Neumann BC value back to the original one
-        # original scale in VtuDataGenerateFixedc.py: 
-        #   - data = (data + (self.upperlimit - self.lowerlimit) * 0.5 ) * 0.5
-        elem_x = 2.0 * elem_x - (Neumann_max - Neumann_min) * 0.5
-        elem_y = 2.0 * elem_y - (Neumann_max - Neumann_min) * 0.5
-
-        clean_elem_y = tf.multiply(elem_y, elem_y_mask)
-        clean_elem_x = tf.multiply(elem_x, elem_x_mask)
-        if pflag: print('clean_elem_y (node1, 2)', np.shape(clean_elem_y), clean_elem_y[0,:,:,0], clean_elem_y[0,:,:,1])
-        if pflag: print('clean_elem_x (node1, 2)', np.shape(clean_elem_x), clean_elem_x[0,:,:,0], clean_elem_x[0,:,:,1])
-
-    elif dof == 2:
-        elem_x_1 = 2.0 * elem_x_1 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_1 = 2.0 * elem_y_1 - (Neumann_max - Neumann_min) * 0.5
-        elem_x_2 = 2.0 * elem_x_2 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_2 = 2.0 * elem_y_2 - (Neumann_max - Neumann_min) * 0.5
-
-        clean_elem_y_1 = tf.multiply(elem_y_1, elem_y_mask_1)
-        clean_elem_x_1 = tf.multiply(elem_x_1, elem_x_mask_1)
-        clean_elem_y_2 = tf.multiply(elem_y_2, elem_y_mask_2)
-        clean_elem_x_2 = tf.multiply(elem_x_2, elem_x_mask_2)
-
-        if pflag: print('clean_elem_y_1 (node1, 2)', np.shape(clean_elem_y_1), clean_elem_y_1[0,:,:,0], clean_elem_y_1[0,:,:,1])
-        if pflag: print('clean_elem_x_1 (node1, 2)', np.shape(clean_elem_x_1), clean_elem_x_1[0,:,:,0], clean_elem_x_1[0,:,:,1])
-        if pflag: print('clean_elem_y_2 (node1, 2)', np.shape(clean_elem_y_2), clean_elem_y_2[0,:,:,0], clean_elem_y_2[0,:,:,1])
-        if pflag: print('clean_elem_x_2 (node1, 2)', np.shape(clean_elem_x_2), clean_elem_x_2[0,:,:,0], clean_elem_x_2[0,:,:,1])
-    elif dof == 3:
-        elem_x_1 = 2.0 * elem_x_1 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_1 = 2.0 * elem_y_1 - (Neumann_max - Neumann_min) * 0.5
-        elem_x_2 = 2.0 * elem_x_2 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_2 = 2.0 * elem_y_2 - (Neumann_max - Neumann_min) * 0.5
-        elem_x_3 = 2.0 * elem_x_3 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_3 = 2.0 * elem_y_3 - (Neumann_max - Neumann_min) * 0.5
-
-        clean_elem_y_1 = tf.multiply(elem_y_1, elem_y_mask_1)
-        clean_elem_x_1 = tf.multiply(elem_x_1, elem_x_mask_1)
-        clean_elem_y_2 = tf.multiply(elem_y_2, elem_y_mask_2)
-        clean_elem_x_2 = tf.multiply(elem_x_2, elem_x_mask_2)
-        clean_elem_y_3 = tf.multiply(elem_y_3, elem_y_mask_3)
-        clean_elem_x_3 = tf.multiply(elem_x_3, elem_x_mask_3)
-
-        if pflag: print('clean_elem_y_1 (node1, 2)', np.shape(clean_elem_y_1), clean_elem_y_1[0,:,:,0], clean_elem_y_1[0,:,:,1])
-        if pflag: print('clean_elem_x_1 (node1, 2)', np.shape(clean_elem_x_1), clean_elem_x_1[0,:,:,0], clean_elem_x_1[0,:,:,1])
-        if pflag: print('clean_elem_y_2 (node1, 2)', np.shape(clean_elem_y_2), clean_elem_y_2[0,:,:,0], clean_elem_y_2[0,:,:,1])
-        if pflag: print('clean_elem_x_2 (node1, 2)', np.shape(clean_elem_x_2), clean_elem_x_2[0,:,:,0], clean_elem_x_2[0,:,:,1])
-        if pflag: print('clean_elem_y_3 (node1, 2)', np.shape(clean_elem_y_3), clean_elem_y_3[0,:,:,0], clean_elem_y_3[0,:,:,1])
-        if pflag: print('clean_elem_x_3 (node1, 2)', np.shape(clean_elem_x_3), clean_elem_x_3[0,:,:,0], clean_elem_x_3[0,:,:,1])
-
-    elif dof == 4:
-        elem_x_1 = 2.0 * elem_x_1 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_1 = 2.0 * elem_y_1 - (Neumann_max - Neumann_min) * 0.5
-        elem_x_2 = 2.0 * elem_x_2 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_2 = 2.0 * elem_y_2 - (Neumann_max - Neumann_min) * 0.5
-        elem_x_3 = 2.0 * elem_x_3 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_3 = 2.0 * elem_y_3 - (Neumann_max - Neumann_min) * 0.5
-        elem_x_4 = 2.0 * elem_x_4 - (Neumann_max - Neumann_min) * 0.5
-        elem_y_4 = 2.0 * elem_y_4 - (Neumann_max - Neumann_min) * 0.5
-
-        clean_elem_y_1 = tf.multiply(elem_y_1, elem_y_mask_1)
-        clean_elem_x_1 = tf.multiply(elem_x_1, elem_x_mask_1)
-        clean_elem_y_2 = tf.multiply(elem_y_2, elem_y_mask_2)
-        clean_elem_x_2 = tf.multiply(elem_x_2, elem_x_mask_2)
-        clean_elem_y_3 = tf.multiply(elem_y_3, elem_y_mask_3)
-        clean_elem_x_3 = tf.multiply(elem_x_3, elem_x_mask_3)
-        clean_elem_y_4 = tf.multiply(elem_y_4, elem_y_mask_4)
-        clean_elem_x_4 = tf.multiply(elem_x_4, elem_x_mask_4)
 
+def ComputeNeumannFaceResidualNodalData3D(neumann_x, neumann_y, neumann_z, dh):
+    """ 
+    Compute the nodal residual int (N^T h) dA of the Neumann BCs on the faces of the hexahedral elements with the 
+    normal x (neumann_x), y (neumann_y) and z (neumann_z). All channels (dofs) are processed at once. 3D version of 
+    ComputeNeumannEdgeResidualNodalData().
 
+    args:
+        neumann_x (tensor): scaled Neumann BCs [batch, node_depth, node_height, node_width, c], assembled over the faces 
+                            of the nodes (k,i,j), (k,i+1,j), (k+1,i,j), (k+1,i+1,j)
+        neumann_y (tensor): same, assembled over the faces of the nodes (k,i,j), (k,i,j+1), (k+1,i,j), (k+1,i,j+1)
+        neumann_z (tensor): same, assembled over the faces of the nodes (k,i,j), (k,i,j+1), (k,i+1,j), (k,i+1,j+1)
+        dh (float or tuple): element size, or (dx, dy, dz)
+    return:
+        - nodal residual of the faces with the normal x, y and z [batch, node_depth, node_height, node_width, c]
+        - Neumann mask of neumann_x, neumann_y and neumann_z (1: BC, 0: no BC)
+    """
+    dx, dy, dz = GetElementSize(dh, dim=3)
+
+    # the node at (k, i, j) + offset, zero outside of the node grid
+    def next_node(data, offset):
+        data = data[:, offset[0]:, offset[1]:, offset[2]:, :]
+        return tf.pad(data, [[0,0], [0,offset[0]], [0,offset[1]], [0,offset[2]], [0,0]])
+
+    def face_residual(neumann, axes, face_dh):
+        mask = tf.cast(neumann > 0.0, tf.float32)
+        neumann = tf.multiply(neumann, mask)
+        # face nodes in the order of n1, n2, n3, n4 of Build2DGaussPointInfo(), with axes[0] as the image rows and axes[1] 
+        # as the image columns of the face
+        offsets = []
+        for r, c in [(0, 0), (0, 1), (1, 0), (1, 1)]:
+            offset = [0, 0, 0]
+            offset[axes[0]] = r
+            offset[axes[1]] = c
+            offsets.append(offset)
+        # only faces with all 4 nodes on the Neumann BCs
+        face_mask = tf.multiply(tf.multiply(mask, next_node(mask, offsets[1])), tf.multiply(next_node(mask, offsets[2]), next_node(mask, offsets[3])))
+        # scale the Neumann BC value back to the original one, see ComputeNeumannEdgeResidualNodalData()
+        face = [tf.multiply(2.0 * next_node(neumann, o) - 1.0, face_mask) for o in offsets]
+
+        # int(N^T h) dA with 2x2 GPs, h interpolated from the nodal values: R_n = sum_m M_nm h_m, M = sum_q jxw_q N_q N_q^T
+        N, B, jxw = Get2DGaussPointInfo(dh=face_dh, GPs=4, dof=1)
+        M = np.einsum('q,qn,qm->nm', tf.get_static_value(jxw), tf.get_static_value(N), tf.get_static_value(N))
+
+        # face to nodal value: node n of the face (k, i, j) is the node (k, i, j) + offset n
+        R = 0.0
+        for n, o in enumerate(offsets):
+            R_n = tf.add_n([M[n, m] * face[m] for m in range(0, 4)])
+            R = R + tf.roll(R_n, o, [1, 2, 3])
+        return R, mask
+
+    # face rows/columns along (depth, height), (depth, width), (height, width), with the element sizes (column, row)
+    Rx, mask_x = face_residual(neumann_x, (0, 1), (dy, dz))
+    Ry, mask_y = face_residual(neumann_y, (0, 2), (dx, dz))
+    Rz, mask_z = face_residual(neumann_z, (1, 2), (dx, dy))
+    return Rx, Ry, Rz, mask_x, mask_y, mask_z
+
+
+def ComputeNeumannBoundaryResidualNodalData3D(data_input, dh, dof):
+    """ 
+    3D version of ComputeNeumannBoundaryResidualNodalData(): each Neumann channel is used for the faces with the normal 
+    x, y and z. Works for any dof.
 
-    if dof == 1 :
-        shape=elem_x.get_shape()[0:].as_list()    
-        new_shape = shape[1:3]
-        if pflag: print('new_shape:', new_shape)
-    elif dof == 2 :
-        shape=elem_x_1.get_shape()[0:].as_list()    
-        new_shape = shape[1:3]
-        if pflag: print('new_shape:', new_shape)
-    elif dof == 3 :
-        shape=elem_x_1.get_shape()[0:].as_list()    
-        new_shape = shape[1:3]
-        if pflag: print('new_shape:', new_shape)
-    elif dof == 4 :
-        shape=elem_x_1.get_shape()[0:].as_list()    
-        new_shape = shape[1:3]
-
-
-    # get the 1D info, and then perform a N h calculation
-    # and then unfold everything to the nodal value
-    # 
-    N, B, jxw = Get1DGaussPointInfo(dh=dh, GPs=2, dof=1)
-    if pflag: print("N", np.shape(N))
-    if pflag: print("B", np.shape(B))
-    if pflag: print("jxw", jxw)
-
-    if dof == 1:
-        elem_x2 = tf.reshape(clean_elem_x,[-1, 2])
-        elem_y2 = tf.reshape(clean_elem_y,[-1, 2])
-
-        if pflag: print('elem_x2', np.shape(elem_x2), elem_x2)
-        if pflag: print('elem_y2', np.shape(elem_y2), elem_y2)
-
-    elif dof == 2:
-        elem_x2_1 = tf.reshape(clean_elem_x_1,[-1, 2])
-        elem_y2_1 = tf.reshape(clean_elem_y_1,[-1, 2])
-        elem_x2_2 = tf.reshape(clean_elem_x_2,[-1, 2])
-        elem_y2_2 = tf.reshape(clean_elem_y_2,[-1, 2])
-
-        if pflag: print('elem_x2_1', np.shape(elem_x2_1), elem_x2_1)
-        if pflag: print('elem_y2_1', np.shape(elem_y2_1), elem_y2_1)
-        if pflag: print('elem_x2_2', np.shape(elem_x2_2), elem_x2_2)
-        if pflag: print('elem_y2_2', np.shape(elem_y2_2), elem_y2_2)
-    elif dof == 3:
-        elem_x2_1 = tf.reshape(clean_elem_x_1,[-1, 2])
-        elem_y2_1 = tf.reshape(clean_elem_y_1,[-1, 2])
-        elem_x2_2 = tf.reshape(clean_elem_x_2,[-1, 2])
-        elem_y2_2 = tf.reshape(clean_elem_y_2,[-1, 2])
-        elem_x2_3 = tf.reshape(clean_elem_x_3,[-1, 2])
-        elem_y2_3 = tf.reshape(clean_elem_y_3,[-1, 2])
-
-        if pflag: print('elem_x2_1', np.shape(elem_x2_1), elem_x2_1)
-        if pflag: print('elem_y2_1', np.shape(elem_y2_1), elem_y2_1)
-        if pflag: print('elem_x2_2', np.shape(elem_x2_2), elem_x2_2)
-        if pflag: print('elem_y2_2', np.shape(elem_y2_2), elem_y2_2)
-        if pflag: print('elem_x2_3', np.shape(elem_x2_3), elem_x2_3)
-        if pflag: print('elem_y2_3', np.shape(elem_y2_3), elem_y2_3)
-    elif dof == 4:
-        elem_x2_1 = tf.reshape(clean_elem_x_1,[-1, 2])
-        elem_y2_1 = tf.reshape(clean_elem_y_1,[-1, 2])
-        elem_x2_2 = tf.reshape(clean_elem_x_2,[-1, 2])
-        elem_y2_2 = tf.reshape(clean_elem_y_2,[-1, 2])
-        elem_x2_3 = tf.reshape(clean_elem_x_3,[-1, 2])
-        elem_y2_3 = tf.reshape(clean_elem_y_3,[-1, 2])
-        elem_x2_4 = tf.reshape(clean_elem_x_4,[-1, 2])
-        elem_y2_4 = tf.reshape(clean_elem_y_4,[-1, 2])
-
-
-    if dof == 1:
-        # int(N^T h) dA: h是nodal value，必须通过shape fcn来分析正确的值, 但是它也是scale了的值， 
-        # Calculate the hbar at the GPs based on nodal info.
-        # GP1
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2, N[0,:]) 
-        # GP2
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2, N[1,:]) 
-        # GP1
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2, N[0,:]) 
-        # GP2
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        # if pflag: print('elem_x2_hbar_gp1', np.shape(elem_x2_hbar_gp1),tf.reshape(elem_x2_hbar_gp1, new_shape)) # work for [1, 16, 16, 1], but not [8, 16, 16, 1]
-        # if pflag: print('elem_x2_hbar_gp2', np.shape(elem_x2_hbar_gp2),tf.reshape(elem_x2_hbar_gp2, new_shape))
-        # if pflag: print('elem_y2_hbar_gp1', np.shape(elem_y2_hbar_gp1),tf.reshape(elem_y2_hbar_gp1, new_shape))
-        # if pflag: print('elem_y2_hbar_gp2', np.shape(elem_y2_hbar_gp2),tf.reshape(elem_y2_hbar_gp2, new_shape))
-
-        if pflag: print("N1", N[0,:])
-        if pflag: print("N2", N[1,:])
-
-        #-------------------- WARNING --------------------------
-        # Since here we start to distinguish x-, y- traction/flux, if the residual contains
-        # the gradient term, then we can use different B function for either x-direction
-        # or reversed y-direction as the operator to calculate the residual on the edge.
-        # For now, we are good.
-        #
-        #---------------- END OF WARNING -----------------------
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        # print('Rx1', np.shape(Rx1), Rx1*jxw)
-        # print('Rx2', np.shape(Rx2), Rx2*jxw)
-        # print('Ry1', np.shape(Ry1), Ry1*jxw)
-        # print('Ry2', np.shape(Ry2), Ry2*jxw)
-        Rx = jxw * (Rx1 + Rx2)
-        Ry = jxw * (Ry1 + Ry2)
-
-        if pflag: print('jxw', jxw)
-        if pflag: print('elem_x2_hbar_gp1', elem_x2_hbar_gp1)
-        # if pflag: print(N[0:1, :])
-
-        # element level residual for traction in either x or y direction
-        Rx = tf.reshape(Rx, [-1, new_shape[0], new_shape[1], 2])
-        Ry = tf.reshape(Ry, [-1, new_shape[0], new_shape[1], 2])
-
-        if pflag: print('Rx1', np.shape(Rx), Rx[0,:,:,0])
-        if pflag: print('Rx2', np.shape(Rx), Rx[0,:,:,1])
-        if pflag: print('Ry1', np.shape(Ry), Ry[0,:,:,0])
-        if pflag: print('Ry2', np.shape(Ry), Ry[0,:,:,1])
-
-    elif dof == 2:
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_1, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_1, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_1, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_1, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-        if pflag: print('elem_x2_hbar_gp1', np.shape(elem_x2_hbar_gp1),tf.reshape(elem_x2_hbar_gp1, new_shape))
-        if pflag: print('elem_x2_hbar_gp2', np.shape(elem_x2_hbar_gp2),tf.reshape(elem_x2_hbar_gp2, new_shape))
-        if pflag: print('elem_y2_hbar_gp1', np.shape(elem_y2_hbar_gp1),tf.reshape(elem_y2_hbar_gp1, new_shape))
-        if pflag: print('elem_y2_hbar_gp2', np.shape(elem_y2_hbar_gp2),tf.reshape(elem_y2_hbar_gp2, new_shape))
-
-        if pflag: print("N1", N[0,:])
-        if pflag: print("N2", N[1,:])
-
-        #-------------------- WARNING --------------------------
-        # Since here we start to distinguish x-, y- traction/flux, if the residual contains
-        # the gradient term, then we can use different B function for either x-direction
-        # or reversed y-direction as the operator to calculate the residual on the edge.
-        # For now, we are good.
-        #
-        #---------------- END OF WARNING -----------------------
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_1 = jxw * (Rx1 + Rx2)
-        Ry_1 = jxw * (Ry1 + Ry2)
-
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_2, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_2, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_2, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_2, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_2 = jxw * (Rx1 + Rx2)
-        Ry_2 = jxw * (Ry1 + Ry2)
-
-        # element level residual for traction in either x or y direction
-        Rx_1 = tf.reshape(Rx_1, [-1, new_shape[0], new_shape[1], 2])
-        Ry_1 = tf.reshape(Ry_1, [-1, new_shape[0], new_shape[1], 2])
-        Rx_2 = tf.reshape(Rx_2, [-1, new_shape[0], new_shape[1], 2])
-        Ry_2 = tf.reshape(Ry_2, [-1, new_shape[0], new_shape[1], 2])
-
-        if pflag: print('Rx1_1', np.shape(Rx_1), Rx_1[0,:,:,0])
-        if pflag: print('Rx2_1', np.shape(Rx_1), Rx_1[0,:,:,1])
-        if pflag: print('Ry1_1', np.shape(Ry_1), Ry_1[0,:,:,0])
-        if pflag: print('Ry2_1', np.shape(Ry_1), Ry_1[0,:,:,1])
-        if pflag: print('Rx1_2', np.shape(Rx_2), Rx_2[0,:,:,0])
-        if pflag: print('Rx2_2', np.shape(Rx_2), Rx_2[0,:,:,1])
-        if pflag: print('Ry1_2', np.shape(Ry_2), Ry_2[0,:,:,0])
-        if pflag: print('Ry2_2', np.shape(Ry_2), Ry_2[0,:,:,1])
-    elif dof == 3:
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_1, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_1, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_1, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_1, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-        if pflag: print('elem_x2_hbar_gp1', np.shape(elem_x2_hbar_gp1),tf.reshape(elem_x2_hbar_gp1, new_shape))
-        if pflag: print('elem_x2_hbar_gp2', np.shape(elem_x2_hbar_gp2),tf.reshape(elem_x2_hbar_gp2, new_shape))
-        if pflag: print('elem_y2_hbar_gp1', np.shape(elem_y2_hbar_gp1),tf.reshape(elem_y2_hbar_gp1, new_shape))
-        if pflag: print('elem_y2_hbar_gp2', np.shape(elem_y2_hbar_gp2),tf.reshape(elem_y2_hbar_gp2, new_shape))
-
-        if pflag: print("N1", N[0,:])
-        if pflag: print("N2", N[1,:])
-
-        #-------------------- WARNING --------------------------
-        # Since here we start to distinguish x-, y- traction/flux, if the residual contains
-        # the gradient term, then we can use different B function for either x-direction
-        # or reversed y-direction as the operator to calculate the residual on the edge.
-        # For now, we are good.
-        #
-        #---------------- END OF WARNING -----------------------
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_1 = jxw * (Rx1 + Rx2)
-        Ry_1 = jxw * (Ry1 + Ry2)
-
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_2, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_2, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_2, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_2, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_2 = jxw * (Rx1 + Rx2)
-        Ry_2 = jxw * (Ry1 + Ry2)
-
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_3, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_3, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_3, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_3, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_3 = jxw * (Rx1 + Rx2)
-        Ry_3 = jxw * (Ry1 + Ry2)
-
-
-        # element level residual for traction in either x or y direction
-        Rx_1 = tf.reshape(Rx_1, [-1, new_shape[0], new_shape[1], 2])
-        Ry_1 = tf.reshape(Ry_1, [-1, new_shape[0], new_shape[1], 2])
-        Rx_2 = tf.reshape(Rx_2, [-1, new_shape[0], new_shape[1], 2])
-        Ry_2 = tf.reshape(Ry_2, [-1, new_shape[0], new_shape[1], 2])
-        Rx_3 = tf.reshape(Rx_3, [-1, new_shape[0], new_shape[1], 2])
-        Ry_3 = tf.reshape(Ry_3, [-1, new_shape[0], new_shape[1], 2])
-
-        if pflag: print('Rx1_1', np.shape(Rx_1), Rx_1[0,:,:,0])
-        if pflag: print('Rx2_1', np.shape(Rx_1), Rx_1[0,:,:,1])
-        if pflag: print('Ry1_1', np.shape(Ry_1), Ry_1[0,:,:,0])
-        if pflag: print('Ry2_1', np.shape(Ry_1), Ry_1[0,:,:,1])
-        if pflag: print('Rx1_2', np.shape(Rx_2), Rx_2[0,:,:,0])
-        if pflag: print('Rx2_2', np.shape(Rx_2), Rx_2[0,:,:,1])
-        if pflag: print('Ry1_2', np.shape(Ry_2), Ry_2[0,:,:,0])
-        if pflag: print('Ry2_2', np.shape(Ry_2), Ry_2[0,:,:,1])
-        if pflag: print('Rx1_3', np.shape(Rx_3), Rx_3[0,:,:,0])
-        if pflag: print('Rx2_3', np.shape(Rx_3), Rx_3[0,:,:,1])
-        if pflag: print('Ry1_3', np.shape(Ry_3), Ry_3[0,:,:,0])
-        if pflag: print('Ry2_3', np.shape(Ry_3), Ry_3[0,:,:,1])
-    elif dof == 4:
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_1, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_1, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_1, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_1, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_1 = jxw * (Rx1 + Rx2)
-        Ry_1 = jxw * (Ry1 + Ry2)
-
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_2, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_2, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_2, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_2, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_2 = jxw * (Rx1 + Rx2)
-        Ry_2 = jxw * (Ry1 + Ry2)
-
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_3, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_3, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_3, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_3, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_3 = jxw * (Rx1 + Rx2)
-        Ry_3 = jxw * (Ry1 + Ry2)
-
-        elem_x2_hbar_gp1 = tf.linalg.matvec(elem_x2_4, N[0,:]) 
-        elem_x2_hbar_gp2 = tf.linalg.matvec(elem_x2_4, N[1,:]) 
-        elem_y2_hbar_gp1 = tf.linalg.matvec(elem_y2_4, N[0,:]) 
-        elem_y2_hbar_gp2 = tf.linalg.matvec(elem_y2_4, N[1,:]) 
-
-        elem_x2_hbar_gp1 = tf.reshape(elem_x2_hbar_gp1,[-1, 1])
-        elem_x2_hbar_gp2 = tf.reshape(elem_x2_hbar_gp2,[-1, 1])
-        elem_y2_hbar_gp1 = tf.reshape(elem_y2_hbar_gp1,[-1, 1])
-        elem_y2_hbar_gp2 = tf.reshape(elem_y2_hbar_gp2,[-1, 1])
-
-        Rx1 = tf.matmul(elem_x2_hbar_gp1, N[0:1,:]) 
-        Rx2 = tf.matmul(elem_x2_hbar_gp2, N[1:2,:]) 
-        Ry1 = tf.matmul(elem_y2_hbar_gp1, N[0:1,:]) 
-        Ry2 = tf.matmul(elem_y2_hbar_gp2, N[1:2,:]) 
-
-        Rx_4 = jxw * (Rx1 + Rx2)
-        Ry_4 = jxw * (Ry1 + Ry2)
-
-        # element level residual for traction in either x or y direction
-        Rx_1 = tf.reshape(Rx_1, [-1, new_shape[0], new_shape[1], 2])
-        Ry_1 = tf.reshape(Ry_1, [-1, new_shape[0], new_shape[1], 2])
-        Rx_2 = tf.reshape(Rx_2, [-1, new_shape[0], new_shape[1], 2])
-        Ry_2 = tf.reshape(Ry_2, [-1, new_shape[0], new_shape[1], 2])
-        Rx_3 = tf.reshape(Rx_3, [-1, new_shape[0], new_shape[1], 2])
-        Ry_3 = tf.reshape(Ry_3, [-1, new_shape[0], new_shape[1], 2])
-        Rx_4 = tf.reshape(Rx_4, [-1, new_shape[0], new_shape[1], 2])
-        Ry_4 = tf.reshape(Ry_4, [-1, new_shape[0], new_shape[1], 2])
-
-
-
-    if dof == 1:
-        c_x1 = Rx[:,:,:,0:1]
-        c_x2 = tf.roll(Rx[:,:,:,1:2], [1], [1])
-
-        # on 2020-07-16, was not sure, why this is not shift to the row axis to get nodal value. Right now, it's still nodal information 
-
-        c_y1 = Ry[:,:,:,0:1]
-        c_y2 = tf.roll(Ry[:,:,:,1:2], [1], [2])
-        if pflag: print('Rx 1 (before): ', Rx[0,:,:,0])
-        if pflag: print('Rx 1 (after ): ', c_x1[0,:,:,0])
-        if pflag: print('Rx 2 (before): ', Rx[0,:,:,1])
-        if pflag: print('Rx 2 (after ): ', c_x2[0,:,:,0])
-
-        if pflag: print('Ry 1 (before): ', Ry[0,:,:,0])
-        if pflag: print('Ry 1 (after ): ', c_y1[0,:,:,0])
-        if pflag: print('Ry 2 (before): ', Ry[0,:,:,1])
-        if pflag: print('Ry 2 (after ): ', c_y2[0,:,:,0])
-
-        Rx = c_x1 + c_x2
-        Ry = c_y1 + c_y2
-        # Add on 2020-07-16. Note on 2020-07-17, not working well
-        # Rx = tf.roll(Rx[:,:,:,0:1], [1], [2])
-        # Ry = tf.roll(Ry[:,:,:,0:1], [1], [1])
-        #---------------------
-        if pflag: print('Pay attention to potential errors here')
-        if pflag: print('Rx : ', Rx[0,:,:,0])
-        if pflag: print('Ry : ', Ry[0,:,:,0])
+    args:
+        data_input (numpy array): size of [batch, node_depth, node_height, node_width, dof*2]
+        dof (int): dof per node
+        dh (float or tuple): element size, or (dx, dy, dz)
+    return:
+        numpy array: nodal Neumann residual value with size of [batch, node_depth, node_height, node_width, dof]
+    """
+    data_input = tf.convert_to_tensor(data_input, dtype=tf.float32)
+    neumann_data = data_input[..., dof:2*dof]
 
-    elif dof == 2:
-        c_x1 = Rx_1[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_1[:,:,:,1:2], [1], [1])
+    Rx, Ry, Rz, neumann_mask, _, _ = ComputeNeumannFaceResidualNodalData3D(neumann_data, neumann_data, neumann_data, dh=dh)
+    R = tf.multiply(Rx + Ry + Rz, neumann_mask)
+    return R
 
-        c_y1 = Ry_1[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_1[:,:,:,1:2], [1], [2])
 
-        Rx_1 = c_x1 + c_x2
-        Ry_1 = c_y1 + c_y2
-        if pflag: print('Rx_1 : ', Rx_1[0,:,:,0])
-        if pflag: print('Ry_1 : ', Ry_1[0,:,:,0])
+def ComputeNeumannBoundaryResidualNodalDataNew3D(data_input, dh, dof):
+    """ 
+    3D version of ComputeNeumannBoundaryResidualNodalDataNew(): three Neumann channels per dof, t_x on the faces with the 
+    normal x, t_y on the faces with the normal y, t_z on the faces with the normal z. Works for any dof.
 
-        c_x1 = Rx_2[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_2[:,:,:,1:2], [1], [1])
+    args:
+        data_input (numpy array): size of [batch, node_depth, node_height, node_width, dof*4], [Dirichlet (dof), t_x (dof), t_y (dof), t_z (dof)]
+        dof (int): dof per node
+        dh (float or tuple): element size, or (dx, dy, dz)
+    return:
+        numpy array: nodal Neumann residual value with size of [batch, node_depth, node_height, node_width, dof]
+    """
+    data_input = tf.convert_to_tensor(data_input, dtype=tf.float32)
+    neumann_x = data_input[..., dof:2*dof]
+    neumann_y = data_input[..., 2*dof:3*dof]
+    neumann_z = data_input[..., 3*dof:4*dof]
 
-        c_y1 = Ry_2[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_2[:,:,:,1:2], [1], [2])
+    Rx, Ry, Rz, neumann_mask_x, neumann_mask_y, neumann_mask_z = ComputeNeumannFaceResidualNodalData3D(neumann_x, neumann_y, neumann_z, dh=dh)
+    R = tf.multiply(Rx, neumann_mask_x) + tf.multiply(Ry, neumann_mask_y) + tf.multiply(Rz, neumann_mask_z)
+    return R
 
-        Rx_2 = c_x1 + c_x2
-        Ry_2 = c_y1 + c_y2
-        if pflag: print('Rx_2 : ', Rx_2[0,:,:,0])
-        if pflag: print('Ry_2 : ', Ry_2[0,:,:,0])
-        if pflag: print('Pay attention to potential errors here')
 
-    elif dof == 3:
-        c_x1 = Rx_1[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_1[:,:,:,1:2], [1], [1])
+# process-wide cache of the constant tables (GP info, selector kernels), see GetCachedConstants()
+constant_cache = {}
 
-        c_y1 = Ry_1[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_1[:,:,:,1:2], [1], [2])
+def GetCachedConstants(key, build, dtype=tf.float32):
+    """ 
+    Build constant arrays once per process and key. The arrays are stored as eager tensors, which tf.function captures
+    on each trace instead of creating new graph constants from numpy arrays.
 
-        Rx_1 = c_x1 + c_x2
-        Ry_1 = c_y1 + c_y2
-        if pflag: print('Rx_1 : ', Rx_1[0,:,:,0])
-        if pflag: print('Ry_1 : ', Ry_1[0,:,:,0])
+    args:
+        key (tuple): e.g. ('2D GPs', (dx, dy), dof, GPs, dtype)
+        build (function): () -> array or tuple of arrays, python scalars and None are kept as they are
+        dtype (tf.dtype): dtype of the tensors
+    return:
+        same structure as build()
+    """
+    if key not in constant_cache:
+        # eager even if the first call is inside of a tf.function
+        with tf.init_scope():
+            constant_cache[key] = tf.nest.map_structure(
+                lambda x: tf.cast(x, dtype) if isinstance(x, (np.ndarray, tf.Tensor)) else x, build())
+    return constant_cache[key]
 
-        c_x1 = Rx_2[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_2[:,:,:,1:2], [1], [1])
 
-        c_y1 = Ry_2[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_2[:,:,:,1:2], [1], [2])
+def Get1DGaussPointInfo(dh=1.0, GPs=2, dof=1, dtype=tf.float32):
+    """ 
+    cached Build1DGaussPointInfo(), see GetCachedConstants()
+    """
+    return GetCachedConstants(('1D GPs', float(dh), dof, GPs, dtype), lambda: Build1DGaussPointInfo(dh=dh, GPs=GPs, dof=dof), dtype)
 
-        Rx_2 = c_x1 + c_x2
-        Ry_2 = c_y1 + c_y2
-        if pflag: print('Rx_2 : ', Rx_2[0,:,:,0])
-        if pflag: print('Ry_2 : ', Ry_2[0,:,:,0])
-        if pflag: print('Pay attention to potential errors here')
 
-        c_x1 = Rx_3[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_3[:,:,:,1:2], [1], [1])
+def Get2DGaussPointInfo(dh=1.0, GPs=4, dof=1, dtype=tf.float32):
+    """ 
+    cached Build2DGaussPointInfo(), see GetCachedConstants()
+    """
+    return GetCachedConstants(('2D GPs', GetElementSize(dh), dof, GPs, dtype), lambda: Build2DGaussPointInfo(dh=dh, GPs=GPs, dof=dof), dtype)
 
-        c_y1 = Ry_3[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_3[:,:,:,1:2], [1], [2])
 
-        Rx_3 = c_x1 + c_x2
-        Ry_3 = c_y1 + c_y2
-        if pflag: print('Rx_3 : ', Rx_3[0,:,:,0])
-        if pflag: print('Ry_3 : ', Ry_3[0,:,:,0])
-        if pflag: print('Pay attention to potential errors here')
-    elif dof == 4:
-        c_x1 = Rx_1[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_1[:,:,:,1:2], [1], [1])
+def Get3DGaussPointInfo(dh=1.0, GPs=8, dof=1, dtype=tf.float32):
+    """ 
+    cached Build3DGaussPointInfo(), see GetCachedConstants()
+    """
+    return GetCachedConstants(('3D GPs', GetElementSize(dh, dim=3), dof, GPs, dtype), lambda: Build3DGaussPointInfo(dh=dh, GPs=GPs, dof=dof), dtype)
 
-        c_y1 = Ry_1[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_1[:,:,:,1:2], [1], [2])
 
-        Rx_1 = c_x1 + c_x2
-        Ry_1 = c_y1 + c_y2
+def GetGaussLegendreRule(points):
+    """ 
+    Gauss-Legendre rule on [0, 1]
 
-        c_x1 = Rx_2[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_2[:,:,:,1:2], [1], [1])
+    args:
+        points (int): number of points, 1, 2 or 3
+    return:
+        - coordinates (numpy array) [points]
+        - weights (numpy array) [points], sum to 1
+    """
+    if points not in (1, 2, 3):
+        raise ValueError("Only 1, 2 or 3 Gauss points per direction are implemented, please choose a different GPs!", points)
+    xi, w = np.polynomial.legendre.leggauss(points)
+    return 0.5 * (xi + 1.0), 0.5 * w
 
-        c_y1 = Ry_2[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_2[:,:,:,1:2], [1], [2])
 
-        Rx_2 = c_x1 + c_x2
-        Ry_2 = c_y1 + c_y2
+def Build1DGaussPointInfo(dh=1.0, GPs=2, dof=1):
+    """ 
+    Gauss-Legendre rule on a 2-node edge from node 1 (s=0) to node 2 (s=1)
 
-        c_x1 = Rx_3[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_3[:,:,:,1:2], [1], [1])
+    args:
+        dh (float): element size
+        GPs (int): total Gauss point number: 1, 2 or 3
+        dof (int): dof per node
 
-        c_y1 = Ry_3[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_3[:,:,:,1:2], [1], [2])
+    return:
+        - shape function (numpy array) with size of [GPs, Nodes=2*dof], the dofs of a node are next to each other
+        - gradient shape function (numpy array) [None] Not implemented.
+        - weight times jacobian per gauss point (numpy array) [GPs]
+    """
+    # B is disabled as the y-axis was not tested. And it is not clear how to make one B to work for 
+    # both x-axis and y-axis, as it's a 1D GPs rule.
+    s, w = GetGaussLegendreRule(GPs)
+    # the closer node gets the larger value, e.g. 0.788 and 0.211 for GPs=2
+    N_node = np.stack([1.0 - s, s], axis=1)
+    N = np.zeros([GPs, 2*dof])
+    for n in range(0, 2):
+        for i in range(0, dof):
+            N[:, n*dof+i] = N_node[:, n]
+    B = None
+    jxw = w * dh
+    return N.astype(np.float32), B, jxw.astype(np.float32)
+
+
+def Build2DGaussPointInfo(dh=1.0, GPs=4, dof=1):
+    """ 
+    Tensor product Gauss-Legendre rule on a 4-node element with the node numbering and axes of the images:
 
-        Rx_3 = c_x1 + c_x2
-        Ry_3 = c_y1 + c_y2
+    .. code-block:: text
 
-        c_x1 = Rx_4[:,:,:,0:1]
-        c_x2 = tf.roll(Rx_4[:,:,:,1:2], [1], [1])
+        n1 (x=0, y=1)   n2 (x=1, y=1)       image row i,   col j, j+1
+        n3 (x=0, y=0)   n4 (x=1, y=0)       image row i+1, col j, j+1
 
-        c_y1 = Ry_4[:,:,:,0:1]
-        c_y2 = tf.roll(Ry_4[:,:,:,1:2], [1], [2])
+    The GPs are ordered with x first: q = iy * n + ix, e.g. GP1 is next to n3 and GP4 next to n2 for GPs=4.
 
-        Rx_4 = c_x1 + c_x2
-        Ry_4 = c_y1 + c_y2
+    args:
+        dh (float or tuple): element size, or (dx, dy) for a rectangular grid
+        GPs (int): total Gauss point number: 1 (reduced integration), 4 (2x2) or 9 (3x3)
+        dof (int): dof per node
 
+    return:
+        - shape function (numpy array) with size of [GPs, Nodes=4*dof]
+        - gradient shape function (numpy array) [GPs, Nodes=4*dof, dim=2*dof] last dim: dof=1: [dc/dx, dc/dy] dof=2: [dx/dx, dx/dy, dy/dx, dy/dy]
+        - weight times jacobian per gauss point (numpy array) [GPs]
+    """
+    dx, dy = GetElementSize(dh)
+    points = int(round(np.sqrt(GPs)))
+    if points * points != GPs:
+        raise ValueError("GPs = ", GPs, " is not a tensor product rule, please choose 1, 4 or 9!")
+    s, w = GetGaussLegendreRule(points)
+    x = np.tile(s, points)
+    y = np.repeat(s, points)
+
+    # node (x, y) coordinates of n1, n2, n3, n4
+    node_x = np.array([0.0, 1.0, 0.0, 1.0])
+    node_y = np.array([1.0, 1.0, 0.0, 0.0])
+    # bilinear shape functions, N_n = Nx_n(x) * Ny_n(y), with Nx_n(x) = x or 1 - x
+    Nx = np.where(node_x == 1.0, x[:, None], 1.0 - x[:, None])
+    Ny = np.where(node_y == 1.0, y[:, None], 1.0 - y[:, None])
+    dNx = np.where(node_x == 1.0, 1.0, -1.0)[None, :] * np.ones([GPs, 1])
+    dNy = np.where(node_y == 1.0, 1.0, -1.0)[None, :] * np.ones([GPs, 1])
+    N_node = Nx * Ny
+    B_node = np.stack([dNx * Ny, Nx * dNy], axis=2)
+
+    N = np.zeros([GPs, 4*dof])
+    B = np.zeros([GPs, 4*dof, 2*dof])
+    for n in range(0, 4):
+        for i in range(0, dof):
+            N[:, n*dof+i] = N_node[:, n]
+            B[:, n*dof+i, 2*i:2*i+2] = B_node[:, n, :]
+    jxw = np.repeat(w, points) * np.tile(w, points) * dx * dy
+    # float32 division by dx (d/dx columns) and dy (d/dy columns) as in the previous tables
+    B = B.astype(np.float32) / np.tile(np.array([dx, dy], dtype=np.float32), dof)
+    return N.astype(np.float32), B, jxw.astype(np.float32)
+
+
+def Build3DGaussPointInfo(dh=1.0, GPs=8, dof=1):
+    """ 
+    Tensor product Gauss-Legendre rule on an 8-node (trilinear) hexahedral element of the 3D images [depth, height, width]. 
+    The nodes n1, n2, n3, n4 are the ones of Build2DGaussPointInfo() on the image slice k, n5, n6, n7, n8 the same nodes 
+    on the slice k+1. x is along the width, y against the height and z against the depth (right-handed):
 
-    if dof == 1 :
-        #----------------- first version of implementation ----------- 
-        # works fine for large dataset problem because of mask contains both x- and y- direction component. However, 
-        # the 2nd implementation is less error-prone, in case channel has value, channel 1 remains empty, then
-        # mask can mask out everything.
-        # R = Rx + Ry
-        # R = tf.multiply(R, neumann_mask[:,:,:,0:1])
-        #-------------------------------------------------------------
-
-        R = tf.multiply(Rx, neumann_mask[:,:,:,0:1]) + tf.multiply(Ry, neumann_mask[:,:,:,1:2])
-        if pflag: print('R: ', np.shape(R), R[0,:,:,0])
-    elif dof == 2:
-        print("Not fully tested! Exit... Please test this part to enable the code")
-        exit(0)
-        R_1 = tf.multiply(Rx_1, neumann_mask[:,:,:,0:1]) + tf.multiply(Ry_1, neumann_mask[:,:,:,1:2]) 
-        if pflag: print('R_1: ', np.shape(R_1), R_1[0,:,:,0])
-        R_2 = tf.multiply(Rx_2, neumann_mask[:,:,:,2:3]) + tf.multiply(Ry_2, neumann_mask[:,:,:,3:4])  
-        if pflag: print('R_2: ', np.shape(R_2), R_2[0,:,:,0])
-        R = tf.concat([R_1, R_2], axis=3)
-        if pflag: print('R: ', np.shape(R), R[0,:,:,0], R[0,:,:,1])
-    elif dof == 3:
-        print("Not fully tested! Exit... Please test this part to enable the code")
-        exit(0)
-        R_1 = tf.multiply(Rx_1, neumann_mask[:,:,:,0:1]) + tf.multiply(Ry_1, neumann_mask[:,:,:,1:2]) 
-        if pflag: print('R_1: ', np.shape(R_1), R_1[0,:,:,0])
-        R_2 = tf.multiply(Rx_2, neumann_mask[:,:,:,2:3]) + tf.multiply(Ry_2, neumann_mask[:,:,:,3:4]) 
-        if pflag: print('R_2: ', np.shape(R_2), R_2[0,:,:,0])
-        R_3 = tf.multiply(Rx_3, neumann_mask[:,:,:,4:5]) + tf.multiply(Ry_3, neumann_mask[:,:,:,5:6]) 
-        if pflag: print('R_3: ', np.shape(R_3), R_3[0,:,:,0])
-
-        R = tf.concat([R_1, R_2, R_3], axis=3)
-        if pflag: print('R: ', np.shape(R), R[0,:,:,0], R[0,:,:,1], R[0,:,:,2])
-    elif dof == 4:
-        print("Not fully tested! Exit... Please test this part to enable the code")
-        exit(0)
-        R_1 = tf.multiply(Rx_1, neumann_mask[:,:,:,0:1]) + tf.multiply(Ry_1, neumann_mask[:,:,:,1:2]) 
-        R_2 = tf.multiply(Rx_2, neumann_mask[:,:,:,2:3]) + tf.multiply(Ry_2, neumann_mask[:,:,:,3:4]) 
-        R_3 = tf.multiply(Rx_3, neumann_mask[:,:,:,4:5]) + tf.multiply(Ry_3, neumann_mask[:,:,:,5:6]) 
-        R_4 = tf.multiply(Rx_4, neumann_mask[:,:,:,6:7]) + tf.multiply(Ry_4, neumann_mask[:,:,:,7:8]) 
-        R = tf.concat([R_1, R_2, R_3, R_4], axis=3)
-        # R = tf.multiply(R, neumann_mask) # remove other edge left R due to conv operation: do test edge (1,3) and (2,4)
-        if pflag: print('R: ', np.shape(R), R[0,:,:,0], R[0,:,:,1], R[0,:,:,2], R[0,:,:,3])
-
-    # exit(0)
+    .. code-block:: text
 
-    return R
+        n1 (x=0, y=1, z=1)   n2 (x=1, y=1, z=1)       slice k,   image row i,   col j, j+1
+        n3 (x=0, y=0, z=1)   n4 (x=1, y=0, z=1)       slice k,   image row i+1, col j, j+1
+        n5 (x=0, y=1, z=0)   n6 (x=1, y=1, z=0)       slice k+1, image row i,   col j, j+1
+        n7 (x=0, y=0, z=0)   n8 (x=1, y=0, z=0)       slice k+1, image row i+1, col j, j+1
 
+    The GPs are ordered with x first, then y: q = (iz * n + iy) * n + ix.
 
-def Get1DGaussPointInfo(dh=1.0, GPs=2, dof=1):
-    """ 
     args:
-        dh (float): element size
-        GPs (int): total Gauss point number 
+        dh (float or tuple): element size, or (dx, dy, dz) for a rectangular grid
+        GPs (int): total Gauss point number: 1 (reduced integration), 8 (2x2x2) or 27 (3x3x3)
         dof (int): dof per node
 
     return:
-        - shape function (numpy array) with size of [GPs, Nodes=2]
-        - gradient shape function (numpy array) [None] Not implemented.
-        - weight per gauss point (float scalar)
+        - shape function (numpy array) with size of [GPs, Nodes=8*dof]
+        - gradient shape function (numpy array) [GPs, Nodes=8*dof, dim=3*dof] last dim: dof=1: [dc/dx, dc/dy, dc/dz] 
+          dof=3: [dx/dx, dx/dy, dx/dz, dy/dx, ..., dz/dz]
+        - weight times jacobian per gauss point (numpy array) [GPs]
+    """
+    dx, dy, dz = GetElementSize(dh, dim=3)
+    points = int(round(GPs ** (1.0 / 3.0)))
+    if points * points * points != GPs:
+        raise ValueError("GPs = ", GPs, " is not a tensor product rule, please choose 1, 8 or 27!")
+    s, w = GetGaussLegendreRule(points)
+    x = np.tile(s, points * points)
+    y = np.tile(np.repeat(s, points), points)
+    z = np.repeat(s, points * points)
+
+    # node (x, y, z) coordinates of n1, ..., n8
+    node_x = np.array([0.0, 1.0, 0.0, 1.0, 0.0, 1.0, 0.0, 1.0])
+    node_y = np.array([1.0, 1.0, 0.0, 0.0, 1.0, 1.0, 0.0, 0.0])
+    node_z = np.array([1.0, 1.0, 1.0, 1.0, 0.0, 0.0, 0.0, 0.0])
+    # trilinear shape functions, N_n = Nx_n(x) * Ny_n(y) * Nz_n(z)
+    Nx = np.where(node_x == 1.0, x[:, None], 1.0 - x[:, None])
+    Ny = np.where(node_y == 1.0, y[:, None], 1.0 - y[:, None])
+    Nz = np.where(node_z == 1.0, z[:, None], 1.0 - z[:, None])
+    dNx = np.where(node_x == 1.0, 1.0, -1.0)[None, :] * np.ones([GPs, 1])
+    dNy = np.where(node_y == 1.0, 1.0, -1.0)[None, :] * np.ones([GPs, 1])
+    dNz = np.where(node_z == 1.0, 1.0, -1.0)[None, :] * np.ones([GPs, 1])
+    N_node = Nx * Ny * Nz
+    B_node = np.stack([dNx * Ny * Nz, Nx * dNy * Nz, Nx * Ny * dNz], axis=2)
+
+    N = np.zeros([GPs, 8*dof])
+    B = np.zeros([GPs, 8*dof, 3*dof])
+    for n in range(0, 8):
+        for i in range(0, dof):
+            N[:, n*dof+i] = N_node[:, n]
+            B[:, n*dof+i, 3*i:3*i+3] = B_node[:, n, :]
+    jxw = np.tile(w, points * points) * np.tile(np.repeat(w, points), points) * np.repeat(w, points * points) * dx * dy * dz
+    B = B.astype(np.float32) / np.tile(np.array([dx, dy, dz], dtype=np.float32), dof)
+    return N.astype(np.float32), B, jxw.astype(np.float32)
+
+
+def GetElementSelectorKernel(dof, dtype=tf.float32):
+    """ 
+    Stacked 2x2 selector kernel of the nodes n1 (top left), n2 (top right), n3 (bottom left), n4 (bottom right) of an element
 
-    todo:
-        make this function to work with (1S, 1V), 2S, 1V1S, 3S, 2V, etc.
+    args:
+        dof (int): dof per node
+    return:
+        tensor: [2, 2, dof, 4*dof], output channel n*dof+i is dof i of node n (cached, see GetCachedConstants())
     """
+    def build():
+        selector = np.zeros([2, 2, dof, 4*dof], dtype=np.float32)
+        for n, (r, c) in enumerate([(0, 0), (0, 1), (1, 0), (1, 1)]):
+            for i in range(0, dof):
+                selector[r, c, i, n*dof+i] = 1.0
+        return selector
+    return GetCachedConstants(('element selector', dof, dtype), build, dtype)
+
 
-    # print ("For 1D gauss point, the flip of the index for the y-axis was not tested. Be extremely careful if B is used. But for Neumann BCs, it might be just fine as the order of the node does not matter that much.")
-    if GPs == 2 :
-        #
-        if dof == 1:
-            # N (gp=2,nodes*dofs=2)
-            N = tf.cast(
-                    np.array(
-                        [
-                            # the shape function value should not be changed
-                            # . x x .  . 1 2 .
-                            # the closer one get value of 0.788, the further one get value of 0.211
-                            [0.7886751345948129, 0.2113248654051871,], #GP1, [N1,N2]
-                            [0.2113248654051871, 0.7886751345948129,], #GP2, [N1,N2]
-                        ]
-                        ),
-            tf.float32)
-
-            # B is disabled as the y-axis was not tested. And it is not clear how to make one B to work for 
-            # both x-axis and y-axis, as it's a 1D GPs rule.
-            # B = tf.cast(
-                # np.array([
-                    # [
-                        # # GP1
-                        # [0.7886751345948129], # N1, coor 3
-                        # [0.2113248654051871], # N2, coor 4
-                    # ],
-                    # [
-                        # # GP2
-                        # [0.2113248654051871], # N1, coor 3
-                        # [0.7886751345948129], # N2, coor 4
-                    # ],
-                # ]),
-                # tf.float32) / dh 
-        elif dof == 2:
-            # N (gp=2,nodes*dofs=4)
-            raise ValueError("Please disable this Error. Face GPs in is not tested for dof=2, be careful here!")
-            N = tf.cast(
-                    np.array(
-                        [
-                            [0.7886751345948129, 0.7886751345948129, 0.2113248654051871, 0.2113248654051871,], #GP1, [N1,N2]
-                            [0.2113248654051871, 0.2113248654051871, 0.7886751345948129, 0.7886751345948129,], #GP2, [N1,N2]
-                        ]
-                        ),
-            tf.float32)
-
-            # B = tf.cast(
-                # np.array([
-                    # [
-                        # # GP1
-                        # [0.7886751345948129, 0], # N1, coor 3
-                        # [0, 0.7886751345948129], # N1, coor 3
-                        # [0.2113248654051871, 0], # N2, coor 4
-                        # [0, 0.2113248654051871], # N2, coor 4
-                    # ],
-                    # [
-                        # # GP2
-                        # [0.2113248654051871, 0], # N1, coor 3
-                        # [0, 0.2113248654051871], # N1, coor 3
-                        # [0.7886751345948129, 0], # N2, coor 4
-                        # [0, 0.7886751345948129], # N2, coor 4
-                    # ],
-                # ]),
-                # tf.float32) / dh 
-        else :
-            raise ValueError("dof = ", dof, " is not implemented!")
-
-        B = None
-
-        jxw = dh*0.5
-        # print('N: ', np.shape(N), '(q,n)')
-        # print('q=0, N: ', N[0,:])
-        # print('q=1, N: ', N[1,:])
-        # print('q=2, N: ', N[2,:])
-        # print('q=3, N: ', N[3,:])
-        # print('B: ', np.shape(B), '(q,n,x)' )
-        # print('q=0 B: ', B[0,:,:])
-        # print('q=1 B: ', B[1,:,:])
-        # print('q=2 B: ', B[2,:,:])
-        # print('q=3 B: ', B[3,:,:])
-        # print('jxw: ', jxw)
-
-        return N, B, jxw
-    else:
-        raise ValueError("Only GPs == 2 is implemented, please choose a different GPs!", GPs)
-
-
-def Get2DGaussPointInfo(dh=1.0, GPs=4, dof=1):
+def GetElementSelectorKernel3D(dof, dtype=tf.float32):
     """ 
+    Stacked 2x2x2 selector kernel of the nodes n1, ..., n8 of a hexahedral element, see Build3DGaussPointInfo()
+
     args:
-        dh (float): element size
-        GPs (int): total Gauss point number 
         dof (int): dof per node
-
     return:
-        - shape function (numpy array) with size of [GPs, Nodes=4*dof]
-        - gradient shape function (numpy array) [GPs, Nodes=4*dof, dim=2*dof] last dim: dof=1: [dc/dx, dc/dy] dof=2: [dx/dx, dx/dy, dy/dx, dy/dy]
-        - weight per gauss point (float scalar)
-
-    todo:
-        make this function to work with (1S, 1V), 2S, 1V1S, 3S, 2V, etc.
+        tensor: [2, 2, 2, dof, 8*dof], output channel n*dof+i is dof i of node n (cached, see GetCachedConstants())
     """
-    if GPs == 4 :
-        #
-        if dof == 1:
-            # N (gp=4,nodes*dofs=4)
-
-            # check reshape [1,2,3,4] to (2,2)
-            # check reshape [[1,2],[3,4]] to (4)
-            N = tf.cast(
-                    np.array(
-                        [
-                            # the shape function value should not be changed
-                            # .      . .      .
-                            #   x  x     1  2
-                            #   x  x     3  4
-                            # .      . .      .
-                            # the closer one get value of 0.622, the further one get value of 0.044
-                            #GP1, [N3,N4,N1,N2]
-                            [0.1666666666666667, 0.04465819873852046, 0.6220084679281462, 0.1666666666666667,], 
-                            # [0.6220084679281462, 0.1666666666666667, 0.1666666666666667, 0.04465819873852046,], #GP1, [N1,N2,N3,N4]
-
-                            #GP2, [N3,N4,N1,N2]
-                            [0.04465819873852046, 0.1666666666666667, 0.1666666666666667, 0.6220084679281462,], 
-                            # [0.1666666666666667, 0.6220084679281462, 0.04465819873852046, 0.1666666666666667,], #GP2, [N1,N2,N3,N4]
-
-                            #GP3, [N3,N4,N1,N2]
-                            [0.6220084679281462, 0.1666666666666667, 0.1666666666666667, 0.04465819873852046,], 
-                            # [0.1666666666666667, 0.04465819873852046, 0.6220084679281462, 0.1666666666666667,], #GP3, [N1,N2,N3,N4]
-
-                            #GP4, [N3,N4,N1,N2]
-                            [0.1666666666666667, 0.6220084679281462, 0.04465819873852046, 0.1666666666666667,],
-                            # [0.04465819873852046, 0.1666666666666667, 0.1666666666666667, 0.6220084679281462,], #GP4, [N1,N2,N3,N4]
-
-                        ]
-                        ),
-            tf.float32)
-
-            B = tf.cast(
-                np.array([
-                    [
-                        # GP1
-                        [-0.2113248654051871, 0.7886751345948129],  # N3, coor 1
-                        [0.2113248654051871, 0.2113248654051871],   # N4, coor 2
-                        [-0.7886751345948129, -0.7886751345948129], # N1, coor 3
-                        [0.7886751345948129, -0.2113248654051871],  # N2, coor 4
-                    ],
-                    [
-                        # GP2
-                        [-0.2113248654051871, 0.2113248654051871],  # N3, coor 1
-                        [0.2113248654051871, 0.7886751345948129],   # N4, coor 2
-                        [-0.7886751345948129, -0.2113248654051871], # N1, coor 3
-                        [0.7886751345948129, -0.7886751345948129],  # N2, coor 4
-                    ],
-                    [
-                        # GP3
-                        [-0.7886751345948129, 0.7886751345948129],  # N3, coor 1
-                        [0.7886751345948129, 0.2113248654051871],   # N4, coor 2
-                        [-0.2113248654051871, -0.7886751345948129], # N1, coor 3
-                        [0.2113248654051871, -0.2113248654051871],  # N2, coor 4
-                    ],
-                    [
-                        # GP4
-                        [-0.7886751345948129, 0.2113248654051871],  # N3, coor 1
-                        [0.7886751345948129, 0.7886751345948129],   # N4, coor 2
-                        [-0.2113248654051871, -0.2113248654051871], # N1, coor 3
-                        [0.2113248654051871, -0.7886751345948129],  # N2, coor 4
-                    ]
-                ]),
-                tf.float32) / dh 
-        elif dof == 2:
-            # N (gp=4,nodes*dofs=8)
-            N = tf.cast(
-                    np.array(
-                        [
-                            #GP1, [N3,N4,N1,N2]
-                            [0.1666666666666667, 0.1666666666666667,  0.04465819873852046,0.04465819873852046, 0.6220084679281462,  0.6220084679281462,  0.1666666666666667,  0.1666666666666667, ], 
-                            #[0.6220084679281462, 0.6220084679281462,  0.1666666666666667, 0.1666666666666667,  0.1666666666666667,  0.1666666666666667,  0.04465819873852046, 0.04465819873852046,], #GP1, [N1,N2,N3,N4]
-
-                            #GP2, [N3,N4,N1,N2]
-                            [0.04465819873852046,0.04465819873852046, 0.1666666666666667, 0.1666666666666667,  0.1666666666666667,  0.1666666666666667,  0.6220084679281462,  0.6220084679281462, ], 
-                            #[0.1666666666666667, 0.1666666666666667,  0.6220084679281462, 0.6220084679281462,  0.04465819873852046, 0.04465819873852046, 0.1666666666666667,  0.1666666666666667, ], #GP2, [N1,N2,N3,N4]
-
-                            #GP3, [N3,N4,N1,N2]
-                            [0.6220084679281462, 0.6220084679281462,  0.1666666666666667, 0.1666666666666667,  0.1666666666666667,  0.1666666666666667,  0.04465819873852046, 0.04465819873852046,], 
-                            #[0.1666666666666667, 0.1666666666666667,  0.04465819873852046,0.04465819873852046, 0.6220084679281462,  0.6220084679281462,  0.1666666666666667,  0.1666666666666667, ], #GP3, [N1,N2,N3,N4]
-
-                            #GP4, [N3,N4,N1,N2]
-                            [0.1666666666666667, 0.1666666666666667,  0.6220084679281462, 0.6220084679281462,  0.04465819873852046, 0.04465819873852046, 0.1666666666666667,  0.1666666666666667, ], 
-                            #[0.04465819873852046,0.04465819873852046, 0.1666666666666667, 0.1666666666666667,  0.1666666666666667,  0.1666666666666667,  0.6220084679281462,  0.6220084679281462, ], #GP4, [N1,N2,N3,N4]
-                        ]
-                        ),
-            tf.float32)
-
-            B = tf.cast(
-                np.array([
-                    [
-                        # GP1
-                        [-0.2113248654051871, 0.7886751345948129, 0, 0],
-                        [0, 0, -0.2113248654051871, 0.7886751345948129],  # N3, coor 1
-                        [0.2113248654051871, 0.2113248654051871, 0, 0],
-                        [0, 0, 0.2113248654051871, 0.2113248654051871],   # N4, coor 2
-                        [-0.7886751345948129, -0.7886751345948129, 0, 0],
-                        [0, 0, -0.7886751345948129, -0.7886751345948129], # N1, coor 3
-                        [0.7886751345948129, -0.2113248654051871, 0, 0],
-                        [0, 0, 0.7886751345948129, -0.2113248654051871],  # N2, coor 4
-                    ],
-                    [
-                        # GP2
-                        [-0.2113248654051871, 0.2113248654051871, 0, 0],
-                        [0, 0, -0.2113248654051871, 0.2113248654051871],  # N3, coor 1
-                        [0.2113248654051871, 0.7886751345948129, 0, 0],
-                        [0, 0, 0.2113248654051871, 0.7886751345948129],   # N4, coor 2
-                        [-0.7886751345948129, -0.2113248654051871, 0, 0],
-                        [0, 0, -0.7886751345948129, -0.2113248654051871], # N1, coor 3
-                        [0.7886751345948129, -0.7886751345948129, 0, 0],
-                        [0, 0, 0.7886751345948129, -0.7886751345948129],  # N2, coor 4
-                    ],
-                    [
-                        # GP3
-                        [-0.7886751345948129, 0.7886751345948129, 0, 0],
-                        [0, 0, -0.7886751345948129, 0.7886751345948129],  # N3, coor 1
-                        [0.7886751345948129, 0.2113248654051871, 0, 0],
-                        [0, 0, 0.7886751345948129, 0.2113248654051871],   # N4, coor 2
-                        [-0.2113248654051871, -0.7886751345948129, 0, 0],
-                        [0, 0, -0.2113248654051871, -0.7886751345948129], # N1, coor 3
-                        [0.2113248654051871, -0.2113248654051871, 0, 0],
-                        [0, 0, 0.2113248654051871, -0.2113248654051871],  # N2, coor 4
-                    ],
-                    [
-                        # GP4
-                        [-0.7886751345948129, 0.2113248654051871, 0, 0],
-                        [0, 0, -0.7886751345948129, 0.2113248654051871],  # N3, coor 1
-                        [0.7886751345948129, 0.7886751345948129, 0, 0],
-                        [0, 0, 0.7886751345948129, 0.7886751345948129],   # N4, coor 2
-                        [-0.2113248654051871, -0.2113248654051871, 0, 0],
-                        [0, 0, -0.2113248654051871, -0.2113248654051871], # N1, coor 3
-                        [0.2113248654051871, -0.7886751345948129, 0, 0],
-                        [0, 0, 0.2113248654051871, -0.7886751345948129],  # N2, coor 4
-                    ]
-                ]),
-                tf.float32) / dh 
-        else :
-            raise ValueError("dof = ", dof, " is not implemented!")
-
-        jxw = dh*dh*0.25
-        # print('N: ', np.shape(N), '(q,n)')
-        # print('q=0, N: ', N[0,:])
-        # print('q=1, N: ', N[1,:])
-        # print('q=2, N: ', N[2,:])
-        # print('q=3, N: ', N[3,:])
-        # print('B: ', np.shape(B), '(q,n,x)' )
-        # print('q=0 B: ', B[0,:,:])
-        # print('q=1 B: ', B[1,:,:])
-        # print('q=2 B: ', B[2,:,:])
-        # print('q=3 B: ', B[3,:,:])
-        # print('jxw: ', jxw)
-
-        return N, B, jxw
-    else:
-        raise ValueError("Only GPs == 4 is implemented, please choose a different GPs!", GPs)
+    def build():
+        selector = np.zeros([2, 2, 2, dof, 8*dof], dtype=np.float32)
+        for n in range(0, 8):
+            d, r, c = n // 4, (n // 2) % 2, n % 2
+            for i in range(0, dof):
+                selector[d, r, c, i, n*dof+i] = 1.0
+        return selector
+    return GetCachedConstants(('element selector 3D', dof, dtype), build, dtype)
 
 
 def GetNodalInfoFromElementInfo(data, residual_mask, dof, padding='SAME'):
@@ -2423,96 +646,34 @@ def GetNodalInfoFromElementInfo(data, residual_mask, dof, padding='SAME'):
     return:
         numpy array: output with size of [None, node_height, node_width, dof]
 
-    todo:
-        make this function to work with (1S, 1V), 2S, 1V1S, 3S, 2V, etc.
+    note:
+        - the assembly is the transpose of LayerBulkResidual.GetElementInfo(): a conv2d_transpose with the same selector 
+          kernel adds the value of node n of element (i,j) to its node, e.g. n4 to node (i+1,j+1). Contributions outside 
+          of the node grid are dropped, instead of wrapping around as with the previous tf.roll, and no 4x intermediate 
+          of the shifted copies is needed.
+        - works for any dof
     """
-    # tf.roll( input, shift, axis, name=None)
-    # 't' is [0, 1, 2, 3, 4]
-    # roll(t, shift=2, axis=0) ==> [3, 4, 0, 1, 2]
-    
-    # shifting along multiple dimensions
-    # 't' is [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9]]
-    # roll(t, shift=[1, -2], axis=[0, 1]) ==> [[7, 8, 9, 5, 6], [2, 3, 4, 0, 1]]
-    
-    # shifting along the same axis multiple times
-    # 't' is [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9]]
-    # roll(t, shift=[2, -3], axis=[1, 1]) ==> [[1, 2, 3, 4, 0], [6, 7, 8, 9, 5]]
+    data = tf.multiply(data, residual_mask)
+    output_shape = tf.concat([tf.shape(data)[0:3], [dof]], 0)
+    nodal_val = tf.nn.conv2d_transpose(data, GetElementSelectorKernel(dof), output_shape, [1,1,1,1], padding)
+    return nodal_val
 
-    pflag = False
-    if dof == 1:
-        # data = tf.convert_to_tensor(data, dtype=tf.float32)
-        data = tf.multiply(data, residual_mask)
-
-        if pflag: print('data', np.shape(data))
-
-        c_n1 = data[:,:,:,0:1]
-        c_n2 = tf.roll(data[:,:,:,1:2], [1], [2])
-        c_n3 = tf.roll(data[:,:,:,2:3], [1], [1])
-        c_n4 = tf.roll(data[:,:,:,3:4], [1,1], [1,2])
-        # print('data 1 (before): ', data[0,:,:,0])
-        # print('data 1 (after ): ', c_n1[0,:,:,0])
-        # print('data 2 (before): ', data[0,:,:,1])
-        # print('data 2 (after ): ', c_n2[0,:,:,0])
-        # print('data 3 (before): ', data[0,:,:,2])
-        # print('data 3 (after ): ', c_n3[0,:,:,0])
-        # print('data 4 (before): ', data[0,:,:,3])
-        # print('data 4 (after ): ', c_n4[0,:,:,0])
-
-        nodal_c = tf.concat([c_n1, c_n2, c_n3, c_n4], 3)
-
-        nodal_val = tf.reduce_sum(nodal_c, axis=3, keepdims=True )
-    elif dof == 2:
-        # data = tf.convert_to_tensor(data, dtype=tf.float32)
-        data = tf.multiply(data, residual_mask)
-        if pflag: print('data', np.shape(data))
-
-        x_n1 = data[:,:,:,0:1]
-        y_n1 = data[:,:,:,1:2]
-        x_n2 = tf.roll(data[:,:,:,2:3], [1], [2])
-        y_n2 = tf.roll(data[:,:,:,3:4], [1], [2])
-        x_n3 = tf.roll(data[:,:,:,4:5], [1], [1])
-        y_n3 = tf.roll(data[:,:,:,5:6], [1], [1])
-        x_n4 = tf.roll(data[:,:,:,6:7], [1,1], [1,2])
-        y_n4 = tf.roll(data[:,:,:,7:8], [1,1], [1,2])
-
-        if pflag: print('data 1 (before): ', data[0,:,:,0])
-        if pflag: print('data 1 (after ): ', x_n1[0,:,:,0])
-        if pflag: print('data 2 (before): ', data[0,:,:,1])
-        if pflag: print('data 2 (after ): ', y_n1[0,:,:,0])
-        if pflag: print('data 3 (before): ', data[0,:,:,2])
-        if pflag: print('data 3 (after ): ', x_n2[0,:,:,0])
-        if pflag: print('data 4 (before): ', data[0,:,:,3])
-        if pflag: print('data 4 (after ): ', y_n2[0,:,:,0])
-
-
-        nodal_x = tf.concat([x_n1, x_n2, x_n3, x_n4], 3)
-        nodal_y = tf.concat([y_n1, y_n2, y_n3, y_n4], 3)
-        if pflag: print('nodal_x ', np.shape(nodal_x))
-        if pflag: print('nodal_y ', np.shape(nodal_y))
-        # nodal_x = tf.expand_dims(nodal_x,3)
-        # nodal_y = tf.expand_dims(nodal_y,3)
-
-        nodal_x = tf.reduce_sum(nodal_x, axis=3, keepdims=True )
-        nodal_y = tf.reduce_sum(nodal_y, axis=3, keepdims=True )
-        nodal_val = tf.concat([nodal_x, nodal_y], 3)
-    else:
-        # data = tf.convert_to_tensor(data, dtype=tf.float32)
-        data = tf.multiply(data, residual_mask)
-        if pflag: print('data', np.shape(data))
-        # use the above dof=1/2 as example to understand the following
-        R_dof = []
-        for i0 in range(0, dof):
-            x_n1 = data[:,:,:,i0:i0+1]
-            x_n2 = tf.roll(data[:,:,:,i0+dof:i0+1+dof], [1], [2])
-            x_n3 = tf.roll(data[:,:,:,i0+dof*2:i0+1+2*dof], [1], [1])
-            x_n4 = tf.roll(data[:,:,:,i0+dof*3:i0+1+3*dof], [1,1], [1,2])
-            nodal_x = tf.concat([x_n1, x_n2, x_n3, x_n4], 3)
-            nodal_x = tf.reduce_sum(nodal_x, axis=3, keepdims=True )
-            R_dof.append(nodal_x)
-        nodal_val = tf.concat(R_dof, 3)
-        print ('Nodal value for dof = ', dof, ' is not fully tested yet!')
-    if pflag: print('nodal_val ', np.shape(nodal_val))
 
+def GetNodalInfoFromElementInfo3D(data, residual_mask, dof, padding='SAME'):
+    """ 
+    3D version of GetNodalInfoFromElementInfo(): conv3d_transpose with the selector kernel of LayerBulkResidual3D.GetElementInfo()
+
+    Args:
+        data (numpy array/tensor): [None, elem_depth, elem_height, elem_width, 8*dof] (8 nodal values for 1 dof)
+        residual_mask (numpy_array):  [None, elem_depth, elem_height, elem_width, 1] 
+        dof (int): dof per node
+
+    return:
+        numpy array: output with size of [None, node_depth, node_height, node_width, dof]
+    """
+    data = tf.multiply(data, residual_mask)
+    output_shape = tf.concat([tf.shape(data)[0:4], [dof]], 0)
+    nodal_val = tf.nn.conv3d_transpose(data, GetElementSelectorKernel3D(dof), output_shape, [1,1,1,1,1], padding)
     return nodal_val
 
 
@@ -2573,28 +734,29 @@ class LayerBulkResidual(tf.keras.layers.Layer):
 
     def __init__(self, name='R_bulk_general'):
         super(LayerBulkResidual, self).__init__(name=name)
+        # total number of GPs of the element rule, see Build2DGaussPointInfo()
+        self.GPs = 4
+        # spatial dimension of the images and the elements
+        self.dim = 2
+        # names of the material parameters given as nodal fields, see ComputeMaterialFieldsAtAllGPs()
+        self.material_fields = []
 
     def initialize_arrays(self):
         """
         Initialize the kernel array to transform nodal arrangement to element arrangement. Get the Gauss Point information.
         """
-        self.n1 = np.array([[1, 0], [0, 0]])
-        self.n1 = np.expand_dims(self.n1, axis=2)
-        self.n1 = np.expand_dims(self.n1, axis=3)
+        # one selector kernel [2, 2, dof, 4*dof] for all nodes and dofs: output channel n*dof+i is dof i of node n
+        self.element_selector = GetElementSelectorKernel(self.dof)
 
-        self.n2 = np.array([[0, 1], [0, 0]])
-        self.n2 = np.expand_dims(self.n2, axis=2)
-        self.n2 = np.expand_dims(self.n2, axis=3)
+        self.N, self.B, self.jxw = Get2DGaussPointInfo(dh=self.dh, GPs=self.GPs, dof=self.dof)
+        # shape functions with the GP weights for the integration, N_jxw (q, n), B_jxw (q, n, x)
+        with tf.init_scope():
+            self.N_jxw = self.N * self.jxw[:, None]
+            self.B_jxw = self.B * self.jxw[:, None, None]
 
-        self.n3 = np.array([[0, 0], [1, 0]])
-        self.n3 = np.expand_dims(self.n3, axis=2)
-        self.n3 = np.expand_dims(self.n3, axis=3)
-
-        self.n4 = np.array([[0, 0], [0, 1]])
-        self.n4 = np.expand_dims(self.n4, axis=2)
-        self.n4 = np.expand_dims(self.n4, axis=3)
-
-        self.N, self.B, self.jxw = Get2DGaussPointInfo(dh=self.dh, dof=self.dof)
+        # the material fields are gathered and interpolated as one dof each, see ComputeMaterialFieldsAtAllGPs()
+        self.material_field_selector = GetElementSelectorKernel(len(self.material_fields)) if self.material_fields else None
+        self.N_field = Get2DGaussPointInfo(dh=self.dh, GPs=self.GPs, dof=1)[0]
 
     def GetElementInfo(self, input):
         """ 
@@ -2606,199 +768,278 @@ class LayerBulkResidual(tf.keras.layers.Layer):
 
 
         note:
-            - filter n1, n2, n3, n4: [filter_height, filter_width, in_channels, out_channels]
+            - selector kernel: [filter_height, filter_width, in_channels, out_channels], see GetElementSelectorKernel()
+            - works for any dof
         """
         # It is better to stick with the 2x2 or 2x2x2 format, because the matrix form might be
         # much easier for calling the linear algebra operations in tensorflow.
 
-        if self.dof == 1:
-            c_n1 = tf.nn.conv2d(input, self.n1, [1,1,1,1], 'SAME' )
-            c_n2 = tf.nn.conv2d(input, self.n2, [1,1,1,1], 'SAME' )
-            c_n3 = tf.nn.conv2d(input, self.n3, [1,1,1,1], 'SAME' )
-            c_n4 = tf.nn.conv2d(input, self.n4, [1,1,1,1], 'SAME' )
-            # elem_c
-            data = tf.concat([c_n1, c_n2, c_n3, c_n4], 3)
-
-        elif self.dof == 2:
-            c_n1x = tf.nn.conv2d(input[:,:,:,0:1], self.n1, [1,1,1,1], 'SAME' )
-            c_n2x = tf.nn.conv2d(input[:,:,:,0:1], self.n2, [1,1,1,1], 'SAME' )
-            c_n3x = tf.nn.conv2d(input[:,:,:,0:1], self.n3, [1,1,1,1], 'SAME' )
-            c_n4x = tf.nn.conv2d(input[:,:,:,0:1], self.n4, [1,1,1,1], 'SAME' )
-
-            c_n1y = tf.nn.conv2d(input[:,:,:,1:2], self.n1, [1,1,1,1], 'SAME' )
-            c_n2y = tf.nn.conv2d(input[:,:,:,1:2], self.n2, [1,1,1,1], 'SAME' )
-            c_n3y = tf.nn.conv2d(input[:,:,:,1:2], self.n3, [1,1,1,1], 'SAME' )
-            c_n4y = tf.nn.conv2d(input[:,:,:,1:2], self.n4, [1,1,1,1], 'SAME' )
-
-            data = tf.concat([c_n1x, c_n1y, c_n2x, c_n2y, c_n3x, c_n3y, c_n4x, c_n4y], 3)
-        else:
-            raise ValueError('dof = ', self.dof, ' is not implemented')
+        # a single conv2d with the stacked selector replaces the 4*dof conv2d with n1, n2, n3, n4 and the concat. 
+        # The result is the same: [n1 (dof), n2 (dof), n3 (dof), n4 (dof)], see pde_benchmark.py.
+        data = tf.nn.conv2d(input, self.element_selector, [1,1,1,1], 'SAME')
         return data
 
-    def ComputeValuAtGPs(self, data):
+    def Get2ndOrderIdentityTensor(self):
+        """
+        Get the second order identity tensor as broadcastable constants I_4[1, 4] and I_2x2[1, 1, 1, 1, 2, 2] 
+        (I_9[1, 9] and I_3x3[1, 1, 1, 1, 1, 3, 3] in 3D). They broadcast against gradu [-1, GPs, 4] and 
+        F2x2 [-1, elem_height, elem_width, GPs, 2, 2], i.e. no identity is allocated per element and GP.
         """
-        Reshape data[:, :, :, 4*dof] to [:, 4*dof] and compute the u(unknown) at each GPs.
+        # previously: I4 = ones_like(gradu1) * I, reshaped to [-1, elem_height, elem_width, 1, 2, 2] and concatenated GPs times,
+        # see pde_benchmark.py identity.
+        if self.dim == 2:
+            I = np.array([1.0000001,0.0,0.0,0.99999999])
+        else:
+            I = np.eye(self.dim).reshape(-1)
+        I4 = tf.constant(I.reshape(1, -1), tf.float32)
+        I2x2 = tf.reshape(I4, [1] * (self.dim + 2) + [self.dim, self.dim])
+
+        return I4, I2x2
+
+    # ---------------------------------------------------------------------------------
+    # GP-batched methods: all Gauss points are evaluated by one einsum with the stacked 
+    # N (q, n) and B (q, n, x) of Get2DGaussPointInfo(), and the quantities keep a GP axis.
+    # They work for any rule and for the 2D and the 3D elements (LayerBulkResidual3D).
+    # ---------------------------------------------------------------------------------
+
+    def ComputeValuAtAllGPs(self, data):
+        """
+        Reshape data[:, :, :, 4*dof] to [:, 4*dof] and compute the u(unknown) at all GPs.
 
         args:
             data (tensor): size of [-1, 4*dof]
         return:
-            tensor: valu at each GPs with size of [-1, 1*dof]
+            tensor: valu at all GPs with size of [-1, GPs]
         """
-        data = tf.reshape(data,[-1, 4*self.dof])
-        # print(np.shape(data))
-        # print(np.shape(self.N[0,:]))
-
-        valu1 = tf.linalg.matvec(data, self.N[0,:])
-        valu2 = tf.linalg.matvec(data, self.N[1,:])
-        valu3 = tf.linalg.matvec(data, self.N[2,:])
-        valu4 = tf.linalg.matvec(data, self.N[3,:])
-
-        valu1 = tf.expand_dims(valu1,1)
-        valu2 = tf.expand_dims(valu2,1)
-        valu3 = tf.expand_dims(valu3,1)
-        valu4 = tf.expand_dims(valu4,1)
-        # print(np.shape(valu1))
-        return valu1, valu2, valu3, valu4
-
-    def ComputeGraduAtGPs(self, data):
+        data = tf.reshape(data,[-1, self.N.shape[1]])
+        return tf.einsum('en,qn->eq', data, self.N)
+
+    def ComputeGraduAtAllGPs(self, data):
         """
-        Reshape data[:, :, :, 4*dof] to [:, 4*dof] and compute the Grad of u(unknown) at each GPs.
+        Reshape data[:, :, :, 4*dof] to [:, 4*dof] and compute the Grad of u(unknown) at all GPs.
 
         args:
             data (tensor): size of [-1, 4*dof]
         return:
-            tensor: gradu at each GPs with size of [-1, 2*dof]
+            tensor: gradu at all GPs with size of [-1, GPs, 2*dof]
         """
-        data = tf.reshape(data,[-1, 4*self.dof])
+        data = tf.reshape(data,[-1, self.N.shape[1]])
+        return tf.einsum('en,qnx->eqx', data, self.B)
 
-        # this is du/dX at each GP
-        gradu1 = tf.matmul(data, self.B[0,:,:]) 
-        gradu2 = tf.matmul(data, self.B[1,:,:]) 
-        gradu3 = tf.matmul(data, self.B[2,:,:]) 
-        gradu4 = tf.matmul(data, self.B[3,:,:]) 
-        return gradu1, gradu2, gradu3, gradu4
+    def ComputeMaterialFieldsAtAllGPs(self, fields, domain_shape=None):
+        """
+        Gather the nodal material fields of the elements and interpolate them to all GPs with the shape functions N, 
+        the same einsum as ComputeValuAtAllGPs() for each field.
 
-    def Get2ndOrderIdentityTensor(self, gradu1, domain_shape):
+        args:
+            fields (tensor): [batch, node_height, node_width, len(material_fields)] ([batch, node_depth, ...] in 3D) or None
+            domain_shape (list): [elem_height, elem_width] ([elem_depth, elem_height, elem_width] in 3D) for the layout 
+                                 of epsilon and F. Default: the layout [-1, GPs] of valu and gradu
+        return:
+            dict: name of material_fields -> values [-1, GPs] or [-1, elem_height, elem_width, GPs], None without fields
         """
-        Get the second order identity tensor in the format of I_4[-1, 4] and I_2x2[-1, :, :, 4GPs, 2, 2]
+        if fields is None:
+            return None
+        data = tf.nn.convolution(fields, self.material_field_selector, padding='SAME')
+        data = tf.reshape(data, [-1, self.N_field.shape[1], len(self.material_fields)])
+        values = tf.einsum('enf,qn->feq', data, self.N_field)
+        shape = [-1, self.N_field.shape[0]] if domain_shape is None else [-1, *domain_shape, self.N_field.shape[0]]
+        return {name: tf.reshape(values[i], shape) for i, name in enumerate(self.material_fields)}
+
+    def GetFAtAllGPs(self, gradu, I4, domain_shape):
         """
+        Compute F for large deformation at all GPs
 
-        # create 2nd order tensor
-        I = np.array([1.0000001,0.0,0.0,0.99999999])
-        I = tf.constant(I, tf.float32)
-        I = tf.expand_dims(I,0)
-        ones = tf.ones_like(gradu1)
-        I4 = tf.multiply(ones, I)
-
-        I2x2_1 = tf.reshape(I4, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
-        I2x2 = tf.concat([I2x2_1, I2x2_1, I2x2_1, I2x2_1], 3) # 4 GPs, are the same.
-
-        return I4, I2x2
+        args:
+            gradu (tensor): [-1, GPs, 4] ([-1, GPs, 9] in 3D)
+            I4 (tensor): [-1, 4] or [1, 4] ([-1, 9] or [1, 9] in 3D), see Get2ndOrderIdentityTensor()
+        return:
+            tensor: F2x2 with size of [-1, elem_height, elem_width, GPs, 2, 2] ([-1, elem_depth, elem_height, elem_width, GPs, 3, 3] in 3D)
+        """
+        F = gradu + tf.expand_dims(I4, 1)
+        return self.ToSmallMatrix(F, domain_shape)
 
-    def GetFe(self, gradu1, gradu2, gradu3, gradu4, I4, domain_shape, value1, value2, value3, value4):
+    def GetEpsilonAtAllGPs(self, gradu, domain_shape):
         """
-        Compute Fe for large deformation
+        Compute epsilon for small deformation at all GPs
+
+        args:
+            gradu (tensor): [-1, GPs, 4] ([-1, GPs, 9] in 3D)
+        return:
+            tensor: epsilon with size of [-1, elem_height, elem_width, GPs, 2, 2] ([-1, elem_depth, elem_height, elem_width, GPs, 3, 3] in 3D)
         """
-        # this is  Fe at each GP: gradu, I4 = [None, 4=2*dof], value1 = [None, 1]
-        gradu1 = (gradu1 + I4) / tf.math.pow( (value1+1.0), 1.0/3.0)
-        gradu2 = (gradu2 + I4) / tf.math.pow( (value2+1.0), 1.0/3.0)
-        gradu3 = (gradu3 + I4) / tf.math.pow( (value3+1.0), 1.0/3.0)
-        gradu4 = (gradu4 + I4) / tf.math.pow( (value4+1.0), 1.0/3.0)
-
-        # this is F2x2 at each GP
-        gradu1 = tf.reshape(gradu1, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
-        gradu2 = tf.reshape(gradu2, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
-        gradu3 = tf.reshape(gradu3, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
-        gradu4 = tf.reshape(gradu4, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
-        # tensor/matrix form of F
-        F2x2 = tf.concat([gradu1, gradu2, gradu3, gradu4], 3)
-
-        return F2x2
-
-    def GetF(self, gradu1, gradu2, gradu3, gradu4, I4, domain_shape):
+        gradu = self.ToSmallMatrix(gradu, domain_shape)
+        return self.SmallMatrixSym(gradu)
+
+    def ComputeIntTranBxPAtAllGPs(self, P, domain_shape):
         """
-        Compute F for large deformation
+        compute int ( B^T * P) dV with the P of all GPs
+
+        args:
+            P (tensor): with size of [-1, GPs, 2*dof], or [-1, elem_height, elem_width, GPs, 2, 2]
         """
-        # this is  F at each GP
-        gradu1 = gradu1 + I4
-        gradu2 = gradu2 + I4
-        gradu3 = gradu3 + I4
-        gradu4 = gradu4 + I4
-
-        # this is F2x2 at each GP
-        gradu1 = tf.reshape(gradu1, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
-        gradu2 = tf.reshape(gradu2, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
-        gradu3 = tf.reshape(gradu3, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
-        gradu4 = tf.reshape(gradu4, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
-        # tensor/matrix form of F
-        F2x2 = tf.concat([gradu1, gradu2, gradu3, gradu4], 3)
-
-        return F2x2
-
-    def GetEpsilon(self, gradu1, gradu2, gradu3, gradu4, domain_shape):
+        P = tf.reshape(P, [-1, self.B.shape[0], self.B.shape[2]])
+        R = tf.einsum('eqx,qnx->en', P, self.B_jxw)
+        R = tf.reshape(R, [-1, *domain_shape, self.N.shape[1]])
+        return R
+
+    def ComputeIntTranNxUAtAllGPs(self, valu, domain_shape):
         """
-        Compute epsilon for small deformation
+        compute int ( N^T * valu) dV with the valu of all GPs
+
+        args:
+            valu (tensor): with size of [-1, GPs]
         """
-        # this is epsilon at each GP
-        gradu1 = tf.reshape(gradu1, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
-        gradu2 = tf.reshape(gradu2, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
-        gradu3 = tf.reshape(gradu3, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
-        gradu4 = tf.reshape(gradu4, [-1, domain_shape[0], domain_shape[1], 1, 2, 2])
-
-        # symmetric epsilon
-        gradu1 = 0.5 * (gradu1 + tf.transpose(gradu1, perm=[0,1,2,3,5,4])) # + tf.random.uniform(tf.shape(gradu1), maxval=1e-9)
-        gradu2 = 0.5 * (gradu2 + tf.transpose(gradu2, perm=[0,1,2,3,5,4])) # + tf.random.uniform(tf.shape(gradu2), maxval=1e-9)
-        gradu3 = 0.5 * (gradu3 + tf.transpose(gradu3, perm=[0,1,2,3,5,4])) # + tf.random.uniform(tf.shape(gradu3), maxval=1e-9)
-        gradu4 = 0.5 * (gradu4 + tf.transpose(gradu4, perm=[0,1,2,3,5,4])) # + tf.random.uniform(tf.shape(gradu4), maxval=1e-9)
-
-        # # tensor/matrix form of epsilon
-        epsilon = tf.concat([gradu1, gradu2, gradu3, gradu4], 3)
-        return epsilon
-
-    def ComputeIntTranBxP(self, P1, P2, P3, P4, domain_shape):
+        R = tf.einsum('eq,qn->en', valu, self.N_jxw)
+        R = tf.reshape(R, [-1, *domain_shape, self.N.shape[1]])
+        return R
+
+    # ---------------------------------------------------------------------------------
+    # Closed-form kernels of the small matrices [..., n, n] at the GPs (n = dim: F, epsilon, 
+    # P, sigma). Each entry is an elementwise op, which is much cheaper than the batched LU 
+    # of tf.linalg.det() and tf.linalg.inv() for 2x2 matrices and gives the same values and 
+    # gradients, see pde_benchmark.py small_matrix.
+    # ---------------------------------------------------------------------------------
+
+    def ToSmallMatrix(self, A, domain_shape):
         """
-        compute int ( B^T * P) dV
+        matrix form of the flat components of the GPs
 
         args:
-            P# (tensor): with size of [:, 4]
+            A (tensor): [-1, dim*dim] (one GP) or [-1, GPs, dim*dim]
+        return:
+            tensor: [-1, elem_height, elem_width, GPs, dim, dim] ([-1, elem_depth, elem_height, elem_width, GPs, 3, 3] in 3D)
         """
+        GPs = 1 if len(A.shape) == 2 else tf.shape(A)[1]
+        return tf.reshape(A, [-1, *domain_shape, GPs, self.dim, self.dim])
 
-        # B (q, n, x)
-        # TransB (q, x, n)
-        TransB = tf.transpose(self.B, perm=[0,2,1])
+    def SmallMatrixEntries(self, A):
+        """
+        entries A[..., i, j] of A [..., n, n] as a nested list a[i][j]
+        """
+        return [tf.unstack(row, axis=-1) for row in tf.unstack(A, axis=-2)]
 
-        R1 = tf.matmul(P1, TransB[0,:,:])
-        R2 = tf.matmul(P2, TransB[1,:,:])
-        R3 = tf.matmul(P3, TransB[2,:,:])
-        R4 = tf.matmul(P4, TransB[3,:,:])
+    def SmallMatrixFromEntries(self, a):
+        """
+        inverse of SmallMatrixEntries()
+        """
+        return tf.stack([tf.stack(row, axis=-1) for row in a], axis=-2)
 
-        # int ( B^T * P) dV
-        R = self.jxw * (R1 + R2 + R3 + R4)
+    def SmallMatrixCofactorEntries(self, a):
+        """
+        cofactor matrix cof(A) = det(A) A^-T of the entries a[i][j] of a 2x2 or 3x3 matrix
+        """
+        if len(a) == 2:
+            return [[a[1][1], -a[1][0]], [-a[0][1], a[0][0]]]
+        if len(a) == 3:
+            return [[a[(i+1)%3][(j+1)%3] * a[(i+2)%3][(j+2)%3] - a[(i+1)%3][(j+2)%3] * a[(i+2)%3][(j+1)%3] for j in range(0, 3)] for i in range(0, 3)]
+        raise ValueError("closed-form kernels are only implemented for 2x2 and 3x3 matrices, not: ", len(a))
 
-        R = tf.reshape(R, [-1, domain_shape[0], domain_shape[1], 4*self.dof])
+    def SmallMatrixDet(self, A):
+        """
+        det(A) [...] of A [..., n, n], n = 2 or 3
+        """
+        a = self.SmallMatrixEntries(A)
+        if len(a) == 2:
+            return a[0][0] * a[1][1] - a[0][1] * a[1][0]
+        cof = self.SmallMatrixCofactorEntries(a)
+        return a[0][0] * cof[0][0] + a[0][1] * cof[0][1] + a[0][2] * cof[0][2]
 
-        return R
+    def SmallMatrixInvTranspose(self, A, detA=None):
+        """
+        A^-T = cof(A) / det(A) [..., n, n] of A [..., n, n], n = 2 or 3
 
-    def ComputeIntTranNxU(self, valu1, valu2, valu3, valu4, domain_shape):
+        args:
+            detA (tensor): det(A) [...], if it is already computed
+        """
+        a = self.SmallMatrixEntries(A)
+        if detA is None:
+            detA = self.SmallMatrixDet(A)
+        return self.SmallMatrixFromEntries(self.SmallMatrixCofactorEntries(a)) / detA[..., None, None]
+
+    def SmallMatrixInv(self, A, detA=None):
         """
-        compute int ( N^T * valu) dV
+        A^-1 = cof(A)^T / det(A) [..., n, n] of A [..., n, n], n = 2 or 3
 
         args:
-            valu# (tensor): with size of [:, 1]
+            detA (tensor): det(A) [...], if it is already computed
         """
+        cof = self.SmallMatrixCofactorEntries(self.SmallMatrixEntries(A))
+        if detA is None:
+            detA = self.SmallMatrixDet(A)
+        return self.SmallMatrixFromEntries([list(row) for row in zip(*cof)]) / detA[..., None, None]
 
-        # N (q, n)
-        R1 = tf.matmul(valu1, self.N[0:1,:])
-        R2 = tf.matmul(valu2, self.N[1:2,:])
-        R3 = tf.matmul(valu3, self.N[2:3,:])
-        R4 = tf.matmul(valu4, self.N[3:4,:])
+    def SmallMatrixMatmul(self, A, B, transpose_a=False):
+        """
+        A B (A^T B if transpose_a) [..., n, n] of A, B [..., n, n]
+        """
+        a, b = self.SmallMatrixEntries(A), self.SmallMatrixEntries(B)
+        if transpose_a:
+            a = [list(row) for row in zip(*a)]
+        n = len(a)
+        return self.SmallMatrixFromEntries([[tf.add_n([a[i][k] * b[k][j] for k in range(0, n)]) for j in range(0, n)] for i in range(0, n)])
 
-        # int ( N^T * valu) dV
-        R = self.jxw * (R1 + R2 + R3 + R4)
+    def SmallMatrixTrace(self, A):
+        """
+        tr(A) [...] of A [..., n, n]
+        """
+        a = self.SmallMatrixEntries(A)
+        return tf.add_n([a[i][i] for i in range(0, len(a))])
 
-        R = tf.reshape(R, [-1, domain_shape[0], domain_shape[1], 4*self.dof])
+    def SmallMatrixSym(self, A):
+        """
+        symmetric part 0.5 (A + A^T) of A [..., n, n]
+        """
+        return 0.5 * (A + tf.linalg.matrix_transpose(A))
 
-        return R
+    def LinearConstitutiveTangent(self):
+        """
+        constant tangent dP/dgradu [2*dof, 2*dof] of a linear constitutive relation, with the gradu layout of 
+        Get2DGaussPointInfo(). Only needed for the stencil mode, see initialize_stencil().
+        """
+        raise ValueError("stencil mode is only available for linear constitutive relations, ", self.name, " has no constant tangent!")
+
+    def initialize_stencil(self):
+        """
+        Derive the matrix-free linear element operator from the GP tables: K_e = sum_q jxw_q B_q C B_q^T with the 
+        tangent C of LinearConstitutiveTangent(). The element gather is folded into a 2x2 kernel, so that the element 
+        residual of LayerBulkResidual.call() is a single conv2d of the nodal values, see ComputeStencilElementResidual().
+        """
+        if self.material_fields:
+            raise ValueError("stencil mode needs one constant tangent, it is not available for the material fields ", list(self.material_fields), "!")
+        C = tf.constant(self.LinearConstitutiveTangent(), tf.float32)
+        self.K_e = tf.einsum('qnx,xy,qmy,q->nm', self.B, C, self.B, self.jxw)
+        # kernel [2, 2, dof, 4*dof] ([2, 2, 2, dof, 8*dof] in 3D): element output m from dof j of the node at (r, c)
+        self.stencil_kernel = self.normalization_factor * tf.einsum('...jn,mn->...jm', self.element_selector, self.K_e)
+        # the scaling u * normalization_factor - 0.5 * normalization_factor adds a constant (~ 0, the rows of K_e sum to 0)
+        self.stencil_bias = -0.5 * self.normalization_factor * tf.reduce_sum(self.K_e, axis=1)
+
+    def ComputeStencilElementResidual(self, input):
+        """ 
+        element residual of a linear problem with the element operator of initialize_stencil()
+
+        args:
+            input (tensor): [batch, node_height, node_width, dof]
+        return:
+            tensor: same as call() with size of [batch, elem_height, elem_width, 4*dof]
+        """
+        return tf.nn.convolution(input, self.stencil_kernel, padding='SAME') + self.stencil_bias
+
+    def GetNodalStencilKernel(self):
+        """ 
+        assembled 3x3 stencil [3, 3, dof, dof] of the linear operator of initialize_stencil(). For a domain without 
+        masked elements, conv2d(u, stencil, 'SAME') gives the same nodal residual (without the constant of the scaling) as 
+        GetNodalInfoFromElementInfo(ComputeStencilElementResidual(u)).
+        """
+        offset = [(0, 0), (0, 1), (1, 0), (1, 1)]
+        blocks = [[[] for _ in range(0, 3)] for _ in range(0, 3)]
+        for a, (ra, ca) in enumerate(offset):
+            for b, (rb, cb) in enumerate(offset):
+                # output node a, input node b of the same element
+                K_ab = self.K_e[a*self.dof:(a+1)*self.dof, b*self.dof:(b+1)*self.dof]
+                blocks[rb-ra+1][cb-ca+1].append(tf.transpose(K_ab))
+        stencil = [[tf.add_n(blocks[r][c]) for c in range(0, 3)] for r in range(0, 3)]
+        return self.normalization_factor * tf.stack([tf.stack(row) for row in stencil])
 
     def E_nu_to_lambda_mu(self, E, nu):
         lambda0 = (E*nu)/(1.0+nu)/(1.0-2.0*nu)
@@ -2806,6 +1047,58 @@ class LayerBulkResidual(tf.keras.layers.Layer):
         return lambda0, mu0
 
 
+class LayerBulkResidual3D(LayerBulkResidual):
+    """
+    General bulk residual of 8-node (trilinear) hexahedral elements, see Build3DGaussPointInfo(). 
+
+    The GP-batched methods of LayerBulkResidual (ComputeGraduAtAllGPs(), ComputeIntTranBxPAtAllGPs(), ...) and the stencil 
+    mode are shared with the 2D elements.
+    """
+    # data: [batch, in_depth, in_height, in_width, in_channels]
+    # filter: [filter_depth, filter_height, filter_width, in_channels, out_channels]
+    # dh is needed.
+
+    def __init__(self, name='R_bulk_general_3d'):
+        super(LayerBulkResidual3D, self).__init__(name=name)
+        # total number of GPs of the element rule, see Build3DGaussPointInfo()
+        self.GPs = 8
+        self.dim = 3
+
+    def initialize_arrays(self):
+        """
+        Initialize the kernel array to transform nodal arrangement to element arrangement. Get the Gauss Point information.
+        """
+        # one selector kernel [2, 2, 2, dof, 8*dof] for all nodes and dofs: output channel n*dof+i is dof i of node n
+        self.element_selector = GetElementSelectorKernel3D(self.dof)
+
+        self.N, self.B, self.jxw = Get3DGaussPointInfo(dh=self.dh, GPs=self.GPs, dof=self.dof)
+        # shape functions with the GP weights for the integration, N_jxw (q, n), B_jxw (q, n, x)
+        with tf.init_scope():
+            self.N_jxw = self.N * self.jxw[:, None]
+            self.B_jxw = self.B * self.jxw[:, None, None]
+
+        # the material fields are gathered and interpolated as one dof each, see ComputeMaterialFieldsAtAllGPs()
+        self.material_field_selector = GetElementSelectorKernel3D(len(self.material_fields)) if self.material_fields else None
+        self.N_field = Get3DGaussPointInfo(dh=self.dh, GPs=self.GPs, dof=1)[0]
+
+    def GetElementInfo(self, input):
+        """ 
+        Reorganize data from nodal value to a matrix form with 8*dof nodal values 
+        args:
+            inputs (tensor): [batch, node_depth, node_height, node_width, dof]
+        return:
+            tensor: data with size of [batch, elem_depth, elem_height, elem_width, dof*8] 
+        """
+        data = tf.nn.conv3d(input, self.element_selector, [1,1,1,1,1], 'SAME')
+        return data
+
+    def GetNodalStencilKernel(self):
+        """ 
+        The assembled stencil is only implemented for the 2D elements.
+        """
+        raise ValueError("GetNodalStencilKernel() is only implemented for the 2D elements, use GetNodalInfoFromElementInfo3D(ComputeStencilElementResidual(u)) in 3D!")
+
+
 if __name__ == '__main__' :
     print('testing the main')
     # test the results for matrix that is not invertible
@@ -4,6 +4,7 @@ import tensorflow as tf
 
 import pde_layers as pde_layers
 from pde_workflow_steady_state import PDEWorkflowSteadyState
+from pde_constitutive_models import get_constitutive_model
 
 class LayerDiffusionSteadyStateBulkResidual(pde_layers.LayerBulkResidual):
     """
@@ -13,45 +14,128 @@ class LayerDiffusionSteadyStateBulkResidual(pde_layers.LayerBulkResidual):
     # filter: [filter_height, filter_width, in_channels, out_channels]
     # dh is needed.
 
-    def __init__(self, dh, normalization_factor=2.0, D0=1.0, name='R_bulk_diffusion'):
+    def __init__(self, dh, normalization_factor=2.0, D0=1.0, stencil=False, GPs=4, model=None, material_fields=None, name='R_bulk_diffusion'):
         super(LayerDiffusionSteadyStateBulkResidual, self).__init__(name=name)
 
         self.dh = dh
         self.dof = 1
         self.normalization_factor = normalization_factor
-        self.D0 = D0
+        # diffusivity model of pde_constitutive_models.py, default: linear with D0
+        self.model = model if model is not None else get_constitutive_model('diffusion', 'linear', D0=D0)
+        self.D0 = self.model.p['D0']
+        # parameters of the model given as nodal fields, e.g. ['D0'], see ComputeMaterialFieldsAtAllGPs()
+        self.material_fields = list(material_fields) if material_fields else []
+        self.stencil = stencil
+        self.GPs = GPs
 
         self.initialize_arrays()
+        if self.stencil:
+            self.initialize_stencil()
 
-    def call(self, input):
+    def call(self, input, fields=None):
         """ 
         apply the int (B^T H) dV for element wise c value with 4 nodal value
         - input data: [batch, in_height, in_width, 4] (2x2 nodal values for u)
+        - fields: [batch, in_height, in_width, len(material_fields)] (nodal material fields) or None
         - output: [batch, in_height, in_width, 4] (nodal value residual)
         """
+        if self.stencil:
+            return self.ComputeStencilElementResidual(input)
 
         data = self.GetElementInfo(input)
         data = data * self.normalization_factor - 0.5 * self.normalization_factor
 
         shape=data.get_shape()[0:].as_list()    
         domain_shape = shape[1:3]
-        gradu1, gradu2, gradu3, gradu4 = self.ComputeGraduAtGPs(data)
-        H1, H2, H3, H4 = self.ConstitutiveRelation(gradu1, gradu2, gradu3, gradu4)
-        R = self.ComputeIntTranBxP(H1, H2, H3, H4, domain_shape)
+        gradu = self.ComputeGraduAtAllGPs(data)
+        valu = self.ComputeValuAtAllGPs(data) if self.model.uses_value else None
+        fields = self.ComputeMaterialFieldsAtAllGPs(fields)
+        H = self.ConstitutiveRelation(gradu, valu, fields)
+        R = self.ComputeIntTranBxPAtAllGPs(H, domain_shape)
         return R
 
-    def ConstitutiveRelation(self, gradu1, gradu2, gradu3, gradu4):
+    def ConstitutiveRelation(self, gradu, valu=None, fields=None):
+        """
+        Steady state diffusion: H = D(c, grad c) * grad c at all GPs of the diffusivity model, gradu: [-1, GPs, 2], 
+        valu (c): [-1, GPs], fields: material fields [-1, GPs]. Default: H = D0 * grad c
+        """
         # ----------- testing stochastic D0 -------------------
-        # random_D0 = tf.random.uniform(tf.shape(gradu1), minval=self.D0-0.5, maxval=self.D0+0.5, dtype=tf.float32)
-        # random_D0 = tf.random.normal(tf.shape(gradu1), self.D0, self.D0*0.4, tf.float32, seed=1024)
-        # H1 = tf.multiply(gradu1, random_D0) 
+        # random_D0 = tf.random.uniform(tf.shape(gradu), minval=self.D0-0.5, maxval=self.D0+0.5, dtype=tf.float32)
+        # random_D0 = tf.random.normal(tf.shape(gradu), self.D0, self.D0*0.4, tf.float32, seed=1024)
+        # H = tf.multiply(gradu, random_D0) 
         #-----------------------------------------------------
 
-        H1 = self.D0 * gradu1
-        H2 = self.D0 * gradu2
-        H3 = self.D0 * gradu3
-        H4 = self.D0 * gradu4
-        return H1, H2, H3, H4
+        H = self.model.Flux(self, gradu, valu, fields)
+        return H
+
+    def LinearConstitutiveTangent(self):
+        """
+        dH/dgradu for the stencil mode
+        """
+        return self.model.Tangent(self.dim)
+
+
+class LayerDiffusionSteadyStateBulkResidual3D(pde_layers.LayerBulkResidual3D):
+    """
+    Steady state bulk residual of 3D hexahedral elements
+    """
+    # data: [batch, in_depth, in_height, in_width, in_channels]
+    # filter: [filter_depth, filter_height, filter_width, in_channels, out_channels]
+    # dh is needed.
+
+    def __init__(self, dh, normalization_factor=2.0, D0=1.0, stencil=False, GPs=8, model=None, material_fields=None, name='R_bulk_diffusion_3d'):
+        super(LayerDiffusionSteadyStateBulkResidual3D, self).__init__(name=name)
+
+        self.dh = dh
+        self.dof = 1
+        self.normalization_factor = normalization_factor
+        # diffusivity model of pde_constitutive_models.py, default: linear with D0
+        self.model = model if model is not None else get_constitutive_model('diffusion', 'linear', D0=D0)
+        self.D0 = self.model.p['D0']
+        # parameters of the model given as nodal fields, e.g. ['D0'], see ComputeMaterialFieldsAtAllGPs()
+        self.material_fields = list(material_fields) if material_fields else []
+        self.stencil = stencil
+        self.GPs = GPs
+
+        self.initialize_arrays()
+        if self.stencil:
+            self.initialize_stencil()
+
+    def call(self, input, fields=None):
+        """ 
+        apply the int (B^T H) dV for element wise c value with 8 nodal value
+        - input data: [batch, in_depth, in_height, in_width, 1]
+        - fields: [batch, in_depth, in_height, in_width, len(material_fields)] (nodal material fields) or None
+        - output: [batch, in_depth, in_height, in_width, 8] (nodal value residual)
+        """
+        if self.stencil:
+            return self.ComputeStencilElementResidual(input)
+
+        data = self.GetElementInfo(input)
+        data = data * self.normalization_factor - 0.5 * self.normalization_factor
+
+        shape=data.get_shape()[0:].as_list()    
+        domain_shape = shape[1:4]
+        gradu = self.ComputeGraduAtAllGPs(data)
+        valu = self.ComputeValuAtAllGPs(data) if self.model.uses_value else None
+        fields = self.ComputeMaterialFieldsAtAllGPs(fields)
+        H = self.ConstitutiveRelation(gradu, valu, fields)
+        R = self.ComputeIntTranBxPAtAllGPs(H, domain_shape)
+        return R
+
+    def ConstitutiveRelation(self, gradu, valu=None, fields=None):
+        """
+        Steady state diffusion: H = D(c, grad c) * grad c at all GPs of the diffusivity model, gradu: [-1, GPs, 3], 
+        valu (c): [-1, GPs], fields: material fields [-1, GPs]
+        """
+        H = self.model.Flux(self, gradu, valu, fields)
+        return H
+
+    def LinearConstitutiveTangent(self):
+        """
+        dH/dgradu for the stencil mode
+        """
+        return self.model.Tangent(self.dim)
 
 
 class WeakPDESteadyStateDiffusion(PDEWorkflowSteadyState):
@@ -66,12 +150,36 @@ class WeakPDESteadyStateDiffusion(PDEWorkflowSteadyState):
         self.problem_name = 'diffusion'
         self.D0 = 1.0
         self.UseTwoNeumannChannel = True
+        self.GPs = self.GaussPoints if self.GaussPoints else 4
+        self.constitutive_model = self._get_constitutive_model('diffusion', 'linear', D0=self.D0)
 
-    def _bulk_residual(self, y_pred):
+    def _bulk_residual(self, y_pred, fields=None):
         """
         bulk residual for steady state diffusion
         """
-        elem_bulk_residual=LayerDiffusionSteadyStateBulkResidual(dh=self.dh, D0=self.D0)(y_pred)
+        layer = self._get_bulk_residual_layer(lambda: LayerDiffusionSteadyStateBulkResidual(dh=self.dh, D0=self.D0, stencil=self.LinearStencil, GPs=self.GPs, model=self.constitutive_model, material_fields=self.MaterialFields))
+        elem_bulk_residual=layer(y_pred, fields=fields)
+        return elem_bulk_residual
+
+
+class WeakPDESteadyStateDiffusion3D(WeakPDESteadyStateDiffusion):
+    """
+    Steady state diffusion on 3D images [batch, depth, height, width, channels] with hexahedral elements. 
+    The features are [Dirichlet, t_x, t_y, t_z], see ComputeNeumannBoundaryResidualNodalDataNew3D().
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.dim = 3
+        self.problem_name = 'diffusion-3d'
+        self.GPs = self.GaussPoints if self.GaussPoints else 8
+
+    def _bulk_residual(self, y_pred, fields=None):
+        """
+        bulk residual for steady state diffusion in 3D
+        """
+        layer = self._get_bulk_residual_layer(lambda: LayerDiffusionSteadyStateBulkResidual3D(dh=self.dh, D0=self.D0, stencil=self.LinearStencil, GPs=self.GPs, model=self.constitutive_model, material_fields=self.MaterialFields))
+        elem_bulk_residual=layer(y_pred, fields=fields)
         return elem_bulk_residual
 
 
@@ -4,6 +4,7 @@ import tensorflow as tf
 
 import pde_layers as pde_layers
 from pde_workflow_steady_state import PDEWorkflowSteadyState
+from pde_constitutive_models import get_constitutive_model
 
 class LayerLinearElasticityBulkResidual(pde_layers.LayerBulkResidual):
     """
@@ -13,59 +14,128 @@ class LayerLinearElasticityBulkResidual(pde_layers.LayerBulkResidual):
     # filter: [filter_height, filter_width, in_channels, out_channels]
     # dh is needed.
 
-    def __init__(self, dh, E0=2.5, nu0=0.3, normalization_factor=2.0, name='R_bulk_elasticity'):
+    def __init__(self, dh, E0=2.5, nu0=0.3, normalization_factor=2.0, stencil=False, GPs=4, model=None, material_fields=None, name='R_bulk_elasticity'):
         super(LayerLinearElasticityBulkResidual, self).__init__(name=name)
 
         self.dh = dh
         self.dof = 2
         self.normalization_factor = normalization_factor
-        self.lambda0, self.mu0 = self.E_nu_to_lambda_mu(E=E0, nu=nu0)
+        # constitutive model of pde_constitutive_models.py, default: isotropic with E0, nu0
+        self.model = model if model is not None else get_constitutive_model('linear-elasticity', 'isotropic', E0=E0, nu0=nu0)
+        self.lambda0, self.mu0 = self.model.LameParameters(self.dim)
+        # parameters of the model given as nodal fields, e.g. ['E0'], see ComputeMaterialFieldsAtAllGPs()
+        self.material_fields = list(material_fields) if material_fields else []
+        self.stencil = stencil
+        self.GPs = GPs
         self.initialize_arrays()
+        if self.stencil:
+            self.initialize_stencil()
 
-    def call(self, input):
+    def call(self, input, fields=None):
         """ 
         apply the int (B^T P) dV for element wise u value with 8 nodal value
         - input data: [batch, in_height, in_width, 8] (2x2x2 nodal values for u)
+        - fields: [batch, in_height, in_width, len(material_fields)] (nodal material fields) or None
         - output: [batch, in_height, in_width, 8] (nodal value residual)
         """
         # scaled_data = non_scaled/normalization_factor + 0.5 for range  [-x, +x]
         # non_scaled = scaled_data * normalization_factor - 0.5 * normalization_factor
+        if self.stencil:
+            return self.ComputeStencilElementResidual(input)
 
         data = self.GetElementInfo(input)
         data = data * self.normalization_factor - 0.5 * self.normalization_factor
 
         shape = data.get_shape()[0:].as_list()    
         domain_shape = shape[1:3]
-        gradu1, gradu2, gradu3, gradu4 = self.ComputeGraduAtGPs(data)
+        gradu = self.ComputeGraduAtAllGPs(data)
 
-        I4, I2x2 = self.Get2ndOrderIdentityTensor(gradu1, domain_shape)
-        epsilon = self.GetEpsilon(gradu1, gradu2, gradu3, gradu4, domain_shape)
+        I4, I2x2 = self.Get2ndOrderIdentityTensor()
+        epsilon = self.GetEpsilonAtAllGPs(gradu, domain_shape)
+        fields = self.ComputeMaterialFieldsAtAllGPs(fields, domain_shape)
 
-        sigma1, sigma2, sigma3, sigma4 = self.ConstitutiveRelation(epsilon, I2x2)
-        R = self.ComputeIntTranBxP(sigma1, sigma2, sigma3, sigma4, domain_shape)
+        sigma = self.ConstitutiveRelation(epsilon, I2x2, fields)
+        R = self.ComputeIntTranBxPAtAllGPs(sigma, domain_shape)
         return R
 
-    def ConstitutiveRelation(self, epsilon, I2x2):
+    def ConstitutiveRelation(self, epsilon, I2x2, fields=None):
         """
-        Linear elasticity constitutive relationship
+        Linear elasticity constitutive relationship, epsilon: [-1, elem_height, elem_width, GPs, 2, 2], 
+        fields: material fields [-1, elem_height, elem_width, GPs]
         """
-        epsilon_trace = tf.linalg.trace(epsilon)
-        epsilon_trace = tf.expand_dims(epsilon_trace, 4)
-        epsilon_trace = tf.expand_dims(epsilon_trace, 5)
+        sigma = self.model.Stress(self, epsilon, I2x2, fields)
+        return sigma
 
-        # get sigma for linear elasticity
-        sigma = self.lambda0 * tf.math.multiply(epsilon_trace, I2x2) + 2.0 * self.mu0 * epsilon
+    def LinearConstitutiveTangent(self):
+        """
+        dsigma/dgradu for the stencil mode: see the Tangent() of the constitutive model
+        """
+        return self.model.Tangent(self.dim)
+
+
+class LayerLinearElasticityBulkResidual3D(pde_layers.LayerBulkResidual3D):
+    """
+    Linear elasticity bulk residual of 3D hexahedral elements
+    """
+    # data: [batch, in_depth, in_height, in_width, in_channels]
+    # filter: [filter_depth, filter_height, filter_width, in_channels, out_channels]
+    # dh is needed.
+
+    def __init__(self, dh, E0=2.5, nu0=0.3, normalization_factor=2.0, stencil=False, GPs=8, model=None, material_fields=None, name='R_bulk_elasticity_3d'):
+        super(LayerLinearElasticityBulkResidual3D, self).__init__(name=name)
+
+        self.dh = dh
+        self.dof = 3
+        self.normalization_factor = normalization_factor
+        # constitutive model of pde_constitutive_models.py, default: isotropic with E0, nu0
+        self.model = model if model is not None else get_constitutive_model('linear-elasticity', 'isotropic', E0=E0, nu0=nu0)
+        self.lambda0, self.mu0 = self.model.LameParameters(self.dim)
+        # parameters of the model given as nodal fields, e.g. ['E0'], see ComputeMaterialFieldsAtAllGPs()
+        self.material_fields = list(material_fields) if material_fields else []
+        self.stencil = stencil
+        self.GPs = GPs
+        self.initialize_arrays()
+        if self.stencil:
+            self.initialize_stencil()
+
+    def call(self, input, fields=None):
+        """ 
+        apply the int (B^T P) dV for element wise u value with 8 nodal value
+        - input data: [batch, in_depth, in_height, in_width, 3]
+        - fields: [batch, in_depth, in_height, in_width, len(material_fields)] (nodal material fields) or None
+        - output: [batch, in_depth, in_height, in_width, 24] (nodal value residual)
+        """
+        if self.stencil:
+            return self.ComputeStencilElementResidual(input)
 
-        sigma1 = sigma[:,:,:,0,:,:]
-        sigma2 = sigma[:,:,:,1,:,:]
-        sigma3 = sigma[:,:,:,2,:,:]
-        sigma4 = sigma[:,:,:,3,:,:]
+        data = self.GetElementInfo(input)
+        data = data * self.normalization_factor - 0.5 * self.normalization_factor
 
-        sigma1 = tf.reshape(sigma1, [-1, 4])
-        sigma2 = tf.reshape(sigma2, [-1, 4])
-        sigma3 = tf.reshape(sigma3, [-1, 4])
-        sigma4 = tf.reshape(sigma4, [-1, 4])
-        return sigma1, sigma2, sigma3, sigma4
+        shape = data.get_shape()[0:].as_list()    
+        domain_shape = shape[1:4]
+        gradu = self.ComputeGraduAtAllGPs(data)
+
+        I9, I3x3 = self.Get2ndOrderIdentityTensor()
+        epsilon = self.GetEpsilonAtAllGPs(gradu, domain_shape)
+        fields = self.ComputeMaterialFieldsAtAllGPs(fields, domain_shape)
+
+        sigma = self.ConstitutiveRelation(epsilon, I3x3, fields)
+        R = self.ComputeIntTranBxPAtAllGPs(sigma, domain_shape)
+        return R
+
+    def ConstitutiveRelation(self, epsilon, I3x3, fields=None):
+        """
+        Linear elasticity constitutive relationship, epsilon: [-1, elem_depth, elem_height, elem_width, GPs, 3, 3], 
+        fields: material fields [-1, elem_depth, elem_height, elem_width, GPs]
+        """
+        sigma = self.model.Stress(self, epsilon, I3x3, fields)
+        return sigma
+
+    def LinearConstitutiveTangent(self):
+        """
+        dsigma/dgradu for the stencil mode: see the Tangent() of the constitutive model
+        """
+        return self.model.Tangent(self.dim)
 
 
 class WeakPDELinearElasticity(PDEWorkflowSteadyState):
@@ -77,12 +147,38 @@ class WeakPDELinearElasticity(PDEWorkflowSteadyState):
         self.E0 = 25
         self.nu0 = 0.3
         self.UseTwoNeumannChannel = False
+        self.GPs = self.GaussPoints if self.GaussPoints else 4
+        self.constitutive_model = self._get_constitutive_model('linear-elasticity', 'isotropic', E0=self.E0, nu0=self.nu0)
 
-    def _bulk_residual(self, y_pred):
+    def _bulk_residual(self, y_pred, fields=None):
         """
         bulk residual for linear elasticity
         """
-        elem_bulk_residual=LayerLinearElasticityBulkResidual(dh=self.dh, E0=self.E0, nu0=self.nu0)(y_pred)
+        layer = self._get_bulk_residual_layer(lambda: LayerLinearElasticityBulkResidual(dh=self.dh, E0=self.E0, nu0=self.nu0, stencil=self.LinearStencil, GPs=self.GPs, model=self.constitutive_model, material_fields=self.MaterialFields))
+        elem_bulk_residual=layer(y_pred, fields=fields)
+        return elem_bulk_residual
+
+
+class WeakPDELinearElasticity3D(WeakPDELinearElasticity):
+    """
+    Linear elasticity on 3D images [batch, depth, height, width, channels] with hexahedral elements. 
+    The features are [Dirichlet (Ux, Uy, Uz), Neumann (Tx, Ty, Tz)], see ComputeNeumannBoundaryResidualNodalData3D().
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.dim = 3
+        self.dof = 3
+        self.dof_name = ['Ux', 'Uy', 'Uz']
+        self.problem_name = 'linear-elasticity-3d'
+        self.GPs = self.GaussPoints if self.GaussPoints else 8
+
+    def _bulk_residual(self, y_pred, fields=None):
+        """
+        bulk residual for linear elasticity in 3D
+        """
+        layer = self._get_bulk_residual_layer(lambda: LayerLinearElasticityBulkResidual3D(dh=self.dh, E0=self.E0, nu0=self.nu0, stencil=self.LinearStencil, GPs=self.GPs, model=self.constitutive_model, material_fields=self.MaterialFields))
+        elem_bulk_residual=layer(y_pred, fields=fields)
         return elem_bulk_residual
 
 
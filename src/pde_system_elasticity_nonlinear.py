@@ -4,6 +4,7 @@ import tensorflow as tf
 
 import pde_layers as pde_layers
 from pde_workflow_steady_state import PDEWorkflowSteadyState
+from pde_constitutive_models import get_constitutive_model
 
 class LayerNonLinearElasticityBulkResidual(pde_layers.LayerBulkResidual):
     """
@@ -13,19 +14,25 @@ class LayerNonLinearElasticityBulkResidual(pde_layers.LayerBulkResidual):
     # filter: [filter_height, filter_width, in_channels, out_channels]
     # dh is needed.
 
-    def __init__(self, dh, E0=2.5, nu0=0.3, normalization_factor=2.0, name='R_bulk_elasticity'):
+    def __init__(self, dh, E0=2.5, nu0=0.3, normalization_factor=2.0, GPs=4, model=None, material_fields=None, name='R_bulk_elasticity'):
         super(LayerNonLinearElasticityBulkResidual, self).__init__(name=name)
 
         self.dh = dh
         self.dof = 2
         self.normalization_factor = normalization_factor
-        self.lambda0, self.mu0 = self.E_nu_to_lambda_mu(E=E0, nu=nu0)
+        # hyperelastic model of pde_constitutive_models.py, default: neo-hookean with E0, nu0
+        self.model = model if model is not None else get_constitutive_model('nonlinear-elasticity', 'neo-hookean', E0=E0, nu0=nu0)
+        self.lambda0, self.mu0 = self.E_nu_to_lambda_mu(E=self.model.p.get('E0', E0), nu=self.model.p.get('nu0', nu0))
+        # parameters of the model given as nodal fields, e.g. ['E0'], see ComputeMaterialFieldsAtAllGPs()
+        self.material_fields = list(material_fields) if material_fields else []
+        self.GPs = GPs
         self.initialize_arrays()
 
-    def call(self, input):
+    def call(self, input, fields=None):
         """ 
         apply the int (B^T P) dV for element wise u value with 8 nodal value
         - input data: [batch, in_height, in_width, 4*dof] (2x2x2 nodal values for u)
+        - fields: [batch, in_height, in_width, len(material_fields)] (nodal material fields) or None
         - output: [batch, in_height, in_width, 4*dof] (nodal value residual)
         """
 
@@ -33,19 +40,22 @@ class LayerNonLinearElasticityBulkResidual(pde_layers.LayerBulkResidual):
         data = data * self.normalization_factor - 0.5 * self.normalization_factor
         shape = data.get_shape()[0:].as_list()    
         domain_shape = shape[1:3]
-        gradu1, gradu2, gradu3, gradu4 = self.ComputeGraduAtGPs(data)
+        gradu = self.ComputeGraduAtAllGPs(data)
 
-        I4, I2x2 = self.Get2ndOrderIdentityTensor(gradu1, domain_shape)
-        F2x2 = self.GetF(gradu1, gradu2, gradu3, gradu4, I4, domain_shape)
-        P1, P2, P3, P4 = self.ConstitutiveRelation(F2x2, I2x2)
-        R = self.ComputeIntTranBxP(P1, P2, P3, P4, domain_shape)
+        I4, I2x2 = self.Get2ndOrderIdentityTensor()
+        F2x2 = self.GetFAtAllGPs(gradu, I4, domain_shape)
+        fields = self.ComputeMaterialFieldsAtAllGPs(fields, domain_shape)
+        P = self.ConstitutiveRelation(F2x2, I2x2, fields)
+        R = self.ComputeIntTranBxPAtAllGPs(P, domain_shape)
         return R
 
-    def ConstitutiveRelation(self, F2x2, I2x2):
+    def ConstitutiveRelation(self, F2x2, I2x2, fields=None):
         """
-        Non-linear elasticity constitutive relationship
+        Non-linear elasticity constitutive relationship, F2x2: [-1, elem_height, elem_width, GPs, 2, 2], fields: material 
+        fields [-1, elem_height, elem_width, GPs]. P of the elements with a valid detF is the Stress() of the hyperelastic 
+        model, 0 otherwise.
         """
-        detF = tf.expand_dims(tf.linalg.det(F2x2), 4)
+        detF = tf.expand_dims(self.SmallMatrixDet(F2x2), 4)
         detF = tf.expand_dims(detF, 5)
 
         #---------------------------------------------------------------------------------
@@ -64,32 +74,14 @@ class LayerNonLinearElasticityBulkResidual(pde_layers.LayerBulkResidual):
 
         F2x2_modified = tf.multiply(F2x2, detF_mask) + tf.multiply(I2x2, detF_mask_reverse)
 
-        detF = tf.expand_dims(tf.linalg.det(F2x2_modified), 4)
-        detF = tf.expand_dims(detF, 5)
+        detF_modified = self.SmallMatrixDet(F2x2_modified)
         #---------------------------------------------------------------------------------
 
-        # get other values
-        try:
-            InvF = tf.linalg.inv(F2x2_modified)
-        except tensorflow.python.framework.errors_impl.InvalidArgumentError:
-            raise ValueError ('F2x2 not invertable', F2x2_modified)
-
-        TransInvF = tf.transpose(InvF, perm=[0,1,2,3,5,4])
-
-        # get P
-        P = self.lambda0 * (tf.math.multiply(detF,detF) - detF) * TransInvF + self.mu0 * ( F2x2_modified - TransInvF)
+        # get P: F2x2_modified is always invertible, the models get F^-T = cof(F) / det(F) in closed form.
+        # default (neo-hookean): P = lambda0 * (detF^2 - detF) * F^-T + mu0 * (F - F^-T)
+        P = self.model.Stress(self, F2x2_modified, detF_modified, fields)
         P = tf.multiply(P, detF_mask)
-
-        P1 = P[:,:,:,0,:,:]
-        P2 = P[:,:,:,1,:,:]
-        P3 = P[:,:,:,2,:,:]
-        P4 = P[:,:,:,3,:,:]
-
-        P1 = tf.reshape(P1, [-1, 4])
-        P2 = tf.reshape(P2, [-1, 4])
-        P3 = tf.reshape(P3, [-1, 4])
-        P4 = tf.reshape(P4, [-1, 4])
-        return P1, P2, P3, P4
+        return P
 
 
 class WeakPDENonLinearElasticity(PDEWorkflowSteadyState):
@@ -101,12 +93,18 @@ class WeakPDENonLinearElasticity(PDEWorkflowSteadyState):
         self.E0 = 25
         self.nu0 = 0.3
         self.UseTwoNeumannChannel = False
+        self.GPs = self.GaussPoints if self.GaussPoints else 4
+        self.constitutive_model = self._get_constitutive_model('nonlinear-elasticity', 'neo-hookean', E0=self.E0, nu0=self.nu0)
+        if self.StrainEnergyAD:
+            self.constitutive_model.autodiff = True
+            self.constitutive_model.jit_compile = (self.StrainEnergyAD == 1)
 
-    def _bulk_residual(self, y_pred):
+    def _bulk_residual(self, y_pred, fields=None):
         """
         bulk residual for nonlinear elasticity
         """
-        elem_bulk_residual=LayerNonLinearElasticityBulkResidual(dh=self.dh, E0=self.E0, nu0=self.nu0)(y_pred)
+        layer = self._get_bulk_residual_layer(lambda: LayerNonLinearElasticityBulkResidual(dh=self.dh, E0=self.E0, nu0=self.nu0, GPs=self.GPs, model=self.constitutive_model, material_fields=self.MaterialFields))
+        elem_bulk_residual=layer(y_pred, fields=fields)
         return elem_bulk_residual
 
 
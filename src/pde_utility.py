@@ -5,6 +5,14 @@ import tensorflow as tf
 import numpy as np
 import datetime
 import pickle
+import glob
+import json
+import hashlib
+import shutil
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from natsort import natsorted, ns
 
 import os
 import numpy as np
@@ -432,182 +440,89 @@ def plot_fields(list_of_field, list_of_field_name, dof, dof_name,  filename='',
     # plt.show()
 
 
-def split_data(datax, datay, batch_size, split_ratio=['0.8', '0.1', '0.1']):
-    """ split data according to a specific ratio """
+def split_data(datax, datay, batch_size, split_ratio=['0.8', '0.1', '0.1'], seed=None):
+    """ split data according to a specific ratio. Each split is gathered once from a shuffled index, see split_index() """
 
-    split_ratio = [float(x) for x in split_ratio]
-    if (len(split_ratio) != 3 or abs(sum(split_ratio) - 1.0) > 1.0e-5):
-        raise ValueError(
-            'split ratio should be a list containing three float values with sum() == 1.0!!! Your current split_ratio = ',
-            split_ratio, ' with sum = ', sum(split_ratio))
-    tr_ratio = float(split_ratio[0])
-    cv_ratio = float(split_ratio[1])
-    tt_ratio = float(split_ratio[2])
-
-    number_examples = datax.shape[0]
-    idx = np.arange(0, number_examples)
-    np.random.shuffle(idx)
-    datax = [datax[i] for i in idx]    # get list of `num` random samples
-    datay = [datay[i] for i in idx]    # get list of `num` random samples
+    tr_idx, cv_idx, tt_idx, total_train_batch = split_index(np.arange(datax.shape[0]), batch_size, split_ratio=split_ratio, seed=seed)
 
-    start = 0
-    end_tr = int(tr_ratio * number_examples / batch_size) * batch_size 
-    end_cv = int((tr_ratio + cv_ratio) * number_examples)
-    end_tt = number_examples
-    tr_datax = np.array(datax[start:end_tr])
-    tr_datay = np.array(datay[start:end_tr])
-    cv_datax = np.array(datax[end_tr:end_cv])
-    cv_datay = np.array(datay[end_tr:end_cv])
-    tt_datax = np.array(datax[end_cv:end_tt])
-    tt_datay = np.array(datay[end_cv:end_tt])
-
-    return tr_datax, tr_datay, cv_datax, cv_datay, tt_datax, tt_datay, int(end_tr/batch_size)
+    tr_datax, tr_datay = datax[tr_idx], datay[tr_idx]
+    cv_datax, cv_datay = datax[cv_idx], datay[cv_idx]
+    tt_datax, tt_datay = datax[tt_idx], datay[tt_idx]
 
-def split_data_heter(datax, datay, dataz, batch_size, split_ratio=['0.8', '0.1', '0.1']):
-    """ split data according to a specific ratio """
+    return tr_datax, tr_datay, cv_datax, cv_datay, tt_datax, tt_datay, total_train_batch
 
-    split_ratio = [float(x) for x in split_ratio]
-    if (len(split_ratio) != 3 or abs(sum(split_ratio) - 1.0) > 1.0e-5):
-        raise ValueError(
-            'split ratio should be a list containing three float values with sum() == 1.0!!! Your current split_ratio = ',
-            split_ratio, ' with sum = ', sum(split_ratio))
-    tr_ratio = float(split_ratio[0])
-    cv_ratio = float(split_ratio[1])
-    tt_ratio = float(split_ratio[2])
+def split_data_heter(datax, datay, dataz, batch_size, split_ratio=['0.8', '0.1', '0.1'], seed=None):
+    """ split data according to a specific ratio. Each split is gathered once from a shuffled index, see split_index() """
 
-    number_examples = datax.shape[0]
-    idx = np.arange(0, number_examples)
-    np.random.shuffle(idx)
-    datax = [datax[i] for i in idx]    # get list of `num` random samples
-    datay = [datay[i] for i in idx]    # get list of `num` random samples
-    dataz = [dataz[i] for i in idx]    # get list of `num` random samples
+    tr_idx, cv_idx, tt_idx, _ = split_index(np.arange(datax.shape[0]), batch_size, split_ratio=split_ratio, seed=seed)
 
-    start = 0
-    end_tr = int(tr_ratio * number_examples / batch_size) * batch_size 
-    end_cv = int((tr_ratio + cv_ratio) * number_examples)
-    end_tt = number_examples
-    tr_datax = np.array(datax[start:end_tr])
-    tr_datay = np.array(datay[start:end_tr])
-    tr_dataz = np.array(dataz[start:end_tr])
-    cv_datax = np.array(datax[end_tr:end_cv])
-    cv_datay = np.array(datay[end_tr:end_cv])
-    cv_dataz = np.array(dataz[end_tr:end_cv])
-    tt_datax = np.array(datax[end_cv:end_tt])
-    tt_datay = np.array(datay[end_cv:end_tt])
-    tt_dataz = np.array(dataz[end_cv:end_tt])
+    tr_datax, tr_datay, tr_dataz = datax[tr_idx], datay[tr_idx], dataz[tr_idx]
+    cv_datax, cv_datay, cv_dataz = datax[cv_idx], datay[cv_idx], dataz[cv_idx]
+    tt_datax, tt_datay, tt_dataz = datax[tt_idx], datay[tt_idx], dataz[tt_idx]
 
     return tr_datax, tr_datay, tr_dataz, cv_datax, cv_datay, cv_dataz, tt_datax, tt_datay, tt_dataz
 
 
 def expand_dataset(features, labels, times):
-    """ expand the features and labels to 2^(n+1) with n=times """
+    """ expand the features and labels to 2^n times their length with n=times """
     for i in range(0, times):
         features = np.concatenate((features, features), axis=0)
         labels = np.concatenate((labels, labels), axis=0)
         # print('2^(' + '{}'.format(i + 1) + '): feature shape = ', np.shape(features), ' label shape = ', np.shape(labels))
     return features, labels
 
-def ExpandDatasetHeter(features, mats, labels, times):
-    """ expand the features and labels to 2^(n+1) with n=times """
-    for i in range(0, times):
-        features = np.concatenate((features, features), axis=0)
-        mats = np.concatenate((mats, mats), axis=0)
-        labels = np.concatenate((labels, labels), axis=0)
-        # print('2^(' + '{}'.format(i + 1) + '): feature shape = ', np.shape(features), ' label shape = ', np.shape(labels))
-    return features, mats, labels
-
-
-class BatchDataHeter(tf.keras.utils.Sequence):
-    """Produces a sequence of the data with labels."""
-    """Borrowed from: class MNISTSequence(tf.keras.utils.Sequence) """
-
-    def __init__(self, data, batch_size=128):
-        """Initializes the sequence.
-
-    Args:
-      data: Tuple of numpy `array` instances, the first representing images and
-            the second labels.
-      batch_size: Integer, number of elements in each training batch.
+def expand_dataset_index(number_examples, times):
     """
-        self.features, self.mats, self.labels = data
-        # self.features, self.labels = BatchData.__preprocessing(images, labels)
-        self.batch_size = batch_size
-
-    # @staticmethod
-    # def __preprocessing(images, labels):
-    # """Preprocesses image and labels data.
-
-    # Args:
-    # images: Numpy `array` representing the image data.
-    # labels: Numpy `array` representing the labels data (range 0-9).
-
-    # Returns:
-    # images: Numpy `array` representing the image data, normalized
-    # and expanded for convolutional network input.
-    # labels: Numpy `array` representing the labels data (range 0-9),
-    # as one-hot (categorical) values.
-    # """
-    # # images = 2 * (images / 255.) - 1. # normalization
-    # images = images[..., tf.newaxis]
-
-    # labels = tf.keras.utils.to_categorical(labels)
-    # return images, labels
-
-    def __len__(self):
-        return int(tf.math.ceil(len(self.features) / self.batch_size))  # contains batches less than the size of batch_size
-        # return int(len(self.features) / self.batch_size) # all batches are equal-sized.
-
-    def __getitem__(self, idx):
-        batch_x = self.features[idx * self.batch_size:(idx + 1) * self.batch_size]
-        batch_m = self.mats[idx * self.batch_size:(idx + 1) * self.batch_size]
-        batch_y = self.labels[idx * self.batch_size:(idx + 1) * self.batch_size]
-        return [batch_x, batch_m], batch_y
+    virtual version of expand_dataset(): return the sample index of the dataset expanded to 2^n times its length with n=times
 
+    Only one int32 index per virtual sample is created. The data itself is not copied, and
+    sample i of the expanded dataset is features[index[i]].
+    """
+    return np.tile(np.arange(number_examples, dtype=np.int32), 2**times)
 
-class BatchData(tf.keras.utils.Sequence):
-    """Produces a sequence of the data with labels."""
-    """Borrowed from: class MNISTSequence(tf.keras.utils.Sequence) """
+def split_index(index, batch_size, split_ratio=['0.8', '0.1', '0.1'], seed=None, shuffle=True):
+    """ 
+    split a sample index array according to a specific ratio
 
-    def __init__(self, data, batch_size=128):
-        """Initializes the sequence.
+    Only the index is shuffled. The returned train/val/test index arrays can be used to gather
+    the data once (split_data) or batch by batch (build_dataset_pipeline).
 
     Args:
-      data: Tuple of numpy `array` instances, the first representing images and
-            the second labels.
-      batch_size: Integer, number of elements in each training batch.
+        index (numpy array): sample index
+        batch_size (int): the train split is truncated to full batches
+        split_ratio (list): train, val, test ratio with sum == 1.0
+        seed (int): seed of the shuffle. A random shuffle is used if None.
+        shuffle (bool): False if index is already shuffled, e.g. loaded from the preprocessing cache
+
+    Returns:
+        train index, val index, test index, total train batches
     """
-        self.features, self.labels = data
-        # self.features, self.labels = BatchData.__preprocessing(images, labels)
-        self.batch_size = batch_size
 
-    # @staticmethod
-    # def __preprocessing(images, labels):
-    # """Preprocesses image and labels data.
+    split_ratio = [float(x) for x in split_ratio]
+    if (len(split_ratio) != 3 or abs(sum(split_ratio) - 1.0) > 1.0e-5):
+        raise ValueError(
+            'split ratio should be a list containing three float values with sum() == 1.0!!! Your current split_ratio = ',
+            split_ratio, ' with sum = ', sum(split_ratio))
+    tr_ratio = float(split_ratio[0])
+    cv_ratio = float(split_ratio[1])
 
-    # Args:
-    # images: Numpy `array` representing the image data.
-    # labels: Numpy `array` representing the labels data (range 0-9).
-
-    # Returns:
-    # images: Numpy `array` representing the image data, normalized
-    # and expanded for convolutional network input.
-    # labels: Numpy `array` representing the labels data (range 0-9),
-    # as one-hot (categorical) values.
-    # """
-    # # images = 2 * (images / 255.) - 1. # normalization
-    # images = images[..., tf.newaxis]
+    number_examples = index.shape[0]
+    if shuffle:
+        index = index[np.random.default_rng(seed).permutation(number_examples)]
 
-    # labels = tf.keras.utils.to_categorical(labels)
-    # return images, labels
+    end_tr = int(tr_ratio * number_examples / batch_size) * batch_size
+    end_cv = int((tr_ratio + cv_ratio) * number_examples)
 
-    def __len__(self):
-        return int(tf.math.ceil(len(self.features) / self.batch_size))  # contains batches less than the size of batch_size
-        # return int(len(self.features) / self.batch_size) # all batches are equal-sized.
+    return index[0:end_tr], index[end_tr:end_cv], index[end_cv:], int(end_tr/batch_size)
 
-    def __getitem__(self, idx):
-        batch_x = self.features[idx * self.batch_size:(idx + 1) * self.batch_size]
-        batch_y = self.labels[idx * self.batch_size:(idx + 1) * self.batch_size]
-        return batch_x, batch_y
+def ExpandDatasetHeter(features, mats, labels, times):
+    """ expand the features and labels to 2^n times their length with n=times """
+    for i in range(0, times):
+        features = np.concatenate((features, features), axis=0)
+        mats = np.concatenate((mats, mats), axis=0)
+        labels = np.concatenate((labels, labels), axis=0)
+        # print('2^(' + '{}'.format(i + 1) + '): feature shape = ', np.shape(features), ' label shape = ', np.shape(labels))
+    return features, mats, labels
 
 
 # class BatchDataTime(tf.keras.utils.Sequence):
@@ -636,16 +551,693 @@ class BatchData(tf.keras.utils.Sequence):
         # return batch_x, batch_x_time, batch_y
 
 
-def BatchData(data, batch_size):
-    features, labels = data
-    dataset = tf.data.Dataset.from_tensor_slices((tf.convert_to_tensor(features, dtype=tf.float32), tf.convert_to_tensor(labels, dtype=tf.float32)))
-    batched_dataset = dataset.batch(batch_size)
-    return batched_dataset
-    # print(dataset2, batched_dataset2)
-    # for b0 in batched_dataset2.prefetch(1):
-        # print(b0)
+def check_bc_data(features, dof, chunk_size=4096, bc_channels=None):
+    """
+    validate the BC conventions of the features [batch, node_height, node_width, >= 2*dof] or [batch, node_depth, node_height, 
+    node_width, >= 2*dof] (vectorized, chunk by chunk). The channels after bc_channels (e.g. material fields) are only 
+    checked for non-finite values. Default: all channels are BC channels.
+
+    Dirichlet channels: BC value >= 0, -2 (domain, no BC) or -1 (margin, no BC). Values in (-1.5, 0) are treated as margin, 
+    values < -2 are not allowed, as LayerFillRandomNumber() would make them randomly part of the domain.
+    Neumann channels: BC value > 0, no BC == 0. Negative values are only allowed in the margin, 
+    see ComputeNeumannBoundaryResidualNodalData().
+
+    raise ValueError for non-finite values, negative Neumann values in the domain and Dirichlet values < -2. Print a warning for 
+    samples without any Dirichlet BCs (singular problem) and without any Neumann BCs.
+    """
+    bad_finite, bad_neumann, bad_dirichlet, no_dirichlet, no_neumann = [], [], [], [], []
+    for i0 in range(0, len(features), chunk_size):
+        f = np.asarray(features[i0:i0+chunk_size])
+        sample = np.arange(i0, i0 + len(f))
+        dirichlet = f[..., 0:dof]
+        neumann = f[..., dof:bc_channels]
+        domain = np.expand_dims((dirichlet[..., 0] >= 0.0) | (dirichlet[..., 0] <= -1.5), axis=-1)
+        axis = tuple(range(1, f.ndim))
+        bad_finite.extend(sample[~np.all(np.isfinite(f), axis=axis)])
+        bad_neumann.extend(sample[np.any((neumann < 0.0) & domain, axis=axis)])
+        bad_dirichlet.extend(sample[np.any(dirichlet < -2.0, axis=axis)])
+        no_dirichlet.extend(sample[~np.any(dirichlet >= 0.0, axis=axis)])
+        no_neumann.extend(sample[~np.any(neumann > 0.0, axis=axis)])
+
+    if bad_finite:
+        raise ValueError('features with NaN or inf values, samples: ', bad_finite[0:10], ' total: ', len(bad_finite))
+    if bad_neumann:
+        raise ValueError('Neumann BCs should NOT be smaller than zero (< 0) in the domain. Consider use diffusivity or elastic constant to scale the data! samples: ', bad_neumann[0:10], ' total: ', len(bad_neumann))
+    if bad_dirichlet:
+        raise ValueError('Dirichlet channels should be >= 0 (BC), -2 (domain) or -1 (margin), found values < -2 in samples: ', bad_dirichlet[0:10], ' total: ', len(bad_dirichlet))
+    if no_dirichlet:
+        print('WARNING: no Dirichlet BCs is detected in', len(no_dirichlet), 'samples, e.g.', no_dirichlet[0:10])
+    if no_neumann:
+        print('WARNING: no Neumann BCs is detected in', len(no_neumann), 'of', len(features), 'samples')
+    print('BC data is checked for', len(features), 'samples')
+
+
+def compute_bc_mask_channel(features, dof, chunk_size=4096):
+    """
+    compute the masks of the loss that only depend on the BCs once per sample and pack them bit by bit into one channel
+
+    bits (same as pde_layers.ComputeBoundaryMaskNodalData() and GetElementResidualMask(LayerFillRandomNumber()(Dirichlet))):
+        0 ... dof-1:     1 if not a Dirichlet BC (opt=1)
+        dof ... 2*dof-1: 1 if not a Neumann BC (opt=2)
+        2*dof:           1 if the element (i, j)-(i+1, j+1) (3D: (k, i, j)-(k+1, i+1, j+1)) is part of the residual
+
+    The packed integers (< 2^24 for dof <= 11, e.g. uint8 for dof <= 3) are exact in float32, so that the channel 
+    can be appended to the labels. Use pde_layers.UnpackBoundaryMaskNodalData() to get the masks.
+
+    return:
+        numpy array [batch, node_height, node_width, 1] (3D: [batch, node_depth, node_height, node_width, 1]) in float32
+    """
+    if 2 * dof + 1 > 24:
+        raise ValueError('too many dof to pack the BC masks into one float32 channel, dof = ', dof)
+    out = np.empty(tuple(np.shape(features)[0:-1]) + (1,), dtype=np.float32)
+    for i0 in range(0, len(features), chunk_size):
+        f = np.asarray(features[i0:i0+chunk_size])
+        dirichlet = f[..., 0:dof]
+        neumann = f[..., dof:2*dof]
+        bits = np.zeros(f.shape[0:-1], dtype=np.uint32)
+        for k in range(dof):
+            bits |= (dirichlet[..., k] < 0.0).astype(np.uint32) << k
+            bits |= (neumann[..., k] <= 0.0).astype(np.uint32) << (dof + k)
+        # LayerFillRandomNumber() maps -2 (domain) to [0, 1), the margin stays negative
+        node = (dirichlet[..., 0] >= 0.0) | ((dirichlet[..., 0] <= -1.5) & (dirichlet[..., 0] >= -2.0))
+        elem = np.zeros_like(node)
+        first = (slice(None),) + (slice(None, -1),) * (node.ndim - 1)
+        diagonal = (slice(None),) + (slice(1, None),) * (node.ndim - 1)
+        elem[first] = node[first] & node[diagonal]
+        bits |= elem.astype(np.uint32) << (2 * dof)
+        out[i0:i0+len(f), ..., 0] = bits
+    return out
+
+
+def dataset_cache_key(file_list, settings):
+    """
+    sha1 of the content of the np-features*.npy files in file_list, their paired np-labels*.npy files, and the settings
+
+    args:
+        file_list (list): np-features*.npy files in the loading order
+        settings (dict): everything else the preprocessed data depends on, e.g. DataAugTimes, split ratio, seed
+    """
+    h = hashlib.sha1()
+    for f1 in file_list:
+        for one_file in [f1, f1.replace('features', 'labels')]:
+            h.update(os.path.basename(one_file).encode())
+            with open(one_file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 24), b''):
+                    h.update(chunk)
+    h.update(json.dumps(settings, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def save_preprocessed_dataset(cache_folder, arrays, settings=None):
+    """
+    save the preprocessed arrays (e.g. features, labels, train_index) as .npy files in cache_folder
+
+    The files are written to a temporary folder first and renamed at the end, so that an interrupted
+    run or another rank never sees a partial cache.
+    """
+    if os.path.isdir(cache_folder):
+        return
+    parent = os.path.dirname(os.path.normpath(cache_folder))
+    os.makedirs(parent, exist_ok=True)
+    tmp_folder = cache_folder + '.tmp-' + str(os.getpid())
+    os.makedirs(tmp_folder, exist_ok=True)
+    for name, one in arrays.items():
+        np.save(os.path.join(tmp_folder, name + '.npy'), np.asarray(one))
+    with open(os.path.join(tmp_folder, 'cache.json'), 'w') as f:
+        json.dump({'arrays': list(arrays.keys()), 'settings': settings}, f, indent=1)
+    try:
+        os.rename(tmp_folder, cache_folder)
+        print('preprocessed data is cached in', cache_folder)
+    except OSError:
+        # the same cache was written by someone else in the meantime
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+
+
+def load_preprocessed_dataset(cache_folder):
+    """ memory-map the arrays saved by save_preprocessed_dataset(). Return None if there is no cache. """
+    cache_file = os.path.join(cache_folder, 'cache.json')
+    if not os.path.isfile(cache_file):
+        return None
+    with open(cache_file) as f:
+        info = json.load(f)
+    print('load preprocessed data from', cache_folder)
+    return {name: np.load(os.path.join(cache_folder, name + '.npy'), mmap_mode='r') for name in info['arrays']}
+
+
+def build_dataset_pipeline(data, batch_size, index=None, shuffle=False, shuffle_buffer=0, cache=None, interleave=0, prefetch=-1, augment=None, extra_labels=None):
+    """
+    tf.data input pipeline that gathers the samples data[index[i]] batch by batch.
+
+    Stages: 
+        index (full reshuffle at each epoch, or interleave over shard files) 
+        -> gather a batch of samples (parallel) 
+        -> [cache of the unique samples -> index repeats -> shuffle buffer -> re-batch] 
+        -> [augment]
+        -> prefetch
+
+    Args:
+        data: Tuple of numpy `array` (np.memmap or ShardedArray) instances, the last one being the labels. With more than two 
+              arrays, e.g. (features, mats, labels), the inputs are returned as a tuple ([features, mats], labels).
+        batch_size (int): number of elements in each batch.
+        index (numpy array): sample index, e.g. from expand_dataset_index() and split_index(). Default: all samples.
+        shuffle (bool): reshuffle at each epoch (as model.fit() does for numpy arrays)
+        shuffle_buffer (int): 0: reshuffle the full index, >0: use a shuffle buffer of gathered samples instead. 
+                              A cached pipeline is shuffled with the buffer, i.e. shuffle_buffer > 0 is needed.
+        cache (str): None: no cache, '': cache the gathered samples in memory, otherwise the cache file name. 
+                     Only the unique samples of index are cached. The repeats of index (expand_dataset_index()) 
+                     are read from the cache, one pass per repeat.
+        interleave (int): number of shard files of a ShardedArray read in parallel, each batch mixes the samples of 
+                          these shards. 0: off
+        prefetch (int): number of batches to prefetch. -1: autotune, 0: off
+        augment (function): (inputs, labels) -> (inputs, labels) applied to each batch, e.g. dihedral_augmentation()
+        extra_labels (numpy array): [N, H, W, c] gathered with the same index and appended as channels to the labels, 
+                                    e.g. the packed BC masks from compute_bc_mask_channel() or the Neumann residual
+
+    Return:
+        batched tf.data.Dataset
+    """
+    *inputs, labels = data
+    arrays = list(inputs) + [labels]
+    if extra_labels is not None:
+        arrays.append(extra_labels)
+    if index is None:
+        index = np.arange(len(labels), dtype=np.int32)
+    index = np.asarray(index, dtype=np.int32)
+
+    # the batches are gathered from the host arrays (numpy, np.memmap or ShardedArray). Nothing is converted to 
+    # a tensor up front, so the data is neither embedded in the graph nor copied to the device as a whole.
+    # each sample index comes with its number of repeats in index, used after the cache
+    def _gather(i, c):
+        out = tf.numpy_function(lambda i: [np.asarray(x[i], dtype=np.float32) for x in arrays], [i], [tf.float32] * len(arrays))
+        for x, one in zip(out, arrays):
+            x.set_shape((None,) + tuple(np.shape(one)[1:]))
+        return tuple(out) + (c,)
+
+    def _to_inputs_labels(*out):
+        out = out[:-1]
+        if extra_labels is not None:
+            out = out[:-2] + (tf.concat(out[-2:], axis=-1),)
+        return (out[0] if len(out) == 2 else out[:-1]), out[-1]
+
+    # a cached stream is only read in the cached order, so it is shuffled after the cache with a bounded buffer
+    if shuffle and cache is not None and shuffle_buffer <= 0:
+        raise ValueError('a cached pipeline is shuffled with a shuffle buffer, shuffle_buffer should be > 0, not: ', shuffle_buffer)
+    pre_shuffle = shuffle and cache is None and shuffle_buffer <= 0
+    post_shuffle = shuffle and not pre_shuffle
+
+    counts = np.ones(len(index), dtype=np.int64)
+    if cache is not None:
+        # only the unique samples are gathered and cached, the repeats are added after the cache
+        index, counts = np.unique(index, return_counts=True)
+        index = index.astype(np.int32)
+
+    if interleave > 0 and isinstance(labels, ShardedArray):
+        # one index stream per shard file, sorted to read each file sequentially, or reshuffled at each epoch
+        shard_id = np.searchsorted(labels.offsets, index, side='right') - 1
+        order = np.lexsort((index, shard_id))
+        shard_index = tf.RaggedTensor.from_value_rowids(index[order], shard_id[order], nrows=len(labels.shards))
+        shard_counts = tf.RaggedTensor.from_value_rowids(counts[order], shard_id[order], nrows=len(labels.shards))
+
+        def _shard_stream(s):
+            one = tf.data.Dataset.from_tensor_slices((shard_index[s], shard_counts[s]))
+            if pre_shuffle:
+                one = one.shuffle(tf.maximum(tf.size(shard_index[s], out_type=tf.int64), 1), reshuffle_each_iteration=True)
+            return one
+
+        dataset = tf.data.Dataset.range(len(labels.shards))
+        if pre_shuffle:
+            dataset = dataset.shuffle(len(labels.shards), reshuffle_each_iteration=True)
+        dataset = dataset.interleave(
+                _shard_stream,
+                cycle_length=interleave, 
+                num_parallel_calls=tf.data.AUTOTUNE, 
+                deterministic=not pre_shuffle)
+    else:
+        dataset = tf.data.Dataset.from_tensor_slices((index, counts))
+        if pre_shuffle:
+            dataset = dataset.shuffle(len(index), reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+
+    dataset = dataset.map(_gather, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not pre_shuffle)
+
+    if cache is not None or post_shuffle:
+        dataset = dataset.unbatch()
+        if cache is not None:
+            dataset = dataset.cache(cache)
+            if counts.max() > 1:
+                # pass r over the cache keeps the samples that are repeated more than r times in index
+                cached = dataset
+                dataset = tf.data.Dataset.range(int(counts.max())).flat_map(lambda r: cached.filter(lambda *out: out[-1] > r))
+        if post_shuffle:
+            dataset = dataset.shuffle(shuffle_buffer, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size)
+
+    dataset = dataset.map(_to_inputs_labels)
+    if augment is not None:
+        dataset = dataset.map(augment, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+    if prefetch != 0:
+        dataset = dataset.prefetch(tf.data.AUTOTUNE if prefetch < 0 else prefetch)
+    return dataset
+
+
+def dihedral_augmentation(dof, two_neumann_channel=False, extra_labels=None, transpose=True, material_channels=0):
+    """
+    random flips and 90 degree rotations (the 8 transforms of the dihedral group) of a batch of BVPs
+
+    Each sample of a batch (features, labels) gets its own random transform, applied to the images and to 
+    the channels:
+        - x is along the width (axis 2) and y against the height (axis 1) of the images, see Get2DGaussPointInfo()
+        - transpose of the images (x -> -y, y -> -x): swap the Ux/Uy channels and change both signs, and swap the two 
+          Neumann channels (t_x on vertical edges, t_y on horizontal edges) if two_neumann_channel
+        - flip along x (or y) for a vector dof: Ux (or Uy) of the Dirichlet BCs, the Neumann BCs (traction) and the labels 
+          change sign. For the scaled data (u + 0.5, (t + 1)/2) this is value -> 1 - value, applied only to 
+          BC values (Dirichlet >= 0, Neumann > 0), so that "no BC" stays as it is.
+        - a scalar dof (and a scalar Neumann flux) does not change sign
+
+    args:
+        dof (int): 1 (scalar) or 2 (vector [Ux, Uy])
+        two_neumann_channel (bool): features have [Dirichlet (dof), Neumann t_x (dof), Neumann t_y (dof)] channels 
+                                    instead of [Dirichlet (dof), Neumann (dof)]
+        extra_labels (function): features -> channels that are appended to the labels after channel dof, e.g. the packed 
+                                 BC masks from compute_bc_mask_channel() or the Neumann residual. They are not transformed, 
+                                 but computed again from the transformed features, as e.g. the element mask is not 
+                                 symmetric (one diagonal) and the per dof bits change with the transpose.
+        transpose (bool): False for rectangular images or dx != dy, only the 4 flips are used then
+        material_channels (int): number of scalar material fields after the BC channels, they are only moved with the images
+
+    return:
+        function (features, labels) -> (features, labels) to map over a batched tf.data.Dataset
+    """
+    if dof not in [1, 2]:
+        raise ValueError('symmetry augmentation is only implemented for dof = 1 (scalar) or dof = 2 (vector [Ux, Uy]), dof = ', dof)
+    if two_neumann_channel and dof != 1:
+        raise ValueError('symmetry augmentation with two Neumann channels is only implemented for dof = 1, dof = ', dof)
+
+    # channel permutation for the transpose, and the channels that change sign for a flip along x or y 
+    if dof == 1 and two_neumann_channel:
+        feature_perm, feature_neg_x, feature_neg_y = [0, 2, 1], [0, 0, 0], [0, 0, 0]
+    elif dof == 1:
+        feature_perm, feature_neg_x, feature_neg_y = [0, 1], [0, 0], [0, 0]
+    else:
+        feature_perm, feature_neg_x, feature_neg_y = [1, 0, 3, 2], [1, 0, 1, 0], [0, 1, 0, 1]
+    label_perm, label_neg_x, label_neg_y = feature_perm[0:dof], feature_neg_x[0:dof], feature_neg_y[0:dof]
+    # Neumann channels: > 0 is a BC, Dirichlet channels: >= 0 is a BC
+    is_neumann = tf.constant([False] * dof + [True] * (len(feature_perm) - dof) + [False] * material_channels)
+    feature_perm = feature_perm + list(range(len(feature_perm), len(feature_perm) + material_channels))
+    feature_neg_x, feature_neg_y = feature_neg_x + [0] * material_channels, feature_neg_y + [0] * material_channels
+
+    use_transpose = transpose
+
+    def _geometry(a, transpose, flip_y, flip_x):
+        if use_transpose:
+            a = tf.where(transpose, tf.transpose(a, [0, 2, 1, 3]), a)
+        a = tf.where(flip_y, tf.reverse(a, [1]), a)
+        a = tf.where(flip_x, tf.reverse(a, [2]), a)
+        return a
+
+    def _channels(a, perm, neg_x, neg_y, transpose, flip_y, flip_x, bc_only):
+        a = tf.where(transpose, tf.gather(a, perm, axis=3), a)
+        if sum(neg_x) + sum(neg_y) == 0:
+            return a
+        # the transpose is the reflection x -> -y, y -> -x, so both components change sign
+        neg = tf.logical_or(
+                tf.logical_and(tf.math.logical_xor(transpose, flip_x), tf.constant(np.array(neg_x, dtype=bool))), 
+                tf.logical_and(tf.math.logical_xor(transpose, flip_y), tf.constant(np.array(neg_y, dtype=bool))))
+        if bc_only:
+            neg = tf.logical_and(neg, tf.where(is_neumann, a > 0.0, a >= 0.0))
+            # keep a Neumann value of 1 (t = 1) as a BC after the sign change
+            return tf.where(neg, tf.where(is_neumann, tf.maximum(1.0 - a, 1.0e-6), 1.0 - a), a)
+        return tf.where(neg, 1.0 - a, a)
+
+    def augment(features, labels):
+        if transpose and features.shape[1] != features.shape[2]:
+            raise ValueError('symmetry augmentation with the transpose needs square images, features shape: ', features.shape)
+        g = tf.random.uniform([tf.shape(features)[0], 3, 1, 1, 1], minval=0, maxval=2, dtype=tf.int32) > 0
+        flip_y, flip_x = g[:, 1], g[:, 2]
+        transpose_sample = g[:, 0] if transpose else tf.zeros_like(flip_y)
+
+        features = _geometry(features, transpose_sample, flip_y, flip_x)
+        if extra_labels is not None:
+            labels = labels[:, :, :, 0:dof]
+        labels = _geometry(labels, transpose_sample, flip_y, flip_x)
+        features = _channels(features, feature_perm, feature_neg_x, feature_neg_y, transpose_sample, flip_y, flip_x, bc_only=True)
+        labels = _channels(labels, label_perm, label_neg_x, label_neg_y, transpose_sample, flip_y, flip_x, bc_only=False)
+        if extra_labels is not None:
+            labels = tf.concat([labels, extra_labels(features)], axis=3)
+        return features, labels
+
+    return augment
+
+
+def memory_aware_batch_size(batch_size, node_shape, layers_str, max_memory, feature_channels, dof, GPs, dim=2):
+    """
+    largest batch size <= batch_size with an estimated training memory below max_memory. 3D images quickly need a smaller 
+    batch than the 2D ones, e.g. a 64^3 image has as many nodes as a 512x512 image.
+
+    The estimate counts the float32 values of one sample, twice for the gradients of the backward pass:
+        - the output of each layer of the NNArchitecture, with the resolution of the pooling, upsampling and reshape layers
+        - the model output (dof + features)
+        - the loss: element gather and element residual (2^dim * dof per element), gradu and stress at the GPs 
+          (2 * GPs * dim * dof) and the nodal masks and residuals (4 * dof)
+    The weights, the optimizer slots and the workspace of the convolutions are not included.
+
+    Args:
+        batch_size (int): BatchSize of the config file
+        node_shape (tuple): (node_height, node_width) or (node_depth, node_height, node_width)
+        layers_str (str): NNArchitecture of the config file
+        max_memory (float): memory of one batch in MB
+        feature_channels (int): channels of the features
+        dof (int): dof per node
+        GPs (int): GPs of the element rule
+        dim (int): 2 or 3
+
+    Returns:
+        batch size
+    """
+    nodes = float(np.prod(node_shape))
+    values = feature_channels + (dof + feature_channels) + 2 * (2 ** dim) * dof + 2 * GPs * dim * dof + 4 * dof
+    scale, channels = 1.0, feature_channels
+    for one_layer in [x.strip() for x in layers_str.split(';') if x.strip()]:
+        parameters = dict([y.strip() for y in x.split('=', 1)] for x in one_layer.split('|') if '=' in x)
+        size = parameters.get('pool_size', parameters.get('size', '1'))
+        size = [int(s) for s in size.strip('()[]').split(',') if s.strip()]
+        size = size[0] ** dim if len(size) == 1 else np.prod(size)
+        if parameters['type'].startswith('MaxPooling'):
+            scale /= size
+        elif parameters['type'].startswith('UpSampling'):
+            scale *= size
+        elif parameters['type'] == 'Flatten':
+            continue
+        elif parameters['type'] == 'Reshape':
+            target_shape = [int(s) for s in parameters['target_shape'].strip('()[]').split(',') if s.strip()]
+            scale, channels = np.prod(target_shape[0:-1]) / nodes, target_shape[-1]
+        if 'filters' in parameters:
+            channels = int(parameters['filters'])
+        if 'units' in parameters:
+            values += int(parameters['units']) / nodes
+        else:
+            values += channels * scale
+    sample_memory = 2 * 4 * nodes * values / 1024.0**2
+    max_batch_size = max(1, int(max_memory / sample_memory))
+    print('estimated memory per sample: {:.2f} MB,'.format(sample_memory), 'MaxBatchMemory:', max_memory, 'MB, batch size:', min(batch_size, max_batch_size))
+    if max_batch_size < batch_size:
+        print('WARNING: BatchSize is reduced from', batch_size, 'to', max_batch_size, 'to fit into MaxBatchMemory')
+        return max_batch_size
+    return batch_size
+
+
+def report_dataset_throughput(dataset, name='', max_batches=100):
+    """ iterate over (at most max_batches of) a batched dataset without training to check if the input pipeline is the bottleneck """
+    t0 = time.time()
+    samples = 0
+    batches = 0
+    for _, y in dataset.take(max_batches):
+        samples += int(tf.shape(y)[0])
+        batches += 1
+    dt = max(time.time() - t0, 1.0e-6)
+    print('input pipeline', name, ':', batches, 'batches,', samples, 'samples in', '{:.3f} s,'.format(dt), '{:.1f} samples/s'.format(samples / dt))
+    return samples / dt
+
+
+def rank_sample_slice(num_samples, rank, size, mode='strided'):
+    """
+    samples of one rank when a single dataset is shared by size ranks (Horovod), without splitting it on disk
+
+    Each rank gets num_samples // size samples, so that all ranks run the same number of batches. The 
+    remaining num_samples % size samples are not used.
+
+    args:
+        num_samples (int): number of samples of the full dataset
+        rank (int): rank of this process
+        size (int): number of ranks
+        mode (str): 'strided' (rank, rank + size, ...), or 'contiguous' (one block per rank)
+
+    return:
+        slice over axis 0 of the full dataset
+    """
+    if size < 1 or rank < 0 or rank >= size:
+        raise ValueError('wrong rank = ', rank, ' or size = ', size)
+    n = num_samples // size
+    if n == 0:
+        raise ValueError('less samples than ranks, samples: ', num_samples, ' ranks: ', size)
+    if mode == 'strided':
+        return slice(rank, rank + (n - 1) * size + 1, size)
+    elif mode == 'contiguous':
+        return slice(rank * n, (rank + 1) * n, 1)
+    raise ValueError('RankSharding should be dir, strided or contiguous, not: ', mode)
+
+
+def slice_parts(slc, offsets):
+    """
+    split a slice (step > 0) over the concatenation of several arrays into one slice per array
+
+    args:
+        slc (slice): slice over the concatenated arrays, e.g. from rank_sample_slice()
+        offsets (numpy array): start of each array in the concatenation, plus the total length at the end
+
+    return:
+        list of (array id, local slice, first output position, last output position + 1) for the arrays with samples
+    """
+    start, stop, step = slc.indices(int(offsets[-1]))
+    parts = []
+    out = 0
+    for i in range(len(offsets) - 1):
+        o0, o1 = int(offsets[i]), min(int(offsets[i+1]), stop)
+        first = start if start >= o0 else start + -(-(o0 - start) // step) * step
+        if first >= o1:
+            continue
+        n = (o1 - 1 - first) // step + 1
+        parts.append((i, slice(first - o0, first - o0 + (n - 1) * step + 1, step), out, out + n))
+        out += n
+    return parts
+
+
+def read_npy_header(filename):
+    """ 
+    read the shape and dtype of a .npy file from its header without loading the data 
+
+    return:
+        shape (tuple), dtype (numpy dtype)
+    """
+    with open(filename, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    return shape, dtype
+
+
+def load_npy_dataset(file_list, num_threads=8, report=True, sample_slice=None):
+    """
+    load the np-features*.npy files in file_list and the paired np-labels*.npy files to float32 arrays
+
+    The headers of all files are read first. One float32 output buffer of the final size is allocated
+    for features and labels, and each file is copied (and cast) in place by a thread pool. The result is 
+    the same as concatenating the files in the order of file_list and casting with astype(np.single).
+
+    args:
+        file_list (list): np-features*.npy files. The labels are paired by replacing 'features' with 'labels'. 
+        num_threads (int): number of threads to read the files
+        report (bool): print the progress and throughput
+        sample_slice (slice): only load these samples of the concatenated files, e.g. from rank_sample_slice(). 
+                              Each file is memory-mapped, so only the selected samples are read.
+
+    return:
+        features, labels
+    """
+    if len(file_list) == 0:
+        raise ValueError('No np-features*.npy files to load!')
+
+    pairs = [(f1, f1.replace('features', 'labels')) for f1 in file_list]
+    feature_shapes = [read_npy_header(f1)[0] for f1, _ in pairs]
+    label_shapes = [read_npy_header(f2)[0] for _, f2 in pairs]
+    for (f1, f2), s1, s2 in zip(pairs, feature_shapes, label_shapes):
+        if s1[0] != s2[0] or s1[1:] != feature_shapes[0][1:] or s2[1:] != label_shapes[0][1:]:
+            raise ValueError('inconsistent shape: ', f1, s1, f2, s2, ' first file: ', feature_shapes[0], label_shapes[0])
+
+    offsets = np.cumsum([0] + [s[0] for s in feature_shapes])
+    if sample_slice is None:
+        sample_slice = slice(None)
+    parts = slice_parts(sample_slice, offsets)
+    total = parts[-1][3] if parts else 0
+    features = np.empty((total,) + tuple(feature_shapes[0][1:]), dtype=np.float32)
+    labels = np.empty((total,) + tuple(label_shapes[0][1:]), dtype=np.float32)
+
+    t0 = time.time()
+    done = [0, 0]
+    lock = threading.Lock()
+    def _read(part):
+        i, local, out0, out1 = part
+        f1, f2 = pairs[i]
+        features[out0:out1] = np.load(f1, mmap_mode='r')[local]
+        labels[out0:out1] = np.load(f2, mmap_mode='r')[local]
+        if report:
+            with lock:
+                done[0] += 1
+                done[1] += os.path.getsize(f1) + os.path.getsize(f2)
+                print('file: ', done[0], '/', len(parts), f1, 'samples:', out1 - out0, 'of', feature_shapes[i][0], 
+                      '{:.1f} MB/s'.format(done[1] / 1.0e6 / max(time.time() - t0, 1.0e-6)))
+
+    with ThreadPoolExecutor(max_workers=max(1, num_threads)) as pool:
+        list(pool.map(_read, parts))
+
+    if report:
+        print('loaded', len(parts), 'files,', total, 'samples in', '{:.2f} s'.format(time.time() - t0))
+    return features, labels
 
 
+class ShardedArray:
+    """
+    Read-only view of several memory-mapped shards as one array along axis 0.
+
+    Indexing with an int, a slice or an index array only reads the requested samples from the
+    shards (page cache), and returns a numpy array. np.asarray() loads everything.
+    """
+    def __init__(self, shards):
+        self.shards = list(shards)
+        sample_shape = [x.shape[1:] for x in self.shards]
+        dtypes = [x.dtype for x in self.shards]
+        if len(self.shards) == 0 or sample_shape.count(sample_shape[0]) != len(sample_shape) or dtypes.count(dtypes[0]) != len(dtypes):
+            raise ValueError('ShardedArray needs at least one shard and all shards with the same sample shape and dtype! shapes: ', sample_shape, ' dtypes: ', dtypes)
+        self.offsets = np.cumsum([0] + [x.shape[0] for x in self.shards])
+        self.shape = (int(self.offsets[-1]),) + tuple(sample_shape[0])
+        self.dtype = dtypes[0]
+        self.ndim = len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            idx = idx + self.shape[0] if idx < 0 else idx
+            s = np.searchsorted(self.offsets, idx, side='right') - 1
+            return np.array(self.shards[s][idx - self.offsets[s]])
+        if isinstance(idx, slice):
+            idx = np.arange(self.shape[0])[idx]
+        idx = np.asarray(idx)
+        out = np.empty((len(idx),) + self.shape[1:], dtype=self.dtype)
+        shard_id = np.searchsorted(self.offsets, idx, side='right') - 1
+        for s in np.unique(shard_id):
+            pos = (shard_id == s)
+            out[pos] = self.shards[s][idx[pos] - self.offsets[s]]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        out = np.concatenate([np.asarray(x) for x in self.shards], axis=0)
+        return out if dtype is None else out.astype(dtype)
+
+    def astype(self, dtype, copy=True):
+        if np.dtype(dtype) == self.dtype and not copy:
+            return self
+        return np.asarray(self).astype(dtype)
+
+    def select(self, slc):
+        """ samples of a slice (step > 0) as a ShardedArray of memory-mapped views, without reading the data """
+        return ShardedArray([self.shards[i][local] for i, local, _, _ in slice_parts(slc, self.offsets)])
+
+    @staticmethod
+    def concatenate(arrays):
+        """ combine several ShardedArray without copying the data """
+        return ShardedArray([x for one in arrays for x in one.shards])
+
+
+def write_sharded_dataset(data_folder, shard_folder='shards', shard_size=0):
+    """
+    convert the np-features*.npy/np-labels*.npy files in data_folder to float32 shards with a manifest.json
+
+    The shards keep the natsorted file order of data_folder and are written to data_folder/shard_folder/,
+    which is not matched by the np-features*.npy glob of the original files. 
+
+    args:
+        data_folder (str): folder with np-features*.npy files, e.g. DataPath/DNS/ or DataPath/DNS/<rank>/ 
+        shard_folder (str): sub folder for the shards and manifest.json
+        shard_size (int): samples per shard. 0 keeps one shard per original file.
+
+    return:
+        path of manifest.json
+    """
+    file_list = natsorted(glob.glob(data_folder + '/np-features*.npy'), alg=ns.IGNORECASE)
+    if len(file_list) == 0:
+        raise ValueError('No np-features*.npy files are found in ' + data_folder)
+
+    out_folder = os.path.join(data_folder, shard_folder)
+    os.makedirs(out_folder, exist_ok=True)
+
+    sources = []
+    chunks = []
+    for f1 in file_list:
+        label_path = f1.replace('features', 'labels')
+        one_feature = np.load(f1, mmap_mode='r')
+        one_label = np.load(label_path, mmap_mode='r')
+        if one_feature.shape[0] != one_label.shape[0]:
+            raise ValueError('features and labels have different number of samples: ', f1, one_feature.shape, label_path, one_label.shape)
+        sources.append({'features': os.path.basename(f1), 'labels': os.path.basename(label_path), 'samples': int(one_feature.shape[0])})
+        step = shard_size if shard_size > 0 else max(one_feature.shape[0], 1)
+        for i0 in range(0, one_feature.shape[0], step):
+            chunks.append((one_feature[i0:i0+step], one_label[i0:i0+step]))
+
+    shards = []
+    for i, (one_feature, one_label) in enumerate(chunks):
+        feature_name, label_name = 'np-features-' + str(i) + '.npy', 'np-labels-' + str(i) + '.npy'
+        np.save(os.path.join(out_folder, feature_name), np.ascontiguousarray(one_feature, dtype=np.float32))
+        np.save(os.path.join(out_folder, label_name), np.ascontiguousarray(one_label, dtype=np.float32))
+        shards.append({
+            'features': feature_name, 'feature_shape': list(one_feature.shape),
+            'labels': label_name, 'label_shape': list(one_label.shape),
+            })
+
+    manifest = {
+        'format': 'npy-shards',
+        'version': 1,
+        'dtype': 'float32',
+        'samples': int(sum(x['feature_shape'][0] for x in shards)),
+        'sources': sources,
+        'shards': shards,
+        }
+    manifest_file = os.path.join(out_folder, 'manifest.json')
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    print('write', len(shards), 'shards with', manifest['samples'], 'samples to', out_folder)
+    return manifest_file
+
+
+def load_sharded_dataset(data_folder, shard_folder='shards', shard_size=0):
+    """
+    memory-map the float32 shards of data_folder listed in data_folder/shard_folder/manifest.json
+
+    The shards are (re)written by write_sharded_dataset() if the manifest does not exist or the 
+    original np-features*.npy files of data_folder have changed.
+
+    return:
+        features, labels as ShardedArray
+    """
+    out_folder = os.path.join(data_folder, shard_folder)
+    manifest_file = os.path.join(out_folder, 'manifest.json')
+
+    file_list = natsorted(glob.glob(data_folder + '/np-features*.npy'), alg=ns.IGNORECASE)
+    sources = [{'features': os.path.basename(f1), 'labels': os.path.basename(f1.replace('features', 'labels')), 'samples': int(read_npy_header(f1)[0][0])} for f1 in file_list]
+
+    manifest = None
+    if os.path.isfile(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    # shards without the original files (only shards are copied to a new machine) are used as they are
+    if manifest is None or (len(sources) > 0 and manifest['sources'] != sources):
+        write_sharded_dataset(data_folder, shard_folder=shard_folder, shard_size=shard_size)
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+
+    features, labels = [], []
+    for one in manifest['shards']:
+        one_feature = np.load(os.path.join(out_folder, one['features']), mmap_mode='r')
+        one_label = np.load(os.path.join(out_folder, one['labels']), mmap_mode='r')
+        if list(one_feature.shape) != one['feature_shape'] or list(one_label.shape) != one['label_shape'] or one_feature.dtype != manifest['dtype'] or one_label.dtype != manifest['dtype']:
+            raise ValueError('shard does not match manifest.json: ', one, one_feature.shape, one_feature.dtype, one_label.shape, one_label.dtype)
+        features.append(one_feature)
+        labels.append(one_label)
+    print('shards:', out_folder, 'samples:', manifest['samples'])
+    return ShardedArray(features), ShardedArray(labels)
 
 
 def exe_cmd(cmd, output=False):
@@ -31,7 +31,13 @@ import tensorflow_probability as tfp
 
 from nn_models import BNN_user_weak_pde_general
 import pde_layers as pde_layers
-from pde_utility import plot_PDE_solutions, plot_fields, split_data, expand_dataset, exe_cmd, BatchData, plot_one_field_hist, plot_one_field_stat, plot_one_field,plot_PDE_solutions_new
+from pde_utility import plot_PDE_solutions, plot_fields, split_data, expand_dataset, exe_cmd, plot_one_field_hist, plot_one_field_stat, plot_one_field,plot_PDE_solutions_new
+from pde_utility import expand_dataset_index, split_index, load_sharded_dataset, ShardedArray, load_npy_dataset
+from pde_utility import build_dataset_pipeline, report_dataset_throughput, dihedral_augmentation
+from pde_utility import dataset_cache_key, save_preprocessed_dataset, load_preprocessed_dataset
+from pde_utility import check_bc_data, compute_bc_mask_channel
+from pde_utility import rank_sample_slice, read_npy_header, memory_aware_batch_size
+from pde_constitutive_models import get_constitutive_model, parse_material_parameters
 
 with_horovod = True
 
@@ -63,6 +69,10 @@ class PDEWorkflowSteadyState:
 
     def __init__(self):
         self.restart_dir_to_load = ''
+        self.bulk_residual_layer = None
+        self.bulk_residual_layer_key = None
+        # spatial dimension: 2 for [batch, height, width, channels], 3 for [batch, depth, height, width, channels]
+        self.dim = 2
         self.now_str = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
         self.today_str = datetime.datetime.now().strftime("%Y-%m-%dT%H-%M")
 
@@ -127,6 +137,169 @@ class PDEWorkflowSteadyState:
         except:
             self.FixLoc = 0
 
+        try:
+            # 1: the test split only keeps the unique samples (train/val batches always index the unique samples)
+            self.VirtualDataAug = int(self.config['NN']['VirtualDataAug'])
+        except:
+            self.VirtualDataAug = 0
+
+        try:
+            self.split_seed = int(self.config['NN']['SplitSeed'])
+        except:
+            self.split_seed = 0
+        self.split_ratio = ['0.8', '0.1', '0.1']
+
+        try:
+            # npy: load np-features*.npy to memory; shards: memory-map float32 shards listed in <data folder>/shards/manifest.json
+            self.data_format = self.config['NN']['DataFormat'].strip()
+        except:
+            self.data_format = 'npy'
+        if self.data_format not in ['npy', 'shards']:
+            raise ValueError('DataFormat = ' + self.data_format + ' is not supported! Choose from: npy, shards')
+
+        # input pipeline, see build_dataset_pipeline()
+        try:
+            # 0: reshuffle the full index at each epoch, >0: size of the shuffle buffer of samples (needed with DataCache)
+            self.data_shuffle_buffer = int(self.config['NN']['DataShuffleBuffer'])
+        except:
+            self.data_shuffle_buffer = 0
+
+        try:
+            # none: no cache, memory: cache the unique gathered samples in memory, otherwise a cache file name prefix
+            self.data_cache = self.config['NN']['DataCache'].strip()
+        except:
+            self.data_cache = 'none'
+        if self.data_cache != 'none' and self.data_shuffle_buffer <= 0:
+            raise ValueError('DataCache = ' + self.data_cache + ' shuffles the cached samples with a buffer, set DataShuffleBuffer > 0, not: ', self.data_shuffle_buffer)
+
+        try:
+            # number of shard files read in parallel for DataFormat = shards, 0: off
+            self.data_interleave = int(self.config['NN']['DataInterleave'])
+        except:
+            self.data_interleave = 0
+
+        try:
+            # number of prefetched batches, -1: autotune
+            self.data_prefetch = int(self.config['NN']['DataPrefetch'])
+        except:
+            self.data_prefetch = -1
+
+        try:
+            # >0: time this number of training batches of the input pipeline alone and report samples/s
+            self.data_report = int(self.config['NN']['DataReport'])
+        except:
+            self.data_report = 0
+
+        try:
+            # width (x) and height (y) of the domain, e.g. "2.0 1.0". The element size is (dx, dy) = (width / (node_width - 1), 
+            # height / (node_height - 1)), so rectangular images and rectangular domains need no resampling. 
+            # 3D: width, height and depth (z). Default: unit square (cube)
+            self.domain_size = [float(x) for x in self.config['NN']['DomainSize'].split()]
+        except:
+            self.domain_size = [1.0, 1.0, 1.0]
+
+        try:
+            # 1: random flips and 90 degree rotations of each training batch, see dihedral_augmentation(). Only the flips 
+            # for rectangular images or dx != dy
+            self.SymmetryAug = int(self.config['NN']['SymmetryAug'])
+        except:
+            self.SymmetryAug = 0
+
+        try:
+            # 1: check the BC data once after loading, and precompute the BC masks of the loss as one extra label channel
+            self.PrecomputeMasks = int(self.config['NN']['PrecomputeMasks'])
+        except:
+            self.PrecomputeMasks = 0
+
+        try:
+            # GPs of the element rule of the bulk residual: 1 (reduced integration), 4 (2x2) or 9 (3x3). 
+            # 3D: 1, 8 (2x2x2) or 27 (3x3x3). Default (0): the rule of the physics class
+            self.GaussPoints = int(self.config['NN']['GaussPoints'])
+        except:
+            self.GaussPoints = 0
+
+        try:
+            # 1: linear problems (diffusion, linear elasticity) compute the element residual with the matrix-free element 
+            # operator (a single conv2d) instead of the GP path, see LayerBulkResidual.initialize_stencil()
+            self.LinearStencil = int(self.config['NN']['LinearStencil'])
+        except:
+            self.LinearStencil = 0
+
+        try:
+            # constitutive model of the bulk residual, e.g. mooney-rivlin, see pde_constitutive_models.py. 
+            # Default: the model of the physics class (linear diffusion, isotropic linear elasticity, neo-hookean)
+            self.ConstitutiveModel = self.config['NN']['ConstitutiveModel'].strip()
+        except:
+            self.ConstitutiveModel = ''
+
+        try:
+            # material parameters of the ConstitutiveModel as pairs of name and value, e.g. "E0 25 nu0 0.3 ratio 0.3". 
+            # Default: the parameters of the physics class (D0, E0, nu0) and the defaults of the model
+            material_parameters = self.config['NN']['MaterialParameters']
+        except:
+            material_parameters = ''
+        self.MaterialParameters = parse_material_parameters(material_parameters)
+
+        try:
+            # material parameters of the ConstitutiveModel given per node, e.g. "E0" or "E0 nu0" for a polycrystal, "D0" for 
+            # a porous medium. One feature channel per name after the BC channels, in the units of MaterialParameters. 
+            # The fields are interpolated to the GPs and replace the scalar values, see ComputeMaterialFieldsAtAllGPs(). 
+            # Default: homogeneous material
+            self.MaterialFields = self.config['NN']['MaterialFields'].split()
+        except:
+            self.MaterialFields = []
+        if self.MaterialFields and self.LinearStencil:
+            raise ValueError('LinearStencil needs a homogeneous material, it is not available with MaterialFields = ', self.MaterialFields)
+
+        try:
+            # hyperelastic models (nonlinear elasticity): 0: hand-written P, 1: P = dW/dF by automatic differentiation of 
+            # the strain energy density in one XLA-compiled kernel, 2: same without XLA. See HyperelasticModel. The models of 
+            # register_strain_energy() have no hand-written P and use 1 by default.
+            self.StrainEnergyAD = int(self.config['NN']['StrainEnergyAD'])
+        except:
+            self.StrainEnergyAD = 0
+
+        try:
+            # 1: compute the Neumann residual once per sample after loading and feed it as extra label channels, 
+            # so that the loss only computes the bulk residual
+            self.PrecomputeNeumann = int(self.config['NN']['PrecomputeNeumann'])
+        except:
+            self.PrecomputeNeumann = 0
+
+        try:
+            # >0: memory (MB) for one training batch. The BatchSize is reduced if the estimate of 
+            # memory_aware_batch_size() for the NNArchitecture and the element rule is larger, e.g. for 3D images
+            self.MaxBatchMemory = float(self.config['NN']['MaxBatchMemory'])
+        except:
+            self.MaxBatchMemory = 0
+
+        try:
+            # folder to cache the loaded and split data, e.g. restart/data-cache. Default: no cache
+            self.preprocess_cache_dir = self.config['NN']['PreprocessCacheDir'].strip()
+        except:
+            self.preprocess_cache_dir = ''
+
+        try:
+            # number of threads to read the np-features*.npy files
+            self.load_threads = int(self.config['NN']['LoadThreads'])
+        except:
+            self.load_threads = min(8, os.cpu_count() or 1)
+
+        try:
+            # samples per shard when the shards are written, 0: one shard per np-features*.npy file
+            self.shard_size = int(self.config['NN']['ShardSize'])
+        except:
+            self.shard_size = 0
+
+        try:
+            # Horovod: dir (each rank reads DataFolder/<rank>/), strided or contiguous (all ranks share one DataFolder 
+            # and each rank reads its own samples). Default auto: dir if DataFolder/<rank>/ exists, otherwise strided.
+            self.rank_sharding = self.config['NN']['RankSharding'].strip()
+        except:
+            self.rank_sharding = 'auto'
+        if self.rank_sharding not in ['auto', 'dir', 'strided', 'contiguous']:
+            raise ValueError('RankSharding should be auto, dir, strided or contiguous, not: ', self.rank_sharding)
+
         self.model = None
 
         try:
@@ -231,63 +404,144 @@ class PDEWorkflowSteadyState:
             data_folder_list = self.data_folder
             # data_folder = self.data_path + '/' + self.data_folder + '/'
 
+        # Horovod: pre-split DataFolder/<rank>/ folders, or one dataset shared by all ranks
+        rank, size = (hvd.rank(), hvd.size()) if with_horovod else (0, 1)
+        rank_mode = self.rank_sharding
+        if rank_mode == 'auto':
+            rank_dirs = all(os.path.isdir(self.data_path + '/' + one_folder + '/' + str(rank)) for one_folder in data_folder_list)
+            rank_mode = 'dir' if rank_dirs else 'strided'
+        if with_horovod:
+            print('rank', rank, 'of', size, 'data sharding:', rank_mode)
+
+        all_files = []
+        all_folders = []
         for one_folder in data_folder_list:
 
-            if with_horovod:
-                data_folder = self.data_path + '/' + one_folder + '/' + str(hvd.rank()) + '/' 
+            if with_horovod and rank_mode == 'dir':
+                data_folder = self.data_path + '/' + one_folder + '/' + str(rank) + '/' 
             else:
                 data_folder = self.data_path + '/' + one_folder + '/' 
 
             file_list = glob.glob(data_folder + '/np-features*.npy')
             file_list = natsorted(file_list, alg=ns.IGNORECASE)
             # print (file_list)
-
-            count = 0
-            for f1 in file_list:
-                print('file: ', count, f1)
-                count += 1
-                one_feature = np.load(f1)
-                label_path = f1.replace('features', 'labels')
-                one_label = np.load(label_path)
-                print('file:', f1, 'label:', np.shape(one_label), 'feature:', np.shape(one_feature))
-                if (self.features is None):
-                    self.features = np.copy(one_feature)
-                    self.labels = np.copy(one_label)
-                else:
-                    self.features = np.concatenate((self.features, one_feature), axis=0)
-                    self.labels = np.concatenate((self.labels, one_label), axis=0)
+            all_files.extend(file_list)
+            all_folders.append(data_folder)
 
             if (not only_testing) and only_neumann_data:
                 raise ValueError("only neumann data option is disabled")
 
+        # the loaded and split data only depends on the data files and the following settings
+        settings = {'DataAugTimes': self.expand_times, 'SplitSeed': self.split_seed}
+        if with_horovod and rank_mode != 'dir':
+            settings.update({'RankSharding': rank_mode, 'rank': rank, 'size': size})
+        cache_folder = ''
+        if (not only_testing) and self.preprocess_cache_dir:
+            if all_files:
+                cache_folder = os.path.join(self.preprocess_cache_dir, dataset_cache_key(all_files, settings))
+            else:
+                print('no np-features*.npy files to hash, the preprocessing cache is not used')
+        cached = load_preprocessed_dataset(cache_folder) if cache_folder else None
+
+        if cached is not None:
+            self.features, self.labels = cached['features'], cached['labels']
+        elif self.data_format == 'shards':
+            if with_horovod and rank_mode != 'dir' and size > 1:
+                # the shards of a shared folder are (re)written by rank 0 only
+                if rank == 0:
+                    for data_folder in all_folders:
+                        load_sharded_dataset(data_folder, shard_size=self.shard_size)
+                hvd.allreduce(tf.constant(0.0), name='wait_for_shards')
+            for data_folder in all_folders:
+                one_feature, one_label = load_sharded_dataset(data_folder, shard_size=self.shard_size)
+                print('folder:', data_folder, 'label:', np.shape(one_label), 'feature:', np.shape(one_feature))
+                if (self.features is None):
+                    self.features, self.labels = one_feature, one_label
+                else:
+                    self.features = ShardedArray.concatenate([self.features, one_feature])
+                    self.labels = ShardedArray.concatenate([self.labels, one_label])
+            if with_horovod and rank_mode != 'dir':
+                sample_slice = rank_sample_slice(len(self.features), rank, size, mode=rank_mode)
+                self.features, self.labels = self.features.select(sample_slice), self.labels.select(sample_slice)
+        else:
+            # all files are read into one pre-allocated float32 buffer
+            sample_slice = None
+            if with_horovod and rank_mode != 'dir':
+                num_samples = sum(read_npy_header(f1)[0][0] for f1 in all_files)
+                sample_slice = rank_sample_slice(num_samples, rank, size, mode=rank_mode)
+            self.features, self.labels = load_npy_dataset(all_files, num_threads=self.load_threads, sample_slice=sample_slice)
+
         print('len of self.features: ', np.shape(self.features))
-        self.dh = 1.0 / (np.shape(self.features)[2] - 1.0)
+        if len(np.shape(self.features)) != self.dim + 2:
+            raise ValueError('features of ' + str(self.dim) + 'D problems should have ' + str(self.dim + 2) + ' dimensions, not: ', np.shape(self.features))
+        if len(self.domain_size) < self.dim:
+            raise ValueError('DomainSize needs ' + str(self.dim) + ' values for ' + str(self.dim) + 'D problems, not: ', self.domain_size)
+        if self.dim == 3:
+            # (dx, dy, dz), z along the depth (axis 1) of the 3D images
+            self.dh = (self.domain_size[0] / (np.shape(self.features)[3] - 1.0), self.domain_size[1] / (np.shape(self.features)[2] - 1.0), 
+                       self.domain_size[2] / (np.shape(self.features)[1] - 1.0))
+        else:
+            # (dx, dy), x along the width (axis 2) and y along the height (axis 1) of the images
+            self.dh = (self.domain_size[0] / (np.shape(self.features)[2] - 1.0), self.domain_size[1] / (np.shape(self.features)[1] - 1.0))
+        if self.dim == 3 and self.SymmetryAug:
+            raise ValueError('SymmetryAug is only implemented for 2D problems!')
 
 
         # self._output_bc_stats()
         # self._output_bc_stats_good_bad()
-        self.features = self.features.astype(np.single)    
-        self.labels = self.labels.astype(np.single)    
+        self.features = self.features.astype(np.single, copy=False)
+        self.labels = self.labels.astype(np.single, copy=False)
         print(self.features.dtype)
 
+        if np.shape(self.features)[-1] < self._bc_channels() + len(self.MaterialFields):
+            raise ValueError('features need ' + str(self._bc_channels()) + ' BC channels and one channel per MaterialFields ', 
+                             self.MaterialFields, ', not: ', np.shape(self.features))
+        if self.PrecomputeMasks:
+            check_bc_data(self.features, dof=self.dof, bc_channels=self._bc_channels())
+        self.extra_labels = self._precompute_extra_labels(self.features)
+
         if only_testing:
-            self.test_dataset = self.features
-            self.test_label = self.labels
+            self.test_dataset = np.asarray(self.features)
+            self.test_label = np.asarray(self.labels)
             # for scaling test
             # the_feature, the_label = expand_dataset(self.features, self.labels, times=12)
             # self.test_seq = BatchData(data=(the_feature, the_label), batch_size=4096)
 
-            self.test_seq = BatchData(data=(self.test_dataset, self.test_label), batch_size=1)
+            self.data_cache_prefix = self._pipeline_cache_prefix(all_files, all_folders, dict(settings, Testing=1), rank)
+            self.test_seq = self._build_pipeline(data=(self.test_dataset, self.test_label), batch_size=1, name='test', extra_labels=self.extra_labels)
             self.train_seq = self.test_seq
         else:
-            the_feature, the_label = expand_dataset(self.features, self.labels, times=self.expand_times)
-            self.train_dataset, self.train_label, self.val_dataset, self.val_label, self.test_dataset, self.test_label, self.total_train_batch = split_data(the_feature, the_label, self.batch_size, split_ratio=['0.8', '0.1', '0.1'])
-            # self.train_dataset, self.train_label, self.val_dataset, self.val_label, self.test_dataset, self.test_label = split_data(the_feature, the_label, split_ratio=['0.1', '0.1', '0.8'])
-            self.train_seq = BatchData(data=(self.train_dataset, self.train_label), batch_size=self.batch_size)
-            self.val_seq   = BatchData(data=(self.val_dataset,   self.val_label),   batch_size=self.batch_size)
-            self.test_seq  = BatchData(data=(self.test_dataset,  self.test_label),  batch_size=self.batch_size)
-            print('len of features: ', np.shape(the_feature), 
-                  'len of training data: ', np.shape(self.train_dataset), 
+            if cached is not None:
+                the_index = cached['index']
+            else:
+                # only the index of the 2^DataAugTimes expanded dataset is shuffled and split
+                the_index = expand_dataset_index(np.shape(self.features)[0], times=self.expand_times)
+                the_index = the_index[np.random.default_rng(self.split_seed).permutation(len(the_index))]
+                if cache_folder:
+                    save_preprocessed_dataset(cache_folder, {'features': self.features, 'labels': self.labels, 'index': the_index}, settings=settings)
+            if self.MaxBatchMemory > 0:
+                self.batch_size = memory_aware_batch_size(
+                        self.batch_size, np.shape(self.features)[1:-1], self.config['NN']['NNArchitecture'], self.MaxBatchMemory, 
+                        feature_channels=np.shape(self.features)[-1], dof=self.dof, GPs=self.GPs, dim=self.dim)
+            # the split depends on the batch size, but not the cached shuffle
+            self.train_index, self.val_index, self.test_index, self.total_train_batch = split_index(the_index, self.batch_size, split_ratio=self.split_ratio, shuffle=False)
+            # self.train_index, self.val_index, self.test_index, self.total_train_batch = split_index(the_index, self.batch_size, split_ratio=['0.1', '0.1', '0.8'], shuffle=False)
+
+            if self.VirtualDataAug:
+                # each unique test sample is only predicted once
+                self.test_index = np.unique(self.test_index)
+            self.test_dataset, self.test_label = self.features[self.test_index], self.labels[self.test_index]
+
+            self.data_cache_prefix = self._pipeline_cache_prefix(all_files, all_folders, dict(settings, BatchSize=self.batch_size), rank, 
+                                                                 data_key=os.path.basename(cache_folder))
+            # train/val batches are gathered from the unique samples on the fly, no expanded copy is made
+            self.train_seq = self._build_pipeline(data=(self.features, self.labels), index=self.train_index, shuffle=True, name='train', augment=self.SymmetryAug, extra_labels=self.extra_labels)
+            self.val_seq   = self._build_pipeline(data=(self.features, self.labels), index=self.val_index, name='val', extra_labels=self.extra_labels)
+            self.test_seq  = self._build_pipeline(data=(self.test_dataset, self.test_label), name='test', 
+                                                  extra_labels=None if self.extra_labels is None else self.extra_labels[self.test_index])
+            print('len of features (index): ', np.shape(the_index), 
+                  'len of unique features: ', np.shape(self.features), 
+                  'len of training data: ', np.shape(self.train_index), 
                   'len of test data: ', np.shape(self.test_dataset), 
                   'batch size: ', self.batch_size, 
                   # 'total train batches: ', len(self.train_seq),
@@ -295,6 +549,144 @@ class PDEWorkflowSteadyState:
                   # 'total test batches: ', len(self.test_seq),
                   )
 
+            if self.data_report > 0:
+                report_dataset_throughput(self.train_seq, name='train', max_batches=self.data_report)
+
+    def _build_pipeline(self, data, index=None, batch_size=None, shuffle=False, name='', augment=False, extra_labels=None):
+        """ 
+        input pipeline with the DataShuffleBuffer, DataCache, DataInterleave and DataPrefetch options of [NN], see build_dataset_pipeline()
+
+        Only the shuffled train pipeline uses the shuffle buffer, and each split gets its own cache file <prefix>-<split>, 
+        see _pipeline_cache_prefix().
+        With augment, each batch gets random symmetry transforms of the BVPs after the cache.
+        The extra_labels (PrecomputeMasks, PrecomputeNeumann) are appended to the labels after channel dof, see _split_extra_labels().
+        """
+        if self.data_cache == 'none':
+            cache = None
+        elif self.data_cache == 'memory':
+            cache = ''
+        else:
+            cache = self.data_cache_prefix + '-' + name
+        return build_dataset_pipeline(
+                data, 
+                batch_size=self.batch_size if batch_size is None else batch_size, 
+                index=index, 
+                shuffle=shuffle, 
+                shuffle_buffer=self.data_shuffle_buffer, 
+                cache=cache, 
+                interleave=self.data_interleave, 
+                prefetch=self.data_prefetch,
+                augment=dihedral_augmentation(self.dof, two_neumann_channel=self.UseTwoNeumannChannel, 
+                    extra_labels=self._compute_extra_labels if extra_labels is not None else None, 
+                    material_channels=len(self.MaterialFields), 
+                    transpose=self.dh[0] == self.dh[1] and data[0].shape[1] == data[0].shape[2]) if augment else None,
+                extra_labels=extra_labels)
+
+    def _pipeline_cache_prefix(self, all_files, all_folders, settings, rank, data_key=''):
+        """ 
+        file name prefix <DataCache>-<sha1>-<rank> of the DataCache files, None for DataCache = none or memory
+
+        The sha1 covers the data files and the settings the cached samples depend on, so a rerun with other data, 
+        DataAugTimes, SplitSeed or batch size does not read the cache files of an earlier run.
+
+        args:
+            all_files (list): np-features*.npy files. The shards of all_folders are hashed instead if there are none.
+            settings (dict): settings of the loaded and split data, see dataset_cache_key()
+            data_key (str): sha1 of all_files and settings if already known, e.g. of the preprocessing cache
+        """
+        if self.data_cache in ['none', 'memory']:
+            return None
+        settings = dict(settings, VirtualDataAug=self.VirtualDataAug, DomainSize=self.domain_size, 
+                        PrecomputeMasks=self.PrecomputeMasks, PrecomputeNeumann=self.PrecomputeNeumann)
+        if data_key:
+            key = dataset_cache_key([], dict(settings, Data=data_key))
+        else:
+            if not all_files:
+                all_files = natsorted(sum([glob.glob(one + '/shards/np-features*.npy') for one in all_folders], []), alg=ns.IGNORECASE)
+            key = dataset_cache_key(all_files, settings)
+        return self.data_cache + '-' + key + '-' + str(rank)
+
+    def _compute_extra_labels(self, features):
+        """ 
+        channels of the labels after channel dof that only depend on the features: [packed BC masks (1, PrecomputeMasks), 
+        Neumann residual (dof, PrecomputeNeumann)]
+
+        args:
+            features (tensor): size of [None, :, :, 2*dof] or [None, :, :, 3*dof] ([None, :, :, :, 2*dof] or [None, :, :, :, 4*dof] in 3D)
+        """
+        extra_labels = []
+        if self.PrecomputeMasks:
+            masks = tf.numpy_function(lambda f: compute_bc_mask_channel(f, self.dof), [features], tf.float32)
+            masks.set_shape(features.shape[0:-1].concatenate([1]))
+            extra_labels.append(masks)
+        if self.PrecomputeNeumann:
+            extra_labels.append(self._neumann_residual(features))
+        return tf.concat(extra_labels, -1)
+
+    def _precompute_extra_labels(self, features, chunk_size=1024):
+        """ 
+        compute the extra label channels once for each unique sample, see _compute_extra_labels()
+
+        return:
+            numpy array [N, :, :, channels] or None if nothing is precomputed
+        """
+        if not (self.PrecomputeMasks or self.PrecomputeNeumann):
+            return None
+        t0 = time.time()
+        extra_labels = None
+        for i0 in range(0, len(features), chunk_size):
+            one_chunk = self._compute_extra_labels(tf.constant(np.asarray(features[i0:i0+chunk_size]), tf.float32)).numpy()
+            if extra_labels is None:
+                extra_labels = np.empty((len(features),) + one_chunk.shape[1:], dtype=np.float32)
+            extra_labels[i0:i0+len(one_chunk)] = one_chunk
+        print('precomputed extra labels (masks:', self.PrecomputeMasks, ', Neumann residual:', self.PrecomputeNeumann, '):', 
+              np.shape(extra_labels), 'in', '{:.2f} s'.format(time.time() - t0))
+        return extra_labels
+
+    def _split_extra_labels(self, y_true):
+        """ 
+        the precomputed BC masks and Neumann residual from the labels of a batch, or None if they are not precomputed 
+        """
+        i0 = self.dof
+        masks, neumann_residual = None, None
+        if self.PrecomputeMasks:
+            masks = y_true[...,i0:i0+1]
+            i0 += 1
+        if self.PrecomputeNeumann:
+            neumann_residual = y_true[...,i0:i0+self.dof]
+        return masks, neumann_residual
+
+    def _bc_channels(self):
+        """ 
+        number of BC channels of the features: [Dirichlet (dof), Neumann (dof)] or [Dirichlet (dof), t_x (dof), t_y (dof) 
+        (, t_z (dof))] (UseTwoNeumannChannel)
+        """
+        return (1 + self.dim) * self.dof if self.UseTwoNeumannChannel else 2 * self.dof
+
+    def _material_fields(self, features):
+        """ 
+        nodal material fields of the MaterialFields option: the feature channels after the BC channels, None if the 
+        material is homogeneous
+        """
+        if not self.MaterialFields:
+            return None
+        i0 = self._bc_channels()
+        return features[..., i0:i0+len(self.MaterialFields)]
+
+    def _neumann_residual(self, features):
+        """ 
+        Neumann residual, which only depends on the features and dh 
+        """
+        if self.dim == 3:
+            if self.UseTwoNeumannChannel :
+                return pde_layers.ComputeNeumannBoundaryResidualNodalDataNew3D(features, dh=self.dh, dof=self.dof)
+            else:
+                return pde_layers.ComputeNeumannBoundaryResidualNodalData3D(features, dh=self.dh, dof=self.dof)
+        if self.UseTwoNeumannChannel :
+            return pde_layers.ComputeNeumannBoundaryResidualNodalDataNew(features, dh=self.dh, dof=self.dof)
+        else:
+            return pde_layers.ComputeNeumannBoundaryResidualNodalData(features, dh=self.dh, dof=self.dof)
+
     def _bulk_residual(self):
         """
         Dummy _bulk_residual function. The actual residual should be implemented in each physical problem. 
@@ -307,25 +699,66 @@ class PDEWorkflowSteadyState:
         """
         raise ValueError('Residual is not implemented! Please implement it in the specific problem!')
 
+    def _get_constitutive_model(self, problem, default, **parameters):
+        """
+        constitutive model of the ConstitutiveModel and MaterialParameters options
+
+        args:
+            problem (str): diffusion, linear-elasticity or nonlinear-elasticity
+            default (str): model if ConstitutiveModel is not given
+            parameters: parameters of the physics class, e.g. E0=25, nu0=0.3, replaced by the MaterialParameters
+        return:
+            ConstitutiveModel
+        """
+        name = self.ConstitutiveModel if self.ConstitutiveModel else default
+        parameters.update(self.MaterialParameters)
+        model = get_constitutive_model(problem, name, **parameters)
+        model.CheckParameterNames(self.MaterialFields)
+        return model
+
+    def _get_bulk_residual_layer(self, build_layer):
+        """
+        Bulk residual layer built once per workflow and reused by all loss calls. It is rebuilt only if dh or the 
+        LinearStencil option changes, e.g. for test data with a different resolution.
+
+        args:
+            build_layer (function): () -> Layer*BulkResidual
+        """
+        key = (self.dh, self.LinearStencil)
+        if self.bulk_residual_layer is None or self.bulk_residual_layer_key != key:
+            # constants of the layer are created eagerly, so that all traced loss functions can capture them
+            with tf.init_scope():
+                self.bulk_residual_layer = build_layer()
+            self.bulk_residual_layer_key = key
+        return self.bulk_residual_layer
 
-    def _compute_residual(self, features, y_pred, only_y_pred=False):
+
+    def _compute_residual(self, features, y_pred, only_y_pred=False, masks=None, neumann_residual=None):
         """
         Compute different residuals, and apply the Dirichlet BCs to the NN predicted solutions.
 
         args:
-            features (tensor): size of [None, :, :, 2*dof]
+            features (tensor): size of [None, :, :, 2*dof] (or [None, :, :, :, 2*dof] for the 3D problems, self.dim = 3), 
+                               followed by the channels of the MaterialFields
             y_pred (tensor): size of [None, :, :, dof]
+            masks (tensor): size of [None, :, :, 1], BC masks precomputed by compute_bc_mask_channel() (PrecomputeMasks). 
+                            Default: computed from the features.
+            neumann_residual (tensor): size of [None, :, :, dof], Neumann residual precomputed by _precompute_extra_labels() 
+                                       (PrecomputeNeumann). Default: computed from the features.
 
         return:
             - different residuals and the y_pred with applied Dirichlet BCs.
         """
 
         # mask contains the region not on the Dirichlet boundary
-        bc_mask_dirichlet = pde_layers.ComputeBoundaryMaskNodalData(features, dof=self.dof, opt=1)
+        if masks is not None:
+            bc_mask_dirichlet, bc_mask_neumann, elem_residual_mask = pde_layers.UnpackBoundaryMaskNodalData(masks, dof=self.dof)
+        else:
+            bc_mask_dirichlet = pde_layers.ComputeBoundaryMaskNodalData(features, dof=self.dof, opt=1)
         reverse_bc_mask_dirichlet = tf.where( bc_mask_dirichlet == 0, tf.fill(tf.shape(bc_mask_dirichlet), 1.0), tf.fill(tf.shape(bc_mask_dirichlet), 0.0))
 
         # apply the Dirichlet BCs to y_pred
-        input_dirichlet = features[:,:,:,0:self.dof]
+        input_dirichlet = features[...,0:self.dof]
         dirichlet_bc = tf.multiply(input_dirichlet, reverse_bc_mask_dirichlet)
         # print(y_pred.dtype, bc_mask_dirichlet.dtype, input_dirichlet.dtype)
         y_pred = tf.multiply(y_pred, bc_mask_dirichlet)
@@ -334,18 +767,23 @@ class PDEWorkflowSteadyState:
         if only_y_pred:
             return y_pred
 
-        bc_mask_neumann = pde_layers.ComputeBoundaryMaskNodalData(features, dof=self.dof, opt=2)
+        if masks is None:
+            bc_mask_neumann = pde_layers.ComputeBoundaryMaskNodalData(features, dof=self.dof, opt=2)
         reverse_bc_mask_neumann = tf.where( bc_mask_neumann == 0, tf.fill(tf.shape(bc_mask_neumann), 1.0), tf.fill(tf.shape(bc_mask_neumann), 0.0))
 
-        if self.UseTwoNeumannChannel :
-            neumann_residual = pde_layers.ComputeNeumannBoundaryResidualNodalDataNew(features, dh=self.dh, dof=self.dof)
-        else:
-            neumann_residual = pde_layers.ComputeNeumannBoundaryResidualNodalData(features, dh=self.dh, dof=self.dof)
+        if neumann_residual is None:
+            neumann_residual = self._neumann_residual(features)
 
         y_true_dummy = pde_layers.LayerFillRandomNumber()(input_dirichlet)
-        elem_bulk_residual=self._bulk_residual(y_pred)
-        elem_residual_mask = pde_layers.GetElementResidualMask(y_true_dummy)
-        R = pde_layers.GetNodalInfoFromElementInfo(elem_bulk_residual, elem_residual_mask, dof=self.dof)
+        elem_bulk_residual=self._bulk_residual(y_pred, self._material_fields(features))
+        if self.dim == 3:
+            if masks is None:
+                elem_residual_mask = pde_layers.GetElementResidualMask3D(y_true_dummy)
+            R = pde_layers.GetNodalInfoFromElementInfo3D(elem_bulk_residual, elem_residual_mask, dof=self.dof)
+        else:
+            if masks is None:
+                elem_residual_mask = pde_layers.GetElementResidualMask(y_true_dummy)
+            R = pde_layers.GetNodalInfoFromElementInfo(elem_bulk_residual, elem_residual_mask, dof=self.dof)
         R_fix = tf.where(dirichlet_bc==0.5, R, 0.0)
 
         # get only neumann part
@@ -369,14 +807,15 @@ class PDEWorkflowSteadyState:
         def loss(y_true, y_pred):
 
             if self.UseTwoNeumannChannel :
-                inputs = y_pred[:,:,:,self.dof:4*self.dof] # new Neumann Channel
+                inputs = y_pred[...,self.dof:(2+self.dim)*self.dof+len(self.MaterialFields)] # new Neumann Channel (+ material fields)
             else:
-                inputs = y_pred[:,:,:,self.dof:3*self.dof] # old Neumann Channel
-            y_pred = y_pred[:,:,:,0:self.dof]
+                inputs = y_pred[...,self.dof:3*self.dof+len(self.MaterialFields)] # old Neumann Channel (+ material fields)
+            y_pred = y_pred[...,0:self.dof]
             dist = tfp.distributions.Normal(loc=tf.zeros_like(y_pred), scale=self.Sigma1)
             y_noise = tf.squeeze(dist.sample(1), [0]) # only sample 1, thus, lead dimension can be squeezed. 
             y_pred = y_pred + y_noise
-            R_red, y_pred, y_true_dummy, _, _, _ = self._compute_residual(inputs, y_pred)
+            masks, neumann_residual = self._split_extra_labels(y_true)
+            R_red, y_pred, y_true_dummy, _, _, _ = self._compute_residual(inputs, y_pred, masks=masks, neumann_residual=neumann_residual)
             dist = tfp.distributions.Normal(loc=tf.zeros_like(y_true_dummy), scale=self.model.Sigma2)
             return self.BetaMSELoss * tf.reduce_mean(tf.square(tf.where(y_true_dummy > -0.9, tf.random.normal(tf.shape(y_true_dummy), 0.5, 0.05, tf.float32, seed=1), tf.zeros_like(y_true_dummy)) - tf.where(y_true_dummy > -0.9, y_pred, tf.zeros_like(y_pred)))) + self.BetaPDELoss * tf.keras.backend.sum(tf.reduce_mean(-dist.log_prob(R_red), 0))
         return loss
@@ -387,12 +826,13 @@ class PDEWorkflowSteadyState:
         """
         def loss(y_true, y_pred):
             if self.UseTwoNeumannChannel :
-                inputs = y_pred[:,:,:,self.dof:4*self.dof] # new Neumann Channel
+                inputs = y_pred[...,self.dof:(2+self.dim)*self.dof+len(self.MaterialFields)] # new Neumann Channel (+ material fields)
             else:
-                inputs = y_pred[:,:,:,self.dof:3*self.dof] # old Neumann Channel
-            y_pred = y_pred[:,:,:,0:self.dof]
-            R_red, y_pred, y_true_dummy, _, _, _ = self._compute_residual(inputs, y_pred)
-            return self.BetaMSELoss * tf.reduce_mean(tf.square(tf.where(y_true_dummy > -0.9, tf.random.normal(tf.shape(y_true_dummy), 0.5, 0.05, tf.float32, seed=1), tf.zeros_like(y_true_dummy)) - tf.where(y_true_dummy > -0.9, y_pred, tf.zeros_like(y_pred)))) + self.BetaPDELoss * tf.reduce_mean(tf.reduce_sum(tf.square(R_red), axis=[1,2,3]))
+                inputs = y_pred[...,self.dof:3*self.dof+len(self.MaterialFields)] # old Neumann Channel (+ material fields)
+            y_pred = y_pred[...,0:self.dof]
+            masks, neumann_residual = self._split_extra_labels(y_true)
+            R_red, y_pred, y_true_dummy, _, _, _ = self._compute_residual(inputs, y_pred, masks=masks, neumann_residual=neumann_residual)
+            return self.BetaMSELoss * tf.reduce_mean(tf.square(tf.where(y_true_dummy > -0.9, tf.random.normal(tf.shape(y_true_dummy), 0.5, 0.05, tf.float32, seed=1), tf.zeros_like(y_true_dummy)) - tf.where(y_true_dummy > -0.9, y_pred, tf.zeros_like(y_pred)))) + self.BetaPDELoss * tf.reduce_mean(tf.reduce_sum(tf.square(R_red), axis=list(range(1, self.dim + 2))))
         return loss
 
     def _build_loss(self):
@@ -623,7 +1063,7 @@ class PDEWorkflowSteadyState:
         self.var_sigma2 = []
 
         # print model information
-        input_shape=(None, np.shape(self.features)[1], np.shape(self.features)[2], np.shape(self.features)[3])
+        input_shape=(None,) + tuple(np.shape(self.features)[1:])
         self.model.build(input_shape) # `input_shape` is the shape of the input data
         self.model.summary()
 
@@ -674,7 +1114,7 @@ class PDEWorkflowSteadyState:
             # print('epoch:', epoch)
             epoch_loss = []
             # for step, (batch_x, batch_y) in enumerate(self.train_seq):
-            for (batch_x, batch_y)  in self.train_seq.prefetch(self.batch_size*2):
+            for (batch_x, batch_y)  in self.train_seq: # prefetch is part of the input pipeline
                 batch_loss = self.model.train_on_batch(batch_x, batch_y)
                 epoch_loss.append(batch_loss)
                 # print("...training...", batch_loss)
@@ -801,59 +1241,47 @@ class PDEWorkflowSteadyState:
         self.var_sigma2 = []
 
         # print model information
-        input_shape=(None, np.shape(self.features)[1], np.shape(self.features)[2], np.shape(self.features)[3])
+        input_shape=(None,) + tuple(np.shape(self.features)[1:])
         self.model.build(input_shape) # `input_shape` is the shape of the input data
         self.model.summary()
 
-        self.call_backs = [hvd.callbacks.BroadcastGlobalVariablesCallback(0),]
+        self.call_backs = [hvd.callbacks.BroadcastGlobalVariablesCallback(0),] if with_horovod else []
+
+        # batches are gathered and reshuffled at each epoch by the train_seq input pipeline
+        fit_data = {'x': self.train_seq}
 
         self.BetaMSELoss.assign(float(1.0))
         self.BetaPDELoss.assign(float(0.0))
 
         self.model.fit(
-                x=self.train_dataset,
-                y=self.train_label,
+                **fit_data,
                 callbacks = self.call_backs,
-                batch_size=self.batch_size,
                 epochs=self.InitialEpoch,   # // hvd.size()
                 verbose='auto',
                 )
-        train_loss = self.model.evaluate(
-                x=self.train_dataset,
-                y=self.train_label,
-                batch_size=self.batch_size)
+        train_loss = self.model.evaluate(**fit_data)
 
         print('train_loss (before PDE): ', train_loss)
         self.BetaMSELoss.assign(float(0.0))
         self.BetaPDELoss.assign(float(1.0))
 
         self.model.fit(
-                x=self.train_dataset,
-                y=self.train_label,
+                **fit_data,
                 callbacks = self.call_backs,
-                batch_size=self.batch_size,
                 epochs=1,   # // hvd.size()
                 verbose='auto',
                 )
-        train_loss = self.model.evaluate(
-                x=self.train_dataset,
-                y=self.train_label,
-                batch_size=self.batch_size)
+        train_loss = self.model.evaluate(**fit_data)
         print('train_loss (PDE start): ', train_loss)
 
         self.model.fit(
-                x=self.train_dataset,
-                y=self.train_label,
+                **fit_data,
                 callbacks = self.call_backs,
-                batch_size=self.batch_size,
                 epochs=self.epochs-self.InitialEpoch-1,   # // hvd.size()
                 verbose='auto',
                 )
 
-        train_loss = self.model.evaluate(
-                x=self.train_dataset,
-                y=self.train_label,
-                batch_size=self.batch_size)
+        train_loss = self.model.evaluate(**fit_data)
         print('train_loss (after PDE): ', train_loss)
 
         # time_elapsed_list = []
@@ -921,10 +1349,10 @@ class PDEWorkflowSteadyState:
             # exit(0)
 
             if self.UseTwoNeumannChannel :
-                inputs = y_pred[:,:,:,self.dof:4*self.dof] # New Neumann Channel
+                inputs = y_pred[...,self.dof:(2+self.dim)*self.dof+len(self.MaterialFields)] # New Neumann Channel (+ material fields)
             else:
-                inputs = y_pred[:,:,:,self.dof:3*self.dof] # Old Neumann Channel
-            y_pred = y_pred[:,:,:,0:self.dof]
+                inputs = y_pred[...,self.dof:3*self.dof+len(self.MaterialFields)] # Old Neumann Channel (+ material fields)
+            y_pred = y_pred[...,0:self.dof]
             if output_reaction_force:
                 _, y_pred, _, _, _, R_fix = self._compute_residual(inputs, y_pred)
                 reaction_force.append(R_fix)
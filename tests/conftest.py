@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the layers are tf.keras 2 layers (tf_keras with TensorFlow >= 2.16)
+os.environ.setdefault('TF_USE_LEGACY_KERAS', '1')
+# the modules are imported from src/ as in the examples (sys.path.append('../'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
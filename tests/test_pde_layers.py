@@ -0,0 +1,142 @@
+"""
+Checks of the vectorized kernels of pde_layers.py and of the constitutive models on tiny inputs, against dense float64
+references (see pde_benchmark.py for the same checks at the benchmark sizes):
+
+    python -m pytest -q tests
+"""
+import numpy as np
+import pytest
+import tensorflow as tf
+
+import pde_layers as pde_layers
+from pde_benchmark import IntTranBxGraduReference, NeumannResidualReference, NodalAssemblyReference, random_bc_features
+from pde_constitutive_models import CONSTITUTIVE_MODELS, get_constitutive_model
+from pde_system_diffusion_steady_state import LayerDiffusionSteadyStateBulkResidual
+from pde_system_elasticity_linear import LayerLinearElasticityBulkResidual
+from pde_system_elasticity_nonlinear import LayerNonLinearElasticityBulkResidual
+
+
+def bulk_residual_kernels(dof, dh=0.25, GPs=4):
+    """ LayerBulkResidual with the GP tables of dof, dh and GPs """
+    layer = pde_layers.LayerBulkResidual()
+    layer.dh, layer.dof, layer.GPs = dh, dof, GPs
+    layer.initialize_arrays()
+    return layer
+
+
+def smooth_displacement(batch, size, dof):
+    """ small smooth deformation around the scaled zero (0.5), so that detF stays in the valid range """
+    x = np.linspace(0.0, 1.0, size)
+    u = 0.5 + 0.02 * np.sin(np.pi * x)[None, :, None, None] * np.cos(np.pi * x)[None, None, :, None] * np.ones([batch, 1, 1, dof])
+    return tf.constant(u + 0.001 * np.random.default_rng(0).random([batch, size, size, dof]), tf.float32)
+
+
+def assert_relative_close(R, R_ref, rtol):
+    assert np.abs(np.asarray(R) - R_ref).max() <= rtol * np.abs(R_ref).max()
+
+
+@pytest.mark.parametrize('dof', [1, 2, 3])
+def test_element_gather(dof):
+    # element (i, j) gets the nodes (i, j), (i, j+1), (i+1, j), (i+1, j+1), zero outside of the node grid
+    u = np.random.default_rng(0).random([2, 5, 4, dof]).astype(np.float32)
+    u_pad = np.pad(u, [[0, 0], [0, 1], [0, 1], [0, 0]])
+    data_ref = np.concatenate([u_pad[:, r:r+5, c:c+4] for r, c in [(0, 0), (0, 1), (1, 0), (1, 1)]], axis=-1)
+    data = bulk_residual_kernels(dof).GetElementInfo(tf.constant(u)).numpy()
+    np.testing.assert_array_equal(data, data_ref)
+
+
+@pytest.mark.parametrize('dof', [1, 2])
+@pytest.mark.parametrize('GPs', [1, 4, 9])
+def test_gauss_points(dof, GPs):
+    dh = (0.25, 0.5)
+    layer = bulk_residual_kernels(dof, dh=dh, GPs=GPs)
+    data = np.random.default_rng(0).uniform(-1.0, 1.0, [2, 3, 4, 4*dof]).astype(np.float32)
+    gradu = layer.ComputeGraduAtAllGPs(tf.constant(data))
+    assert gradu.shape == (2 * 3 * 4, GPs, 2*dof)
+    R = layer.ComputeIntTranBxPAtAllGPs(gradu, [3, 4]).numpy()
+    assert_relative_close(R, IntTranBxGraduReference(data, dh, dof, GPs=GPs), 1.0e-6)
+
+
+@pytest.mark.parametrize('GPs', [4, 9])
+def test_gauss_rule_laplace_element_matrix(GPs):
+    # the 2x2 and 3x3 rules integrate the element matrix of the Laplacian of a square element exactly, nodes n1 (top left),
+    # n2 (top right), n3 (bottom left), n4 (bottom right)
+    K_ref = np.array([[4, -1, -1, -2], [-1, 4, -2, -1], [-1, -2, 4, -1], [-2, -1, -1, 4]]) / 6.0
+    layer = bulk_residual_kernels(1, dh=0.1, GPs=GPs)
+    data = tf.constant(np.eye(4).reshape(4, 1, 1, 4), tf.float32)
+    K = layer.ComputeIntTranBxPAtAllGPs(layer.ComputeGraduAtAllGPs(data), [1, 1]).numpy().reshape(4, 4)
+    np.testing.assert_allclose(K, K_ref, atol=1.0e-6)
+
+
+@pytest.mark.parametrize('kernel, dof, neumann_channels',
+                         [('one channel', 1, 1), ('one channel', 2, 2), ('one channel', 3, 3), ('one channel', 4, 4), ('two channels', 1, 2), ('two channels', 2, 4)])
+def test_neumann(kernel, dof, neumann_channels):
+    dh = (0.2, 0.1)
+    features = random_bc_features(2, 7, dof, neumann_channels)
+    if kernel == 'one channel':
+        R = pde_layers.ComputeNeumannBoundaryResidualNodalData(features, dh=dh, dof=dof)
+    else:
+        R = pde_layers.ComputeNeumannBoundaryResidualNodalDataNew(features, dh=dh, dof=dof)
+    assert_relative_close(R, NeumannResidualReference(features.numpy(), dh, dof, two_channels=(kernel == 'two channels')), 1.0e-6)
+
+
+@pytest.mark.parametrize('dof', [1, 2, 3])
+def test_assembly(dof):
+    features = random_bc_features(2, 6, dof, dof)
+    mask = pde_layers.GetElementResidualMask(pde_layers.LayerFillRandomNumber()(features[:,:,:,0:dof]))
+    data = tf.random.uniform([2, 6, 6, 4*dof], minval=-1.0, maxval=1.0, seed=1)
+    R = pde_layers.GetNodalInfoFromElementInfo(data, mask, dof=dof).numpy()
+    np.testing.assert_allclose(R, NodalAssemblyReference(data.numpy(), mask.numpy(), dof), atol=1.0e-6)
+
+
+@pytest.mark.parametrize('problem, dof', [('diffusion', 1), ('linear elasticity', 2)])
+def test_stencil_vs_element(problem, dof):
+    dh = (0.2, 0.1)
+    if problem == 'diffusion':
+        element_layer, stencil_layer = [LayerDiffusionSteadyStateBulkResidual(dh=dh, D0=1.0, stencil=s) for s in [False, True]]
+    else:
+        element_layer, stencil_layer = [LayerLinearElasticityBulkResidual(dh=dh, E0=25, nu0=0.3, stencil=s) for s in [False, True]]
+    features = random_bc_features(2, 6, dof, dof)
+    mask = pde_layers.GetElementResidualMask(pde_layers.LayerFillRandomNumber()(features[:,:,:,0:dof]))
+    u = tf.random.uniform([2, 6, 6, dof], seed=1)
+    R_element = pde_layers.GetNodalInfoFromElementInfo(element_layer(u), mask, dof=dof).numpy()
+    R_stencil = pde_layers.GetNodalInfoFromElementInfo(stencil_layer(u), mask, dof=dof).numpy()
+    assert_relative_close(R_stencil, R_element, 1.0e-5)
+
+
+@pytest.mark.parametrize('n', [2, 3])
+def test_small_matrix_closed_form(n):
+    kernels = pde_layers.LayerBulkResidual()
+    A = np.eye(n) + 0.3 * np.random.default_rng(0).uniform(-1.0, 1.0, [2, 3, 4, n, n])
+    inv = np.linalg.inv(A)
+    np.testing.assert_allclose(kernels.SmallMatrixDet(tf.constant(A)).numpy(), np.linalg.det(A), rtol=1.0e-12)
+    np.testing.assert_allclose(kernels.SmallMatrixInv(tf.constant(A)).numpy(), inv, rtol=1.0e-10, atol=1.0e-12)
+    np.testing.assert_allclose(kernels.SmallMatrixInvTranspose(tf.constant(A)).numpy(), np.swapaxes(inv, -1, -2), rtol=1.0e-10, atol=1.0e-12)
+    np.testing.assert_allclose(kernels.SmallMatrixTrace(tf.constant(A)).numpy(), np.trace(A, axis1=-2, axis2=-1), rtol=1.0e-12)
+
+
+@pytest.mark.parametrize('name', sorted([n for (p, n), c in CONSTITUTIVE_MODELS.items() if p == 'nonlinear-elasticity' and 'AnalyticStress' in c.__dict__]))
+@pytest.mark.parametrize('jit_compile', [False, True])
+def test_strain_energy_autodiff(name, jit_compile):
+    layer = LayerNonLinearElasticityBulkResidual(dh=0.1, GPs=4)
+    F = tf.constant(np.eye(2) + 0.1 * np.random.default_rng(0).uniform(-1.0, 1.0, [2, 3, 3, 4, 2, 2]), tf.float64)
+    J = layer.SmallMatrixDet(F)
+    P_ref = get_constitutive_model('nonlinear-elasticity', name).Stress(layer, F, J).numpy()
+    P = get_constitutive_model('nonlinear-elasticity', name, autodiff=True, jit_compile=jit_compile).Stress(layer, F, J).numpy()
+    assert_relative_close(P, P_ref, 1.0e-10)
+
+
+@pytest.mark.parametrize('problem, name, dof, layer_class',
+                         [('diffusion', 'linear', 1, LayerDiffusionSteadyStateBulkResidual),
+                          ('linear-elasticity', 'isotropic', 2, LayerLinearElasticityBulkResidual),
+                          ('nonlinear-elasticity', 'neo-hookean', 2, LayerNonLinearElasticityBulkResidual)])
+def test_constant_material_fields(problem, name, dof, layer_class):
+    batch, size = 2, 6
+    model = get_constitutive_model(problem, name)
+    names = list(model.parameters.keys())
+    u = smooth_displacement(batch, size, dof)
+    constant = tf.constant(np.stack([np.full([batch, size, size], model.p[k]) for k in names], -1), tf.float32)
+    # away from the ghost elements of the SAME padding, which see the zero padded fields
+    R0 = layer_class(dh=0.2, GPs=4, model=model)(u).numpy()[:, 0:-1, 0:-1]
+    R1 = layer_class(dh=0.2, GPs=4, model=model, material_fields=names)(u, fields=constant).numpy()[:, 0:-1, 0:-1]
+    assert_relative_close(R1, R0, 1.0e-5)